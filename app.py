@@ -1,35 +1,711 @@
-from flask import Flask, render_template, request, jsonify, abort, send_from_directory
+from flask import Blueprint, Flask, Request, Response, current_app, render_template, request, jsonify, abort, send_from_directory, g, has_app_context, has_request_context, make_response, stream_with_context
+import click
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
 import sqlite3
-import requests
 import os
-from datetime import datetime
-from functools import lru_cache
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import date, datetime, timedelta
 import re
 import base64
+import calendar
+import csv
+import hashlib
+import html
+import io
+import itertools
+import json
+import math
 import uuid
 
-app = Flask(__name__)
-app.config['JSON_AS_ASCII'] = False
-app.config['MAX_CONTENT_LENGTH'] = 1 * 1024 * 1024  # 1MB max request size
-DB_NAME = "inventory.db"
-UPLOADS_DIR = 'static/uploads'
+try:
+    from PIL import Image  # Optional: enables thumbnail generation
+except ImportError:
+    Image = None
 
-# Ensure uploads directory exists
-if not os.path.exists(UPLOADS_DIR):
-    os.makedirs(UPLOADS_DIR)
+class InventoryRequest(Request):
+    """Request class allowing larger bodies on bulk endpoints."""
+
+    # Endpoint -> config key holding its body size limit
+    BODY_LIMITS = {
+        'inventory.batch_operations': 'BATCH_MAX_CONTENT_LENGTH',
+        'inventory.upload_image': 'IMAGE_MAX_CONTENT_LENGTH',
+        'inventory.import_products': 'IMPORT_MAX_CONTENT_LENGTH'
+    }
+
+    @property
+    def max_content_length(self):
+        key = self.BODY_LIMITS.get(self.endpoint)
+        if key is not None:
+            return current_app.config[key]
+        return super().max_content_length
+
+
+class DefaultConfig:
+    """Defaults for create_app(); each key can be overridden by an INVENTORY_<KEY> environment variable."""
+
+    DATABASE = 'inventory.db'  # SQLite file, relative to the working directory at startup
+    UPLOADS_DIR = 'static/uploads'  # Uploaded images and their thumbnails, served under /static/uploads/
+    TENANCY = False  # One SQLite file per household, chosen by TENANT_HEADER or the 'household' cookie
+    TENANT_HEADER = 'X-Household'  # Request header naming the household (a-z, 0-9, '-' and '_')
+    TENANT_DIR = 'households'  # Household databases <TENANT_DIR>/<id>.db, created and migrated on first use
+    TENANT_POOL_SIZE = 4  # Connections per household and worker process
+    TENANT_CACHE_SIZE = 64  # Household pools kept open per worker; the least recently used is closed
+    SHARED_DATABASE = 'shared.db'  # With TENANCY: data of all households (the Open Food Facts cache)
+    WRITE_QUEUE = False  # Run write routes on one writer thread per database and worker that group-commits them
+    WRITE_QUEUE_BATCH = 64  # Writes committed together in one transaction at most
+    WRITE_QUEUE_TIMEOUT = 10  # Seconds a request waits for its write before answering 503
+    PAYLOAD_CACHE_BYTES = 64 * 1024 * 1024  # Serialized product listings kept per worker, keyed by ETag (0 = off)
+    JSON_AS_ASCII = False
+    MAX_CONTENT_LENGTH = 1 * 1024 * 1024  # 1MB max request size
+    BATCH_MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # Bulk product operations
+    IMAGE_MAX_CONTENT_LENGTH = 8 * 1024 * 1024  # Direct image uploads
+    IMPORT_MAX_CONTENT_LENGTH = 1024 * 1024 * 1024  # CSV / JSON lines imports
+    THUMBNAIL_SIZE = 160  # Max edge length of list-view thumbnails in pixels
+    DB_POOL_SIZE = 8  # Connections per worker process
+    DB_POOL_TIMEOUT = 10  # Seconds to wait for a free connection
+    DB_MMAP_SIZE = 64 * 1024 * 1024  # 64MB memory-mapped I/O
+    DB_CACHE_SIZE = -16000  # Negative = KiB, i.e. ~16MB page cache
+    OFF_CACHE_SIZE = 2048  # Products kept in the in-process LRU
+    OFF_CACHE_TTL = 7 * 24 * 3600  # Seconds a found product stays fresh
+    OFF_NEGATIVE_CACHE_TTL = 24 * 3600  # Seconds a "not found" stays fresh
+    OFF_BASE_URL = 'https://world.openfoodfacts.org'
+    OFF_CONNECT_TIMEOUT = 3.05  # Seconds to establish the TCP/TLS connection
+    OFF_READ_TIMEOUT = 5  # Seconds to wait for the response
+    OFF_RETRIES = 2  # Extra attempts on connection errors and 5xx/429
+    OFF_RETRY_BACKOFF = 0.25  # Base delay in seconds, doubled per attempt with jitter
+    OFF_POOL_SIZE = 10  # Keep-alive connections to the upstream
+    OFF_BREAKER_WINDOW = 20  # Recent calls considered by the circuit breaker
+    OFF_BREAKER_MIN_CALLS = 5  # Calls needed before the breaker may open
+    OFF_BREAKER_THRESHOLD = 0.5  # Failure ratio that opens the breaker
+    OFF_BREAKER_RESET = 30  # Seconds before a trial call is let through
+    SCAN_BATCH_MAX = 200  # EANs accepted per batch scan request
+    SCAN_BATCH_WORKERS = 8  # Concurrent upstream lookups per worker process
+    ASGI_DB_THREADS = 4  # asgi.py: threads running the SQLite work of the async scan routes
+    ASGI_WSGI_THREADS = 8  # asgi.py: threads serving all other (Flask) routes
+    ASGI_OFF_MAX_CONNECTIONS = 100  # asgi.py: concurrent upstream requests per worker process
+    CHANGES_MAX_LIMIT = 5000  # Max change log entries per /api/changes page
+    CHANGE_LOG_RETENTION_DAYS = 30  # Tombstones older than this are compacted away
+    EVENTS_POLL_INTERVAL = 0.5  # Seconds between PRAGMA data_version checks while clients listen
+    EVENTS_HEARTBEAT = 15  # Seconds of silence before a keep-alive comment is sent
+    EVENTS_MAX_DURATION = 300  # Streams end after this many seconds; browsers reconnect and resume
+    EVENTS_MAX_CLIENTS = 4  # Event streams held open per worker; keep it below gunicorn --threads
+    EVENTS_SHORT_POLL_RETRY = 15  # Seconds before clients without a stream (sync workers, over the limit) poll again
+    ASGI_EVENTS_MAX_CLIENTS = 500  # asgi.py: event streams per worker process (coroutines, no thread each)
+    EXPIRY_SCHEDULER = True  # Refresh expiry_buckets in a background thread per worker
+    EXPIRY_CHECK_INTERVAL = 60  # Seconds between freshness checks of expiry_buckets
+    DAILY_MAINTENANCE = True  # Expiry scheduler also compacts the change log and runs gc-images once a day
+    AUTO_SHOPPING_LIST = False  # Put newly expired products on the shopping list automatically
+    LOW_STOCK_THRESHOLD = 1  # Total quantity per product name at or below which it counts as low stock
+    LOW_STOCK_THRESHOLDS = {}  # Per-category overrides, e.g. {'Getränke': 6}
+    AUTO_MIGRATE = False  # Apply pending migrations on the first request (startup() already migrates wsgi.py deployments)
+    METRICS_ENABLED = True  # Time requests, queries and upstream calls for /metrics and Server-Timing
+    SLOW_QUERY_MS = 100  # Queries slower than this are kept in /api/system/slow-queries
+    EXPORT_FETCH_SIZE = 1000  # Rows fetched and written per step of a streaming export
+    IMPORT_CHUNK_SIZE = 5000  # Rows committed per transaction during an import
+    IMPORT_MAX_ERRORS = 100  # Rejected rows reported individually in the import response
+
+
+bp = Blueprint('inventory', __name__, cli_group=None)
+
+
+class InventoryState:
+    """Resources of one app in this process; each is created on first use and again after a fork."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pool = None
+        self.tenant_lock = threading.Lock()
+        self.tenant_pools = OrderedDict()  # Household -> pool, least recently used first
+        self.tenant_pid = os.getpid()
+        self.thumbnail_worker = None
+        self.off_client = None
+        self.scan_executor = None
+        self.off_cache = None
+        self.broadcasters = {}  # Database path -> ChangeBroadcaster
+        self.expiry_scheduler = None
+        self.payload_cache = None
+        self.schema_ready = False
+
+def app_state():
+    return current_app.extensions['inventory']
+
+# --- Instrumentation ---
+
+# Upper bounds in seconds, Prometheus style
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Histogram:
+    """Thread-safe cumulative histogram keyed by label values."""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, (counts, total, value_sum) in series:
+            labels = ','.join(f'{k}="{_label_value(v)}"' for k, v in zip(self.labels, label_values))
+            prefix = f'{labels},' if labels else ''
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {total}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {value_sum:.6f}')
+            lines.append(f'{self.name}_count{suffix} {total}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram('inventory_request_duration_seconds', 'Request latency by route.',
+                            ('endpoint', 'method', 'status'))
+QUERY_LATENCY = Histogram('inventory_db_query_duration_seconds', 'SQLite statement execution time by route.',
+                          ('endpoint',))
+UPSTREAM_LATENCY = Histogram('inventory_off_request_duration_seconds', 'Open Food Facts lookups by outcome.',
+                             ('outcome',), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+_slow_queries = deque(maxlen=50)
+
+def current_endpoint():
+    return request.url_rule.rule if request and request.url_rule else 'unmatched'
+
+def record_timing(name, duration):
+    """Add a duration to the current request's Server-Timing entry (no-op outside requests)."""
+    if has_app_context() and 'timings' in g:
+        count, total = g.timings.get(name, (0, 0.0))
+        g.timings[name] = (count + 1, total + duration)
+
+def record_query(sql, duration):
+    if not has_app_context() or 'timings' not in g:
+        return
+    record_timing('db', duration)
+    QUERY_LATENCY.observe(duration, current_endpoint())
+    if duration * 1000 >= current_app.config['SLOW_QUERY_MS']:
+        _slow_queries.append({
+            'endpoint': current_endpoint(),
+            'duration_ms': round(duration * 1000, 2),
+            'sql': ' '.join(sql.split())[:500],
+            'at': datetime.now().isoformat(timespec='seconds')
+        })
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor recording how long each statement takes to execute."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (including the execute shortcuts) are timed."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+@bp.before_app_request
+def start_request_timer():
+    if current_app.config['METRICS_ENABLED']:
+        g.request_started = time.perf_counter()
+        g.timings = {}
+
+@bp.after_app_request
+def finish_request_timer(response):
+    """Observe the request latency and report the breakdown as Server-Timing."""
+    if 'request_started' not in g:
+        return response
+    duration = time.perf_counter() - g.request_started
+    REQUEST_LATENCY.observe(duration, current_endpoint(), request.method, response.status_code)
+    entries = [f'{name};dur={total * 1000:.2f};desc="{count}x"' for name, (count, total) in g.timings.items()]
+    entries.append(f'app;dur={duration * 1000:.2f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    return response
 
 # --- Database Helper Functions ---
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    try:
-        conn = sqlite3.connect(DB_NAME, timeout=10)
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time."""
+
+
+class ConnectionPool:
+    """Per-process pool of SQLite connections running in WAL mode."""
+
+    def __init__(self, database, size=8, timeout=10, mmap_size=0, cache_size=-2000):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.mmap_size = int(mmap_size)
+        self.cache_size = int(cache_size)
+        self.pid = os.getpid()
+        self.closed = False
+        self.writer = None  # WriteQueue, started by get_write_queue()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False,
+                               factory=TimedConnection)
         conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {self.mmap_size}')
+        conn.execute(f'PRAGMA cache_size = {self.cache_size}')
         conn.execute('PRAGMA foreign_keys = ON')
         return conn
-    except sqlite3.Error as e:
-        print(f"Database connection error: {e}")
+
+    def acquire(self):
+        """Check out a connection, opening a new one while below the pool size."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._open < self.size
+                if can_open:
+                    self._open += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                with self._lock:
+                    self._waits += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f"No database connection free after {self.timeout}s")
+                finally:
+                    with self._lock:
+                        self._wait_time += time.perf_counter() - started
+
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction."""
+        with self._lock:
+            self._in_use -= 1
+        if self.closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            print(f"Discarding broken database connection: {e}")
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+
+    def close(self):
+        """Close the pool for good: idle connections now, checked-out ones on release."""
+        self.closed = True
+        if self.writer is not None:
+            self.writer.stop()
+        self.close_all()
+
+    def close_all(self):
+        """Close all idle connections (checked-out ones are closed on release)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_ms': round(self._wait_time * 1000, 2),
+                'timeouts': self._timeouts
+            }
+
+
+class WriteQueue:
+    """Single writer thread for one database that group-commits queued writes.
+
+    submit(func, *args) queues func(conn, *args) and returns a Future. The
+    writer takes up to max_batch queued writes, runs each in a SAVEPOINT of
+    one BEGIN IMMEDIATE transaction and commits once. A write that raises is
+    rolled back to its savepoint alone. Futures resolve after the commit, so
+    a result is never reported before it is durable. Writes must not commit
+    themselves and must only use the connection they are given. If the
+    writer cannot open its connection, queued writes fail with that error
+    and get_write_queue() starts a new writer for the next one.
+    """
+
+    def __init__(self, pool, app, max_batch=64):
+        self.pool = pool
+        self.app = app
+        self.max_batch = max_batch
+        self.pid = os.getpid()
+        self.stopped = False
+        self.error = None  # Why the writer could not start
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._commits = 0
+        self._writes = 0
+        self._failed = 0
+        self._largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        if self.stopped:
+            raise PoolTimeout("Database was closed")
+        future = Future()
+        self._queue.put((future, func, args))
+        if self.error is not None:
+            # The writer died between the check above and the put
+            self._fail_queued(self.error)
+        return future
+
+    def stop(self):
+        """Let the writer finish the queued writes and exit."""
+        self.stopped = True
+        self._queue.put(None)
+
+    def _fail_queued(self, error):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[0].set_running_or_notify_cancel():
+                item[0].set_exception(error)
+
+    def _run(self):
+        try:
+            conn = self.pool._connect()
+        except sqlite3.Error as e:
+            print(f"Write queue could not open {self.pool.database}: {e}")
+            self.error = e
+            self.stopped = True
+            self._fail_queued(e)
+            return
+        stopping = False
+        with self.app.app_context():
+            while not stopping:
+                batch = [self._queue.get()]
+                while batch[-1] is not None and len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch[-1] is None:
+                    stopping = True
+                    batch.pop()
+                    # Writes submitted while stop() ran still get their commit
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not None:
+                            batch.append(item)
+                if batch:
+                    self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for future, func, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT queued_write')
+                try:
+                    outcomes.append((future, func(conn, *args), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO queued_write')
+                    outcomes.append((future, None, e))
+                conn.execute('RELEASE queued_write')
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Write queue commit error: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            # Nothing of this batch was committed
+            for future, _, _ in batch:
+                if future.running():
+                    future.set_exception(e)
+            with self._lock:
+                self._failed += len(batch)
+            return
+        with self._lock:
+            self._commits += 1
+            self._writes += len(outcomes)
+            self._failed += sum(1 for _, _, error in outcomes if error is not None)
+            self._largest_batch = max(self._largest_batch, len(outcomes))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'commits': self._commits,
+                'writes': self._writes,
+                'failed': self._failed,
+                'writes_per_commit': round(self._writes / self._commits, 2) if self._commits else 0,
+                'largest_batch': self._largest_batch
+            }
+
+
+def open_pool(database, size):
+    config = current_app.config
+    return ConnectionPool(database, size=size, timeout=config['DB_POOL_TIMEOUT'],
+                          mmap_size=config['DB_MMAP_SIZE'], cache_size=config['DB_CACHE_SIZE'])
+
+def get_shared_pool():
+    """Return this worker's pool for DATABASE, or SHARED_DATABASE with tenancy, creating it after fork if needed."""
+    state = app_state()
+    pool = state.pool
+    if pool is None or pool.pid != os.getpid():
+        with state.lock:
+            if state.pool is None or state.pool.pid != os.getpid():
+                config = current_app.config
+                database = config['SHARED_DATABASE'] if config['TENANCY'] else config['DATABASE']
+                state.pool = open_pool(database, config['DB_POOL_SIZE'])
+            pool = state.pool
+    return pool
+
+# --- Households ---
+# With TENANCY every household has its own SQLite file, so households never
+# wait for each other's write lock. Each worker keeps the pools of recently
+# active households open in an LRU; a household's file is created and
+# migrated when it is first opened.
+
+TENANT_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+TENANT_COOKIE = 'household'
+
+def parse_tenant(value):
+    """Return a valid household id (lower-cased) or None."""
+    value = (value or '').strip().lower()
+    return value if TENANT_PATTERN.match(value) else None
+
+def current_tenant():
+    """Household of the current request, None without tenancy; aborts with 400 if it is missing or invalid."""
+    if not current_app.config['TENANCY']:
         return None
+    if 'tenant' not in g:
+        value = None
+        if has_request_context():
+            value = request.headers.get(current_app.config['TENANT_HEADER']) or request.cookies.get(TENANT_COOKIE)
+        tenant = parse_tenant(value)
+        if tenant is None:
+            abort(400, description=f"Missing or invalid household: send the {current_app.config['TENANT_HEADER']} "
+                                   f"header or open /?household=<id> once")
+        g.tenant = tenant
+    return g.tenant
+
+def tenant_database(tenant):
+    return os.path.join(current_app.config['TENANT_DIR'], f'{tenant}.db')
+
+def list_tenants():
+    """Households that have a database file."""
+    directory = current_app.config['TENANT_DIR']
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-3] for name in os.listdir(directory)
+                  if name.endswith('.db') and TENANT_PATTERN.match(name[:-3]))
+
+def get_tenant_pool(tenant):
+    """Return the household's pool from this worker's LRU, opening (and migrating) its database on a miss."""
+    state = app_state()
+    with state.tenant_lock:
+        if state.tenant_pid != os.getpid():
+            # Pools inherited through fork belong to the parent
+            state.tenant_pools = OrderedDict()
+            state.tenant_pid = os.getpid()
+        pool = state.tenant_pools.get(tenant)
+        if pool is not None:
+            state.tenant_pools.move_to_end(tenant)
+            return pool
+
+        pool = open_pool(tenant_database(tenant), current_app.config['TENANT_POOL_SIZE'])
+        conn = pool.acquire()
+        try:
+            upgrade_db(conn)
+        finally:
+            pool.release(conn)
+        state.tenant_pools[tenant] = pool
+        while len(state.tenant_pools) > current_app.config['TENANT_CACHE_SIZE']:
+            _, evicted = state.tenant_pools.popitem(last=False)
+            evicted.close()
+        return pool
+
+def tenant_pools_open():
+    state = app_state()
+    return len(state.tenant_pools) if state.tenant_pid == os.getpid() else 0
+
+def get_pool():
+    """Return the pool of the current household's database (the only database without tenancy)."""
+    tenant = current_tenant()
+    if tenant is None:
+        return get_shared_pool()
+    return get_tenant_pool(tenant)
+
+def current_database():
+    tenant = current_tenant()
+    return current_app.config['DATABASE'] if tenant is None else tenant_database(tenant)
+
+def get_db_connection():
+    """Return the pooled connection bound to the current app context."""
+    if 'db' not in g:
+        try:
+            pool = get_pool()
+            g.db = pool.acquire()
+            g.db_pool = pool
+        except (sqlite3.Error, PoolTimeout) as e:
+            print(f"Database connection error: {e}")
+            return None
+    return g.db
+
+def get_shared_db_connection():
+    """Return a connection for data all households share (the OFF cache); the regular one without tenancy."""
+    if not current_app.config['TENANCY']:
+        return get_db_connection()
+    if 'shared_db' not in g:
+        try:
+            g.shared_db = get_shared_pool().acquire()
+        except (sqlite3.Error, PoolTimeout) as e:
+            print(f"Shared database connection error: {e}")
+            return None
+    return g.shared_db
+
+def release_db_connection(exception):
+    """Hand the context's connections back to their pools."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        g.pop('db_pool').release(conn)
+    shared = g.pop('shared_db', None)
+    if shared is not None:
+        get_shared_pool().release(shared)
+
+def get_write_queue(pool=None):
+    """Return the writer thread of pool (the current database's), starting it on first use."""
+    pool = pool or get_pool()
+    if pool.closed:
+        # Evicted from the household LRU; a new writer would outlive its pool
+        raise PoolTimeout("Database was closed")
+    if pool.writer is None or pool.writer.error is not None:
+        with app_state().lock:
+            if pool.writer is None or pool.writer.error is not None:
+                pool.writer = WriteQueue(pool, current_app._get_current_object(),
+                                         max_batch=current_app.config['WRITE_QUEUE_BATCH'])
+    return pool.writer
+
+def run_write(func, *args, shared=False):
+    """Run func(conn, *args) in a write transaction and return its result.
+
+    With WRITE_QUEUE the database's writer thread commits it together with
+    other requests' writes; otherwise it runs on the request's connection and
+    commits. shared=True writes to the database all households share (see
+    get_shared_db_connection()). Exceptions of func (including abort()) reach
+    the caller either way; a database closed under the write gives 503.
+    """
+    if not current_app.config['WRITE_QUEUE']:
+        conn = get_shared_db_connection() if shared else get_db_connection()
+        if not conn:
+            abort(500, description="Database connection failed")
+        try:
+            result = func(conn, *args)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return result
+
+    started = time.perf_counter()
+    try:
+        future = get_write_queue(get_shared_pool() if shared else get_pool()).submit(func, *args)
+    except PoolTimeout:
+        # The household's pool was evicted between lookup and submit
+        abort(503, description="Database is being closed, please retry")
+    try:
+        return future.result(timeout=current_app.config['WRITE_QUEUE_TIMEOUT'])
+    except FutureTimeout:
+        if not future.cancel():
+            # Already being written; it commits shortly
+            return future.result()
+        abort(503, description="Write queue is busy, please retry")
+    finally:
+        record_timing('write_queue', time.perf_counter() - started)
 
 def sanitize_input(text, max_length=500):
     """Sanitize user input to prevent injection attacks."""
@@ -39,6 +715,201 @@ def sanitize_input(text, max_length=500):
     sanitized = str(text).replace('\x00', '')[:max_length]
     return sanitized.strip()
 
+# Accepted date spellings; month-only dates mean the last day of that month
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y', '%d/%m/%Y', '%Y/%m/%d', '%Y%m%d')
+MONTH_FORMATS = ('%m/%Y', '%m.%Y', '%Y-%m')
+
+def normalize_date(value):
+    """Return a date as ISO YYYY-MM-DD ('' stays empty), raising ValueError if unreadable."""
+    if value is None:
+        return None
+    text = str(value).replace('\x00', '').strip()
+    if not text:
+        return ''
+    # ISO timestamps carry the date in front
+    if len(text) > 10 and text[10] in 'T ':
+        text = text[:10]
+    if len(text) == 10 and text[4] == '-':
+        # Fast path for the common ISO spelling
+        try:
+            return date.fromisoformat(text).isoformat()
+        except ValueError:
+            pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    for fmt in MONTH_FORMATS:
+        try:
+            month = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        last_day = calendar.monthrange(month.year, month.month)[1]
+        return month.replace(day=last_day).strftime('%Y-%m-%d')
+    raise ValueError(f"Invalid date '{text[:20]}', expected YYYY-MM-DD")
+
+# Free-text product fields and their maximum lengths
+PRODUCT_DATE_FIELDS = ('expiry_date', 'purchase_date')
+PRODUCT_TEXT_FIELDS = {
+    'ean': 50,
+    'location': 100,
+    'weight_volume': 50,
+    'notes': 1000,
+    'category': 50,
+    'tags': 200
+}
+PRODUCT_COLUMNS = ('ean', 'name', 'expiry_date', 'purchase_date', 'location', 'quantity', 'weight_volume',
+                   'notes', 'is_vegetarian', 'is_vegan', 'price', 'image_url', 'category', 'tags')
+PRODUCT_INSERT_SQL = (
+    f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})"
+)
+
+def validate_product(data, mode='create'):
+    """Validate and sanitize product fields, raising ValueError with a message.
+
+    mode is 'create' (all fields, purchase date defaults to today), 'update'
+    (all fields except the EAN) or 'patch' (only the fields present in data).
+    The image is only type-checked here, prepare_image() stores it.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Product must be a JSON object")
+    partial = mode == 'patch'
+    values = {}
+
+    if not isinstance(data.get('image_url') or '', str):
+        raise ValueError("Invalid image_url")
+
+    if not partial or 'name' in data:
+        name = sanitize_input(data.get('name'), 200)
+        if not name:
+            raise ValueError("Product name is required")
+        values['name'] = name
+
+    if not partial or 'quantity' in data:
+        try:
+            quantity = int(data.get('quantity', 1))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid quantity")
+        if quantity < 1 or quantity > 9999:
+            raise ValueError("Quantity must be between 1 and 9999")
+        values['quantity'] = quantity
+
+    for field, max_length in PRODUCT_TEXT_FIELDS.items():
+        if field == 'ean' and mode != 'create':
+            continue
+        if not partial or field in data:
+            values[field] = sanitize_input(data.get(field), max_length)
+    for field in PRODUCT_DATE_FIELDS:
+        if not partial or field in data:
+            values[field] = normalize_date(data.get(field))
+    if mode == 'create' and 'purchase_date' not in data:
+        values['purchase_date'] = datetime.now().strftime('%Y-%m-%d')
+
+    for flag in ('is_vegetarian', 'is_vegan'):
+        if not partial or flag in data:
+            values[flag] = 1 if data.get(flag) else 0
+
+    if not partial or 'price' in data:
+        try:
+            values['price'] = float(data.get('price') or 0.0)
+        except (ValueError, TypeError):
+            raise ValueError("Invalid price")
+
+    return values
+
+def prepare_image(image_url):
+    """Resolve a submitted image_url into the URL to store, saving base64 images to the uploads.
+
+    Returns None if a base64 image could not be saved (the product keeps its
+    current image). Call it before run_write(), so no file I/O happens while
+    the write lock is held. Files are only ever deleted by gc-images.
+    """
+    if not image_url:
+        return ''
+    if image_url.startswith('data:image'):
+        image_filename = save_base64_image(image_url)
+        return f'/static/uploads/{image_filename}' if image_filename else None
+    if image_url.startswith('/static/uploads/'):
+        touch_image(image_url)
+    return image_url
+
+def prepare_batch_images(items):
+    """prepare_image() for every item of a batch list (None for items with an invalid image_url)."""
+    images = []
+    for item in items:
+        image_url = (item.get('image_url') or '') if isinstance(item, dict) else None
+        images.append(prepare_image(image_url) if isinstance(image_url, str) else None)
+    return images
+
+# --- Image Store ---
+# Uploads are stored once under the SHA-256 of their content. The images table
+# counts how many products reference each file (maintained by triggers), and
+# thumbnails for the list view are rendered by a background thread.
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif')
+)
+
+def detect_image_type(header):
+    """Return the file extension for known image magic bytes, or None."""
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def uploads_dir():
+    return current_app.config['UPLOADS_DIR']
+
+def thumbnail_path(filename, uploads=None):
+    return os.path.join(uploads or uploads_dir(), 'thumbs', os.path.splitext(filename)[0] + '.jpg')
+
+def store_image(stream, chunk_size=64 * 1024):
+    """Stream an image to the uploads folder under its content hash and return the filename."""
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(uploads_dir(), f'.upload-{uuid.uuid4().hex}.tmp')
+    try:
+        # Read until the magic bytes can be checked
+        chunk = stream.read(chunk_size)
+        while chunk and len(chunk) < 12:
+            more = stream.read(chunk_size)
+            if not more:
+                break
+            chunk += more
+        extension = detect_image_type(chunk or b'')
+        if not extension:
+            return None
+
+        with open(tmp_path, 'wb') as f:
+            while chunk:
+                digest.update(chunk)
+                f.write(chunk)
+                chunk = stream.read(chunk_size)
+
+        filename = f'{digest.hexdigest()}.{extension}'
+        filepath = os.path.join(uploads_dir(), filename)
+        if os.path.exists(filepath):
+            # Same content already stored; it is about to be referenced again
+            os.remove(tmp_path)
+            touch_image(filename)
+        else:
+            os.replace(tmp_path, filepath)
+        if not os.path.exists(thumbnail_path(filename)):
+            get_thumbnail_worker().submit(filename)
+        return filename
+    except OSError as e:
+        print(f"Error saving image: {e}")
+        return None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 def save_base64_image(base64_string):
     """Save base64 image to uploads folder and return filename."""
     try:
@@ -50,86 +921,618 @@ def save_base64_image(base64_string):
         
         # Decode base64
         image_data = base64.b64decode(data)
-        
-        # Generate unique filename
-        filename = f"{uuid.uuid4().hex}.jpg"
-        filepath = os.path.join(UPLOADS_DIR, filename)
-        
-        # Save to file
-        with open(filepath, 'wb') as f:
-            f.write(image_data)
-        
-        return filename
+        return store_image(io.BytesIO(image_data))
     except Exception as e:
         print(f"Error saving image: {e}")
         return None
 
+def touch_image(image_url):
+    """Reset an upload's mtime, so gc-images keeps the file for another grace period."""
+    try:
+        os.utime(os.path.join(uploads_dir(), image_url.split('/')[-1]))
+    except OSError:
+        pass
+
 def delete_image(image_url):
-    """Delete image file from uploads folder."""
+    """Delete image file and its thumbnail from uploads folder."""
     try:
         if image_url.startswith('/static/uploads/'):
             filename = image_url.split('/')[-1]
-            filepath = os.path.join(UPLOADS_DIR, filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            for filepath in (os.path.join(uploads_dir(), filename), thumbnail_path(filename)):
+                if os.path.exists(filepath):
+                    os.remove(filepath)
     except Exception as e:
         print(f"Error deleting image: {e}")
 
+
+class ThumbnailWorker:
+    """Background thread rendering JPEG thumbnails; a no-op without Pillow."""
+
+    def __init__(self, uploads, size=160):
+        self.uploads = uploads
+        self.size = size
+        self.pid = os.getpid()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, filename):
+        if Image is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='thumbnails', daemon=True)
+                self._thread.start()
+        self._queue.put(filename)
+
+    def _run(self):
+        while True:
+            filename = self._queue.get()
+            try:
+                self.render(filename)
+            except Exception as e:
+                print(f"Error creating thumbnail for {filename}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def render(self, filename):
+        source = os.path.join(self.uploads, filename)
+        target = thumbnail_path(filename, self.uploads)
+        if not os.path.exists(source) or os.path.exists(target):
+            return
+        with Image.open(source) as img:
+            img.thumbnail((self.size, self.size))
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            tmp_target = f'{target}.{uuid.uuid4().hex}.tmp'
+            img.save(tmp_target, 'JPEG', quality=80, optimize=True)
+        os.replace(tmp_target, target)
+
+    def join(self):
+        """Wait until all queued thumbnails are written."""
+        self._queue.join()
+
+
+def get_thumbnail_worker():
+    """Return this worker process's thumbnail thread wrapper."""
+    state = app_state()
+    worker = state.thumbnail_worker
+    if worker is None or worker.pid != os.getpid():
+        with state.lock:
+            if state.thumbnail_worker is None or state.thumbnail_worker.pid != os.getpid():
+                state.thumbnail_worker = ThumbnailWorker(uploads_dir(), size=current_app.config['THUMBNAIL_SIZE'])
+            worker = state.thumbnail_worker
+    return worker
+
+def init_image_refs(c):
+    """Create the image reference table and the triggers that count product references."""
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images'").fetchone()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            path TEXT PRIMARY KEY,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    add_ref = '''
+        INSERT INTO images (path, refcount) VALUES (new.image_url, 1)
+        ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1;
+    '''
+    drop_ref = 'UPDATE images SET refcount = refcount - 1 WHERE path = old.image_url;'
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS images_ref_ai AFTER INSERT ON products
+        WHEN new.image_url LIKE '/static/uploads/%' BEGIN {add_ref} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS images_ref_ad AFTER DELETE ON products
+        WHEN old.image_url LIKE '/static/uploads/%' BEGIN {drop_ref} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS images_ref_au_old AFTER UPDATE OF image_url ON products
+        WHEN old.image_url IS NOT new.image_url AND old.image_url LIKE '/static/uploads/%' BEGIN {drop_ref} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS images_ref_au_new AFTER UPDATE OF image_url ON products
+        WHEN old.image_url IS NOT new.image_url AND new.image_url LIKE '/static/uploads/%' BEGIN {add_ref} END
+    ''')
+    if not exists:
+        c.execute('''
+            INSERT INTO images (path, refcount)
+            SELECT image_url, COUNT(*) FROM products WHERE image_url LIKE '/static/uploads/%' GROUP BY image_url
+        ''')
+
+def image_references(conn):
+    """File names of the uploads products reference; forgets the unreferenced ones (the caller commits)."""
+    referenced = {row['path'].split('/')[-1] for row in
+                  conn.execute('SELECT path FROM images WHERE refcount > 0')}
+    conn.execute('DELETE FROM images WHERE refcount <= 0')
+    return referenced
+
+def sweep_orphan_images(referenced, min_age=24 * 3600):
+    """Delete uploaded files not in referenced (older than min_age seconds); returns the count."""
+    cutoff = time.time() - min_age
+    removed = 0
+    for entry in os.scandir(uploads_dir()):
+        if not entry.is_file() or entry.name in referenced or entry.stat().st_mtime > cutoff:
+            continue
+        delete_image(f'/static/uploads/{entry.name}')
+        removed += 1
+    for entry in os.scandir(os.path.join(uploads_dir(), 'thumbs')):
+        stem = os.path.splitext(entry.name)[0]
+        if entry.is_file() and not any(name.startswith(stem + '.') for name in referenced) \
+                and entry.stat().st_mtime <= cutoff:
+            os.remove(entry.path)
+    return removed
+
+# One statement per scan; relies on the unique index on barcode_history(ean)
+BARCODE_HISTORY_UPSERT_SQL = '''
+    INSERT INTO barcode_history (ean, name, category, weight_volume, tags, is_vegetarian, is_vegan, scan_count, last_scanned)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT(ean) DO UPDATE SET
+        scan_count = scan_count + 1,
+        last_scanned = excluded.last_scanned,
+        name = excluded.name,
+        category = excluded.category,
+        weight_volume = excluded.weight_volume,
+        tags = excluded.tags,
+        is_vegetarian = excluded.is_vegetarian,
+        is_vegan = excluded.is_vegan
+'''
+
 def update_barcode_history(conn, ean, name, category=None, weight_volume=None, tags=None, is_vegetarian=False, is_vegan=False):
     """Update or create barcode history entry with full product metadata."""
     try:
-        existing = conn.execute(
-            'SELECT id, scan_count FROM barcode_history WHERE ean = ?', 
-            (ean,)
-        ).fetchone()
-        
-        if existing:
-            conn.execute('''
-                UPDATE barcode_history 
-                SET scan_count = ?, last_scanned = ?, name = ?, category = ?, weight_volume = ?, tags = ?, is_vegetarian = ?, is_vegan = ?
-                WHERE id = ?
-            ''', (existing['scan_count'] + 1, datetime.now().isoformat(), name, category, weight_volume, tags, 
-                  1 if is_vegetarian else 0, 1 if is_vegan else 0, existing['id']))
-        else:
-            conn.execute('''
-                INSERT INTO barcode_history (ean, name, category, weight_volume, tags, is_vegetarian, is_vegan, scan_count)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (ean, name, category, weight_volume, tags, 1 if is_vegetarian else 0, 1 if is_vegan else 0, 1))
+        conn.execute(BARCODE_HISTORY_UPSERT_SQL, (ean, name, category, weight_volume, tags,
+                                                  1 if is_vegetarian else 0, 1 if is_vegan else 0))
     except Exception as e:
         print(f"Error updating barcode history: {e}")
 
-def init_db():
-    """Initializes the database with the products table and handles migrations."""
-    conn = get_db_connection()
-    if not conn:
+# Same as BARCODE_HISTORY_UPSERT_SQL, but counting several scans of one EAN at once
+BARCODE_HISTORY_MERGE_SQL = '''
+    INSERT INTO barcode_history (ean, name, category, weight_volume, tags, is_vegetarian, is_vegan, scan_count, last_scanned)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(ean) DO UPDATE SET
+        scan_count = scan_count + excluded.scan_count,
+        last_scanned = excluded.last_scanned,
+        name = excluded.name,
+        category = excluded.category,
+        weight_volume = excluded.weight_volume,
+        tags = excluded.tags,
+        is_vegetarian = excluded.is_vegetarian,
+        is_vegan = excluded.is_vegan
+'''
+
+def update_barcode_history_many(conn, rows):
+    """Batched update_barcode_history() for (ean, name, category, weight_volume, tags, is_vegetarian, is_vegan) rows.
+
+    Repeated EANs are merged into one upsert: the last row's metadata wins
+    and scan_count grows by the number of rows.
+    """
+    merged = {}
+    for ean, name, category, weight_volume, tags, is_vegetarian, is_vegan in rows:
+        count = merged.pop(ean, (0,))[0]
+        merged[ean] = (count + 1, name, category, weight_volume, tags, 1 if is_vegetarian else 0, 1 if is_vegan else 0)
+    conn.executemany(BARCODE_HISTORY_MERGE_SQL, [
+        (ean, name, category, weight_volume, tags, is_vegetarian, is_vegan, count)
+        for ean, (count, name, category, weight_volume, tags, is_vegetarian, is_vegan) in merged.items()
+    ])
+
+def normalize_scan_timestamps(c):
+    """Rewrite last_scanned values written as local datetime.now().isoformat() to CURRENT_TIMESTAMP format (UTC)."""
+    c.execute('''
+        UPDATE barcode_history SET last_scanned = strftime('%Y-%m-%d %H:%M:%S', last_scanned, 'utc')
+        WHERE last_scanned LIKE '____-__-__T%' AND strftime('%Y-%m-%d %H:%M:%S', last_scanned, 'utc') IS NOT NULL
+    ''')
+
+def split_null_statistics(c):
+    """Recreate statistics summary tables that merged NULL into '' (before migration 11)."""
+    for table in STATS_TABLES:
+        if c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (f'{table}_key',)).fetchone():
+            continue
+        for event in ('ai', 'ad', 'au'):
+            c.execute(f'DROP TRIGGER IF EXISTS {table}_{event}')
+        c.execute(f'DROP TABLE IF EXISTS {table}')
+    init_statistics(c)
+
+def init_barcode_history_indexes(c):
+    """Merge duplicate EAN rows once, then index barcode_history for upserts and listings."""
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_barcode_history_ean'"
+    ).fetchone()
+    if not exists:
+        duplicates = c.execute(
+            'SELECT COUNT(*) FROM (SELECT ean FROM barcode_history GROUP BY ean HAVING COUNT(*) > 1)'
+        ).fetchone()[0]
+        if duplicates:
+            print(f"Migrating barcode_history: Merging {duplicates} duplicated EANs...")
+            # The newest row keeps its metadata and takes over the summed scan count
+            c.execute('''
+                UPDATE barcode_history SET
+                    scan_count = (SELECT SUM(scan_count) FROM barcode_history b WHERE b.ean = barcode_history.ean),
+                    last_scanned = (SELECT MAX(last_scanned) FROM barcode_history b WHERE b.ean = barcode_history.ean)
+                WHERE id IN (SELECT MAX(id) FROM barcode_history GROUP BY ean HAVING COUNT(*) > 1)
+            ''')
+            c.execute('DELETE FROM barcode_history WHERE id NOT IN (SELECT MAX(id) FROM barcode_history GROUP BY ean)')
+        c.execute('CREATE UNIQUE INDEX idx_barcode_history_ean ON barcode_history(ean)')
+
+    c.execute('CREATE INDEX IF NOT EXISTS idx_barcode_history_last_scanned ON barcode_history(last_scanned)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_barcode_history_scan_count ON barcode_history(scan_count)')
+
+# Full-text indexes over products and barcode_history. Both use external content,
+# so the FTS tables only store the index; triggers keep them in sync.
+FTS_TABLES = {
+    'products_fts': ('products', ('name', 'notes', 'tags', 'ean')),
+    'barcode_history_fts': ('barcode_history', ('name', 'category', 'tags', 'ean'))
+}
+
+def init_search_index(c):
+    """Create FTS5 tables and sync triggers, building the index on first creation."""
+    for fts_table, (table, columns) in FTS_TABLES.items():
+        exists = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,)
+        ).fetchone()
+        cols = ', '.join(columns)
+        new_cols = ', '.join(f'new.{col}' for col in columns)
+        old_cols = ', '.join(f'old.{col}' for col in columns)
+
+        c.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                {cols}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        ''')
+
+        if not exists:
+            print(f"Building full-text index {fts_table}...")
+            c.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+# Per-location and per-category aggregates, maintained by triggers on products so
+# the statistics endpoints read a handful of rows instead of scanning the table.
+# NULL and '' are separate groups, as in GROUP BY; the key index tells them apart.
+STATS_TABLES = {
+    'stats_location': 'location',
+    'stats_category': 'category'
+}
+
+def init_statistics(c):
+    """Create the statistics summary tables and their maintenance triggers."""
+    created = False
+    for table, column in STATS_TABLES.items():
+        exists = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        created = created or not exists
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                {column} TEXT,
+                products INTEGER NOT NULL DEFAULT 0,
+                items INTEGER NOT NULL DEFAULT 0,
+                value REAL NOT NULL DEFAULT 0,
+                priced_products INTEGER NOT NULL DEFAULT 0,
+                priced_total REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        key = f"{column} IS NULL, IFNULL({column}, '')"
+        c.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {table}_key ON {table}({key})')
+
+        add_new = f'''
+            INSERT INTO {table} ({column}, products, items, value, priced_products, priced_total)
+            VALUES (new.{column}, 1, IFNULL(new.quantity, 0),
+                    IFNULL(new.price, 0) * IFNULL(new.quantity, 0),
+                    IFNULL(new.price, 0) > 0, MAX(IFNULL(new.price, 0), 0))
+            ON CONFLICT({key}) DO UPDATE SET
+                products = products + 1,
+                items = items + excluded.items,
+                value = value + excluded.value,
+                priced_products = priced_products + excluded.priced_products,
+                priced_total = priced_total + excluded.priced_total;
+        '''
+        remove_old = f'''
+            UPDATE {table} SET
+                products = products - 1,
+                items = items - IFNULL(old.quantity, 0),
+                value = value - IFNULL(old.price, 0) * IFNULL(old.quantity, 0),
+                priced_products = priced_products - (IFNULL(old.price, 0) > 0),
+                priced_total = priced_total - MAX(IFNULL(old.price, 0), 0)
+            WHERE {column} IS old.{column};
+            DELETE FROM {table} WHERE {column} IS old.{column} AND products <= 0;
+        '''
+        c.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON products BEGIN {add_new} END')
+        c.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON products BEGIN {remove_old} END')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {column}, quantity, price ON products
+            BEGIN {remove_old} {add_new} END
+        ''')
+
+    if created:
+        print("Building statistics summary tables...")
+        rebuild_statistics(c)
+
+def rebuild_statistics(c):
+    """Recompute the summary tables from the products table."""
+    for table, column in STATS_TABLES.items():
+        c.execute(f'DELETE FROM {table}')
+        c.execute(f'''
+            INSERT INTO {table} ({column}, products, items, value, priced_products, priced_total)
+            SELECT {column}, COUNT(*), SUM(IFNULL(quantity, 0)),
+                   SUM(IFNULL(price, 0) * IFNULL(quantity, 0)),
+                   SUM(IFNULL(price, 0) > 0), SUM(MAX(IFNULL(price, 0), 0))
+            FROM products GROUP BY {column}
+        ''')
+
+def build_fts_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    terms = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{term}"*' for term in terms[:10])
+
+# Columns added after the first release, added to older databases by migration 1
+LEGACY_COLUMNS = {
+    'products': (
+        ('weight_volume', 'TEXT'),
+        ('created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+        ('price', 'REAL DEFAULT 0.0'),
+        ('image_url', 'TEXT'),
+        ('category', 'TEXT'),
+        ('tags', 'TEXT'),
+        ('scan_count', 'INTEGER DEFAULT 0'),
+        ('last_scanned', 'TEXT')
+    ),
+    'barcode_history': (
+        ('category', 'TEXT'),
+        ('weight_volume', 'TEXT'),
+        ('tags', 'TEXT'),
+        ('is_vegetarian', 'INTEGER DEFAULT 0'),
+        ('is_vegan', 'INTEGER DEFAULT 0')
+    )
+}
+
+# Typed products table: ISO dates, 0/1 flags and numeric quantity/price are enforced by CHECKs
+DATE_CHECK = "{column} IS NULL OR {column} = '' OR ({column} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' AND date({column}) = {column})"
+PRODUCTS_TABLE_SQL = f'''
+    CREATE TABLE IF NOT EXISTS {{name}} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ean TEXT,
+        name TEXT NOT NULL,
+        expiry_date TEXT CHECK ({DATE_CHECK.format(column='expiry_date')}),
+        purchase_date TEXT CHECK ({DATE_CHECK.format(column='purchase_date')}),
+        location TEXT,
+        quantity INTEGER DEFAULT 1 CHECK (typeof(quantity) = 'integer' AND quantity >= 0),
+        weight_volume TEXT,
+        notes TEXT,
+        is_vegetarian INTEGER DEFAULT 0 CHECK (is_vegetarian IN (0, 1)),
+        is_vegan INTEGER DEFAULT 0 CHECK (is_vegan IN (0, 1)),
+        price REAL DEFAULT 0.0 CHECK (price IS NULL OR typeof(price) IN ('real', 'integer')),
+        image_url TEXT,
+        category TEXT,
+        tags TEXT,
+        scan_count INTEGER DEFAULT 0,
+        last_scanned TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP CHECK (created_at IS NULL OR datetime(created_at) IS NOT NULL)
+    )
+'''
+
+def normalize_product_row(row):
+    """Coerce a legacy products row to the typed schema; unreadable dates move into the notes."""
+    row = dict(row)
+    notes = [row['notes']] if row['notes'] else []
+    for field, label in (('expiry_date', 'Ablaufdatum'), ('purchase_date', 'Kaufdatum')):
+        try:
+            row[field] = normalize_date(row[field])
+        except ValueError:
+            notes.append(f"{label}: {row[field]}")
+            row[field] = None
+    row['notes'] = '\n'.join(notes) or row['notes']
+    try:
+        row['quantity'] = max(int(row['quantity'] if row['quantity'] is not None else 1), 0)
+    except (ValueError, TypeError):
+        row['quantity'] = 1
+    try:
+        row['price'] = float(row['price']) if row['price'] not in (None, '') else 0.0
+    except (ValueError, TypeError):
+        row['price'] = 0.0
+    for flag in ('is_vegetarian', 'is_vegan'):
+        row[flag] = 0 if row[flag] in (None, 0, '0', '', 'false', 'False') else 1
+    created_at = row['created_at']
+    if created_at is not None:
+        created_at = str(created_at).strip().replace('T', ' ')[:19]
+        try:
+            datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            try:
+                created_at = normalize_date(created_at) + ' 00:00:00'
+            except (ValueError, TypeError):
+                created_at = None
+        row['created_at'] = created_at
+    return row
+
+def rebuild_typed_products(c):
+    """Rebuild an untyped products table with the CHECK-constrained schema.
+
+    Fresh databases are created typed and are left alone.
+    """
+    sql = c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'products'").fetchone()[0]
+    if 'CHECK' in sql:
         return
 
+    print("Migrating database: Rebuilding products with typed columns...")
+    c.execute('DROP TABLE IF EXISTS products_typed')
+    c.execute(PRODUCTS_TABLE_SQL.format(name='products_typed'))
+    columns = [row[1] for row in c.execute('PRAGMA table_info(products_typed)')]
+    insert_sql = (f"INSERT INTO products_typed ({', '.join(columns)}) "
+                  f"VALUES ({', '.join(':' + column for column in columns)})")
+
+    changed = []
+    reader = c.connection.execute(f"SELECT {', '.join(columns)} FROM products ORDER BY id")
+    while True:
+        rows = reader.fetchmany(1000)
+        if not rows:
+            break
+        typed = [normalize_product_row(row) for row in rows]
+        changed.extend(new['id'] for old, new in zip(rows, typed) if dict(old) != new)
+        c.executemany(insert_sql, typed)
+
+    # DROP TABLE takes the indexes and triggers of products with it
+    dependents = [row[0] for row in c.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'products' AND type IN ('index', 'trigger') "
+        "AND sql IS NOT NULL ORDER BY type, name"
+    )]
+    c.execute('DROP TABLE products')
+    c.execute('ALTER TABLE products_typed RENAME TO products')
+    for sql in dependents:
+        c.execute(sql)
+
+    # Derived tables were maintained from the untyped values
+    tables = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if 'products_fts' in tables:
+        c.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    if all(table in tables for table in STATS_TABLES):
+        rebuild_statistics(c)
+
+    # Let ETag and delta sync clients see the normalized rows
+    if 'data_versions' in tables:
+        c.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'products'")
+    if 'change_log' in tables:
+        c.executemany("INSERT INTO change_log (table_name, row_id, op) VALUES ('products', ?, 'upsert')",
+                      [(row_id,) for row_id in changed])
+    print(f"Products rebuilt, {len(changed)} rows normalized")
+
+def init_product_indexes(c):
+    """Create the composite indexes that cover the hot product queries."""
+    # Expiry ranges and expiry-sorted listings filtered by location
+    c.execute('CREATE INDEX IF NOT EXISTS idx_products_expiry_location ON products(expiry_date, location)')
+    # Per-category value aggregates
+    c.execute('CREATE INDEX IF NOT EXISTS idx_products_category_price ON products(category, price, quantity)')
+    # Recent additions and their value
+    c.execute('CREATE INDEX IF NOT EXISTS idx_products_created_at ON products(created_at, price, quantity)')
+    # Duplicate check and barcode lookups
+    c.execute('CREATE INDEX IF NOT EXISTS idx_products_ean ON products(ean)')
+
+# Tables whose writes bump a version counter; list endpoints derive ETags from it
+VERSIONED_TABLES = ('products', 'shopping_list', 'barcode_history')
+
+def init_data_versions(c):
+    """Create the per-table data version counters and the triggers bumping them."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # A random epoch keeps ETags from a deleted and recreated database from matching
+    c.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('_epoch', ?)",
+              (random.getrandbits(48),))
+    for table in VERSIONED_TABLES:
+        c.execute('INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS data_version_{table}_{event.lower()} AFTER {event} ON {table}
+                BEGIN UPDATE data_versions SET version = version + 1 WHERE name = '{table}'; END
+            ''')
+
+# Tables mirrored into change_log for delta sync
+SYNC_TABLES = ('products', 'shopping_list', 'barcode_history')
+
+def init_change_log(c):
+    """Create the change log, its triggers and the sync_state bookkeeping table."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log(table_name, row_id)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    # Rows that existed before the log are not in it; clients must start with a full load
+    c.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('compacted_seq', 0)")
+
+    for table in SYNC_TABLES:
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', new.id, 'upsert');
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', new.id, 'upsert');
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', old.id, 'delete');
+            END
+        ''')
+
+def compact_change_log(conn, retention_days):
+    """Drop superseded log entries and tombstones older than the retention period.
+
+    Returns (removed, horizon); the caller commits. Clients syncing from
+    before the horizon get a reset.
+    """
     c = conn.cursor()
-    
-    # Create products table
     c.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ean TEXT,
-            name TEXT NOT NULL,
-            expiry_date TEXT,
-            purchase_date TEXT,
-            location TEXT,
-            quantity INTEGER DEFAULT 1,
-            weight_volume TEXT,
-            notes TEXT,
-            is_vegetarian INTEGER DEFAULT 0,
-            is_vegan INTEGER DEFAULT 0,
-            price REAL DEFAULT 0.0,
-            image_url TEXT,
-            category TEXT,
-            tags TEXT,
-            scan_count INTEGER DEFAULT 0,
-            last_scanned TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        DELETE FROM change_log WHERE seq NOT IN (
+            SELECT MAX(seq) FROM change_log GROUP BY table_name, row_id
         )
     ''')
-    
+    removed = c.rowcount
+
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%dT%H:%M:%S')
+    expired = c.execute(
+        "SELECT MAX(seq) FROM change_log WHERE op = 'delete' AND changed_at < ?", (cutoff,)
+    ).fetchone()[0]
+    if expired is not None:
+        c.execute("DELETE FROM change_log WHERE op = 'delete' AND seq <= ?", (expired,))
+        removed += c.rowcount
+        c.execute("UPDATE sync_state SET value = MAX(value, ?) WHERE key = 'compacted_seq'", (expired,))
+
+    horizon = c.execute("SELECT value FROM sync_state WHERE key = 'compacted_seq'").fetchone()[0]
+    return removed, horizon
+
+# Expiry windows in days, checked in order; anything already past is 'expired'
+EXPIRY_BUCKETS = (('expired', -1), ('days_3', 3), ('days_7', 7))
+
+def init_expiry_buckets(c):
+    """Create the materialized expiry bucket table."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS expiry_buckets (
+            product_id INTEGER PRIMARY KEY,
+            bucket TEXT NOT NULL,
+            days_left INTEGER NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_expiry_buckets_bucket ON expiry_buckets(bucket, days_left)')
+    # Stamp of the last refresh: date and products data version it was computed for
+    c.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('expiry_buckets_date', 0)")
+    c.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('expiry_buckets_version', -1)")
+
+def migrate_base_schema(c):
+    """Create the core tables, add columns missing in old databases and type products."""
+    # Create products table
+    c.execute(PRODUCTS_TABLE_SQL.format(name='products'))
+
     # Create shopping list table
     c.execute('''
         CREATE TABLE IF NOT EXISTS shopping_list (
@@ -142,7 +1545,7 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
+
     # Create barcode history table
     c.execute('''
         CREATE TABLE IF NOT EXISTS barcode_history (
@@ -158,138 +1561,1182 @@ def init_db():
             last_scanned TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
-    # Create indexes for better performance
+
+    # Create Open Food Facts lookup cache (raw product JSON, NULL payload = not found)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS off_cache (
+            ean TEXT PRIMARY KEY,
+            found INTEGER NOT NULL,
+            payload TEXT,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+
+    for table, columns in LEGACY_COLUMNS.items():
+        existing = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+        for column, declaration in columns:
+            if column not in existing:
+                print(f"Migrating {table}: Adding {column} column...")
+                c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+    rebuild_typed_products(c)
+
+def migrate_core_indexes(c):
+    """Index products and the shopping list for listings, filters and lookups."""
     c.execute('CREATE INDEX IF NOT EXISTS idx_expiry_date ON products(expiry_date)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_location ON products(location)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_name ON products(name)')
-    
-    # Migration: Check if weight_volume exists, if not add it
-    try:
-        c.execute('SELECT weight_volume FROM products LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding weight_volume column...")
-        c.execute('ALTER TABLE products ADD COLUMN weight_volume TEXT')
-    
-    # Migration: Add created_at if missing
-    try:
-        c.execute('SELECT created_at FROM products LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding created_at column...")
-        c.execute('ALTER TABLE products ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
-    
-    # Migration: Add price if missing
-    try:
-        c.execute('SELECT price FROM products LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding price column...")
-        c.execute('ALTER TABLE products ADD COLUMN price REAL DEFAULT 0.0')
-    
-    # Migration: Add image_url if missing
-    try:
-        c.execute('SELECT image_url FROM products LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding image_url column...")
-        c.execute('ALTER TABLE products ADD COLUMN image_url TEXT')
-    
-    # Migration: Add category if missing
-    try:
-        c.execute('SELECT category FROM products LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding category column...")
-        c.execute('ALTER TABLE products ADD COLUMN category TEXT')
-    
-    # Migration: Add tags if missing
-    try:
-        c.execute('SELECT tags FROM products LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding tags column...")
-        c.execute('ALTER TABLE products ADD COLUMN tags TEXT')
-    
-    # Migration: Add scan_count if missing
-    try:
-        c.execute('SELECT scan_count FROM products LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding scan_count column...")
-        c.execute('ALTER TABLE products ADD COLUMN scan_count INTEGER DEFAULT 0')
-    
-    # Migration: Add last_scanned if missing
-    try:
-        c.execute('SELECT last_scanned FROM products LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding last_scanned column...")
-        c.execute('ALTER TABLE products ADD COLUMN last_scanned TEXT')
-    
-    # Migrations for barcode_history
-    try:
-        c.execute('SELECT category FROM barcode_history LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating barcode_history: Adding category column...")
-        c.execute('ALTER TABLE barcode_history ADD COLUMN category TEXT')
-    
-    try:
-        c.execute('SELECT weight_volume FROM barcode_history LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating barcode_history: Adding weight_volume column...")
-        c.execute('ALTER TABLE barcode_history ADD COLUMN weight_volume TEXT')
-    
-    try:
-        c.execute('SELECT tags FROM barcode_history LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating barcode_history: Adding tags column...")
-        c.execute('ALTER TABLE barcode_history ADD COLUMN tags TEXT')
-    
-    try:
-        c.execute('SELECT is_vegetarian FROM barcode_history LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating barcode_history: Adding is_vegetarian column...")
-        c.execute('ALTER TABLE barcode_history ADD COLUMN is_vegetarian INTEGER DEFAULT 0')
-    
+    c.execute('CREATE INDEX IF NOT EXISTS idx_name_nocase ON products(name COLLATE NOCASE)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_shopping_list_name ON shopping_list(name)')
+    init_product_indexes(c)
+
+# Ordered schema migrations; PRAGMA user_version holds the last one applied.
+# Steps are idempotent so a half-upgraded database can always be upgraded again.
+MIGRATIONS = (
+    (1, 'Core tables and typed products', migrate_base_schema),
+    (2, 'Product and shopping list indexes', migrate_core_indexes),
+    (3, 'Unique barcode history', init_barcode_history_indexes),
+    (4, 'Full-text search', init_search_index),
+    (5, 'Statistics summary tables', init_statistics),
+    (6, 'Image reference counts', init_image_refs),
+    (7, 'Data version counters', init_data_versions),
+    (8, 'Change log for delta sync', init_change_log),
+    (9, 'Expiry buckets', init_expiry_buckets),
+    (10, 'Uniform scan timestamps', normalize_scan_timestamps),
+    (11, 'Statistics keep NULL apart', split_null_statistics),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_migrate_lock = threading.Lock()
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def upgrade_db(conn, target=SCHEMA_VERSION):
+    """Apply pending migrations up to target, each in its own write transaction.
+
+    BEGIN IMMEDIATE serializes concurrent upgraders (other workers or a CLI
+    run); a step already applied by someone else is skipped. Returns the
+    list of applied versions.
+    """
+    applied = []
+    with _migrate_lock:
+        current = get_schema_version(conn)
+        if current >= target:
+            return applied
+        if conn.in_transaction:
+            conn.commit()
+        for version, description, step in MIGRATIONS:
+            if version > target or version <= current:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if get_schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                print(f"Applying migration {version}: {description}...")
+                step(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.commit()
+            except BaseException:
+                # Also on KeyboardInterrupt, so the step never stays half-applied in an open transaction
+                conn.rollback()
+                raise
+            applied.append(version)
+    return applied
+
+@bp.before_app_request
+def check_schema_version():
+    """Verify the schema once per process; later requests skip the check.
+
+    With tenancy this is the shared database; household databases are
+    migrated when their pool is opened.
+    """
+    state = app_state()
+    if state.schema_ready:
+        return
+    conn = get_shared_db_connection()
+    if not conn:
+        abort(500, description="Database connection failed")
+    version = get_schema_version(conn)
+    if version < SCHEMA_VERSION:
+        if not current_app.config['AUTO_MIGRATE']:
+            abort(503, description=f"Database schema is at version {version}, expected {SCHEMA_VERSION}. "
+                                   f"Run 'flask --app app db upgrade'.")
+        upgrade_db(conn)
+    state.schema_ready = True
+
+# --- Open Food Facts Lookup ---
+
+# requests is imported on first use (about 40ms), so CLI commands and workers
+# that never look up a barcode do not pay for it.
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Failure-ratio circuit breaker over a sliding window of recent calls."""
+
+    def __init__(self, window=20, min_calls=5, threshold=0.5, reset_timeout=30):
+        self.min_calls = min_calls
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._rejected = 0
+        self._trips = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through right now."""
+        with self._lock:
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._rejected += 1
+                    raise CircuitOpenError("Open Food Facts circuit breaker is open")
+                self._state = 'half_open'
+            if self._state == 'half_open':
+                if self._trial_running:
+                    self._rejected += 1
+                    raise CircuitOpenError("Open Food Facts circuit breaker is half-open")
+                self._trial_running = True
+
+    def record(self, success):
+        with self._lock:
+            if self._state == 'half_open':
+                self._trial_running = False
+                if success:
+                    self._state = 'closed'
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.threshold):
+                self._trip()
+
+    def _trip(self):
+        self._state = 'open'
+        self._opened_at = time.monotonic()
+        self._trips += 1
+        self._outcomes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'state': self._state, 'recent_calls': len(self._outcomes),
+                    'recent_failures': self._outcomes.count(False),
+                    'rejected': self._rejected, 'trips': self._trips}
+
+
+def parse_off_response(data):
+    """Return the product of an OFF API response, or None if OFF does not know the EAN.
+
+    Any other shape raises InvalidJSONError, so it is handled like an upstream error.
+    """
+    import requests
+    if not isinstance(data, dict):
+        raise requests.exceptions.InvalidJSONError("Unexpected Open Food Facts response")
+    if data.get('status') != 1:
+        return None
+    product = data.get('product')
+    if not isinstance(product, dict):
+        raise requests.exceptions.InvalidJSONError("Open Food Facts response without product")
+    return product
+
+
+class OpenFoodFactsClient:
+    """Upstream client with keep-alive pooling, jittered retries and a circuit breaker."""
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=5, retries=2,
+                 backoff=0.25, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.pid = os.getpid()
+        import requests.adapters
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'SmartKitchenInventory/1.0'
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retried = 0
+
+    def _get(self, url):
+        import requests
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                self._requests += 1
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code not in self.RETRY_STATUS or attempt == self.retries:
+                    response.raise_for_status()
+                    return response
+                response.close()
+            except (requests.ConnectionError, requests.ConnectTimeout):
+                # Read timeouts are not retried: the worker already waited the full read timeout
+                if attempt == self.retries:
+                    raise
+            with self._lock:
+                self._retried += 1
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def get_product(self, ean):
+        """Fetch a product; returns the product dict or None if OFF does not know the EAN."""
+        import requests
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            self.breaker.before_call()
+            success = False
+            try:
+                response = self._get(f"{self.base_url}/api/v0/product/{ean}.json")
+                try:
+                    product = parse_off_response(response.json())
+                except ValueError as e:
+                    raise requests.exceptions.InvalidJSONError(str(e))
+                success = True
+            finally:
+                # Every outcome is recorded, so a half-open trial can never stay running
+                self.breaker.record(success)
+            outcome = 'found' if product else 'not_found'
+            return product
+        except CircuitOpenError:
+            outcome = 'circuit_open'
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            UPSTREAM_LATENCY.observe(duration, outcome)
+            record_timing('off', duration)
+
+    def close(self):
+        self.session.close()
+
+    def stats(self):
+        with self._lock:
+            counters = {'requests': self._requests, 'retries': self._retried}
+        return {'base_url': self.base_url, **counters, 'breaker': self.breaker.stats()}
+
+
+def get_off_client():
+    """Return this worker's upstream client, creating it after fork if needed."""
+    state = app_state()
+    client = state.off_client
+    if client is None or client.pid != os.getpid():
+        with state.lock:
+            if state.off_client is None or state.off_client.pid != os.getpid():
+                config = current_app.config
+                state.off_client = OpenFoodFactsClient(
+                    config['OFF_BASE_URL'],
+                    connect_timeout=config['OFF_CONNECT_TIMEOUT'],
+                    read_timeout=config['OFF_READ_TIMEOUT'],
+                    retries=config['OFF_RETRIES'],
+                    backoff=config['OFF_RETRY_BACKOFF'],
+                    pool_size=config['OFF_POOL_SIZE'],
+                    breaker=CircuitBreaker(
+                        window=config['OFF_BREAKER_WINDOW'],
+                        min_calls=config['OFF_BREAKER_MIN_CALLS'],
+                        threshold=config['OFF_BREAKER_THRESHOLD'],
+                        reset_timeout=config['OFF_BREAKER_RESET']
+                    )
+                )
+            client = state.off_client
+    return client
+
+def fetch_off_product(ean):
+    """Fetch a product from Open Food Facts; returns the product dict or None if unknown."""
+    return get_off_client().get_product(ean)
+
+def get_scan_executor():
+    """Return this worker's bounded thread pool for concurrent upstream lookups."""
+    state = app_state()
+    executor = state.scan_executor
+    if executor is None or executor.pid != os.getpid():
+        with state.lock:
+            if state.scan_executor is None or state.scan_executor.pid != os.getpid():
+                state.scan_executor = ThreadPoolExecutor(
+                    max_workers=current_app.config['SCAN_BATCH_WORKERS'], thread_name_prefix='off-lookup')
+                state.scan_executor.pid = os.getpid()
+            executor = state.scan_executor
+    return executor
+
+def describe_off_error(error):
+    """Map an upstream lookup failure to an HTTP status and user-facing message."""
+    if isinstance(error, CircuitOpenError):
+        return 503, 'Open Food Facts ist vorübergehend nicht erreichbar'
+    import requests
+    if isinstance(error, requests.Timeout):
+        return 504, 'API-Anfrage hat zu lange gedauert'
+    if isinstance(error, requests.RequestException):
+        return 502, 'Fehler bei der Verbindung zur externen API'
+    print(f"Unexpected error in OFF lookup: {error}")
+    return 500, 'Ein unerwarteter Fehler ist aufgetreten'
+
+def summarize_off_product(product):
+    """Extract the fields the UI and barcode history need from an OFF product."""
+    categories = product.get('categories') or ''
+    return {
+        'name': (product.get('product_name') or 'Unbekanntes Produkt')[:200],
+        'image_url': (product.get('image_url') or '')[:500],
+        'quantity': (product.get('quantity') or '')[:50],
+        'brands': (product.get('brands') or '')[:200],
+        'category': categories.split(',')[0].strip() if categories else '',
+        'is_vegetarian': 'vegetarian' in categories.lower(),
+        'is_vegan': 'vegan' in categories.lower()
+    }
+
+
+class _Flight:
+    """A pending upstream lookup that concurrent callers for the same EAN wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class OffProductCache:
+    """Two-tier (LRU + SQLite) cache for OFF lookups with negative caching.
+
+    Concurrent misses for the same EAN are coalesced into one upstream call,
+    and expired entries are still served when the upstream is unreachable.
+    """
+
+    def __init__(self, max_entries=2048, ttl=7 * 24 * 3600, negative_ttl=24 * 3600, wait_timeout=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ('memory_hits', 'db_hits', 'negative_hits', 'misses', 'coalesced', 'stale_served', 'upstream_errors'), 0)
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _is_fresh(self, entry):
+        ttl = self.ttl if entry['found'] else self.negative_ttl
+        return time.time() - entry['fetched_at'] < ttl
+
+    def _remember(self, ean, entry):
+        with self._lock:
+            self._entries[ean] = entry
+            self._entries.move_to_end(ean)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, conn, ean):
+        row = conn.execute('SELECT found, payload, fetched_at FROM off_cache WHERE ean = ?', (ean,)).fetchone()
+        if not row:
+            return None
+        return {
+            'found': bool(row['found']),
+            'product': json.loads(row['payload']) if row['payload'] else None,
+            'fetched_at': row['fetched_at']
+        }
+
+    def save(self, conn, ean, entry):
+        """Write an entry to the off_cache table; the caller commits."""
+        conn.execute('''
+            INSERT OR REPLACE INTO off_cache (ean, found, payload, fetched_at) VALUES (?, ?, ?, ?)
+        ''', (ean, 1 if entry['found'] else 0,
+              json.dumps(entry['product'], ensure_ascii=False) if entry['product'] else None,
+              entry['fetched_at']))
+
+    def save_many(self, conn, entries):
+        """save() every entry of an {ean: entry} dict; the caller commits."""
+        for ean, entry in entries.items():
+            self.save(conn, ean, entry)
+
+    def peek(self, ean, conn=None):
+        """Return a fresh cached entry without going upstream, or None."""
+        with self._lock:
+            entry = self._entries.get(ean)
+            if entry is not None:
+                self._entries.move_to_end(ean)
+        if entry is not None and self._is_fresh(entry):
+            self.count('negative_hits' if not entry['found'] else 'memory_hits')
+            return entry
+
+        if conn is not None:
+            stored = self._load(conn, ean)
+            if stored is not None:
+                # Expired entries stay in memory too, for fallback() calls without a connection
+                self._remember(ean, stored)
+            if stored is not None and self._is_fresh(stored):
+                self.count('negative_hits' if not stored['found'] else 'db_hits')
+                return stored
+        return None
+
+    def lookup(self, ean, fetch, conn=None, save=None):
+        """Return the cache entry for an EAN, calling fetch(ean) on a miss.
+
+        conn is only read from; save(ean, entry) persists a fetched entry
+        (see save_off_entry()).
+        """
+        entry = self.peek(ean, conn)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            flight = self._inflight.get(ean)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[ean] = _Flight()
+                self._counters['misses'] += 1
+            else:
+                self._counters['coalesced'] += 1
+
+        import requests
+        if not leader:
+            if not flight.event.wait(self.wait_timeout):
+                raise requests.Timeout(f"Timed out waiting for concurrent lookup of {ean}")
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry
+
+        try:
+            try:
+                product = fetch(ean)
+            except (requests.RequestException, CircuitOpenError):
+                flight.entry = self.fallback(ean, conn)
+                if flight.entry is None:
+                    raise
+                return flight.entry
+
+            flight.entry = self.record(ean, product)
+            if save is not None:
+                save(ean, flight.entry)
+            return flight.entry
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(ean, None)
+            flight.event.set()
+
+    def record(self, ean, product):
+        """Cache an upstream result (None = unknown EAN) in memory; save() persists it."""
+        entry = {'found': product is not None, 'product': product, 'fetched_at': time.time()}
+        self._remember(ean, entry)
+        return entry
+
+    def fallback(self, ean, conn=None):
+        """After an upstream failure, return the expired entry marked stale, or None."""
+        self.count('upstream_errors')
+        stale = self._entries.get(ean) or (self._load(conn, ean) if conn is not None else None)
+        if stale is None:
+            return None
+        self.count('stale_served')
+        return dict(stale, stale=True)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'inflight': len(self._inflight), **self._counters}
+
+
+def get_off_cache():
+    """Return the process-wide OFF lookup cache."""
+    state = app_state()
+    if state.off_cache is None:
+        with state.lock:
+            if state.off_cache is None:
+                state.off_cache = OffProductCache(
+                    max_entries=current_app.config['OFF_CACHE_SIZE'],
+                    ttl=current_app.config['OFF_CACHE_TTL'],
+                    negative_ttl=current_app.config['OFF_NEGATIVE_CACHE_TTL']
+                )
+    return state.off_cache
+
+# --- Change Events ---
+
+class ChangeBroadcaster:
+    """Per-process thread that watches the change log and fans out to event stream subscribers.
+
+    One cheap PRAGMA data_version check per interval serves every connected
+    client; nothing is polled while no client listens.
+    """
+
+    def __init__(self, database, interval=0.5, queue_size=64):
+        self.database = database
+        self.interval = interval
+        self.queue_size = queue_size
+        self.pid = os.getpid()
+        self.seq = 0
+        self._subscribers = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._published = 0
+        self._dropped = 0
+
+    def subscribe(self, subscriber=None):
+        """Register a client queue (a new queue.Queue of queue_size unless given).
+
+        It receives event dicts, or None when it fell behind.
+        """
+        if subscriber is None:
+            subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._cond:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='change-broadcaster', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    def client_count(self):
+        with self._cond:
+            return len(self._subscribers)
+
+    def _publish(self, event):
+        with self._cond:
+            subscribers = list(self._subscribers)
+            self._published += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client is disconnected and resumes via Last-Event-ID
+                self.unsubscribe(subscriber)
+                with self._cond:
+                    self._dropped += 1
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(None)
+
+    def _run(self):
+        conn = None
+        data_version = None
+        while True:
+            with self._cond:
+                while not self._subscribers:
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    self._cond.wait()
+            try:
+                if conn is None:
+                    conn = sqlite3.connect(self.database, timeout=5, check_same_thread=False)
+                    self.seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+                    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+
+                # data_version only moves when another connection committed
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                if current != data_version:
+                    data_version = current
+                    rows = conn.execute(CHANGE_BACKLOG_SQL, (self.seq,)).fetchall()
+                    if rows:
+                        self.seq = max(row[2] for row in rows)
+                        self._publish({'seq': self.seq, 'tables': {row[0]: row[1] for row in rows}})
+            except sqlite3.Error as e:
+                print(f"Change broadcaster error: {e}")
+                if conn is not None:
+                    conn.close()
+                    conn = None
+            time.sleep(self.interval)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'clients': len(self._subscribers),
+                'seq': self.seq,
+                'published': self._published,
+                'dropped': self._dropped
+            }
+
+
+def get_broadcaster():
+    """Return this worker's change broadcaster for the current database, creating it after fork if needed."""
+    state = app_state()
+    database = current_database()
+    broadcaster = state.broadcasters.get(database)
+    if broadcaster is None or broadcaster.pid != os.getpid():
+        with state.lock:
+            broadcaster = state.broadcasters.get(database)
+            if broadcaster is None or broadcaster.pid != os.getpid():
+                broadcaster = state.broadcasters[database] = ChangeBroadcaster(
+                    database, interval=current_app.config['EVENTS_POLL_INTERVAL'])
+    return broadcaster
+
+def event_stats():
+    """Event stream counters of this worker, summed over all databases."""
+    totals = {'databases': 0, 'clients': 0, 'published': 0, 'dropped': 0}
+    for broadcaster in list(app_state().broadcasters.values()):
+        if broadcaster.pid != os.getpid():
+            continue
+        stats = broadcaster.stats()
+        totals['databases'] += 1
+        for key in ('clients', 'published', 'dropped'):
+            totals[key] += stats[key]
+    return totals
+
+def format_change_event(event):
+    """Render a broadcaster event in text/event-stream framing."""
+    return f"id: {event['seq']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+
+EVENT_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# Tables changed after a sequence number; also polled by the change broadcaster. NOT INDEXED keeps
+# SQLite on the seq range instead of walking all of idx_change_log_row for the GROUP BY.
+CHANGE_BACKLOG_SQL = 'SELECT table_name, COUNT(*), MAX(seq) FROM change_log NOT INDEXED WHERE seq > ? GROUP BY table_name'
+
+def parse_event_id(value):
+    """Last-Event-ID (or ?since=) as a change sequence number, None if absent; aborts with 400 if malformed."""
     try:
-        c.execute('SELECT is_vegan FROM barcode_history LIMIT 1')
-    except sqlite3.OperationalError:
-        print("Migrating barcode_history: Adding is_vegan column...")
-        c.execute('ALTER TABLE barcode_history ADD COLUMN is_vegan INTEGER DEFAULT 0')
-        
-    conn.commit()
-    conn.close()
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        abort(400, description="Last-Event-ID must be a change sequence number")
+
+def change_backlog(conn, last_id):
+    """Event covering the changes logged after last_id, or None if there are none."""
+    rows = conn.execute(CHANGE_BACKLOG_SQL, (last_id,)).fetchall()
+    if not rows:
+        return None
+    return {'seq': max(row[2] for row in rows), 'tables': {row[0]: row[1] for row in rows}}
+
+def short_poll_events(conn, last_id):
+    """Complete event stream body for a client that gets no stream: the changes since last_id, then the end.
+
+    The retry field has the browser ask again after EVENTS_SHORT_POLL_RETRY
+    seconds with Last-Event-ID; without changes an id-only message moves that
+    id to the newest sequence number.
+    """
+    body = f"retry: {current_app.config['EVENTS_SHORT_POLL_RETRY'] * 1000}\n\n"
+    backlog = change_backlog(conn, last_id) if last_id is not None else None
+    if backlog:
+        return body + format_change_event(backlog)
+    latest = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    return body + f"id: {latest}\n\n"
+
+# --- Expiry Buckets ---
+
+def expiry_buckets_stale(conn, today=None):
+    """Tell whether expiry_buckets predates today or the last product write."""
+    today = today or datetime.now().date()
+    row = conn.execute('''
+        SELECT (SELECT value FROM sync_state WHERE key = 'expiry_buckets_date'),
+               (SELECT value FROM sync_state WHERE key = 'expiry_buckets_version'),
+               (SELECT version FROM data_versions WHERE name = 'products')
+    ''').fetchone()
+    return row[0] != int(today.strftime('%Y%m%d')) or row[1] != row[2]
+
+EXPIRY_BUCKET_CASE = ' '.join(
+    f"WHEN julianday(expiry_date) - julianday(:today) <= {days} THEN '{name}'" for name, days in EXPIRY_BUCKETS
+)
+# Products expiring up to :horizon, one pass over the expiry_date index
+EXPIRY_BUCKETS_REFRESH_SQL = f'''
+    INSERT INTO expiry_buckets (product_id, bucket, days_left)
+    SELECT id, CASE {EXPIRY_BUCKET_CASE} END, CAST(julianday(expiry_date) - julianday(:today) AS INTEGER)
+    FROM products
+    WHERE expiry_date > '' AND expiry_date <= :horizon AND julianday(expiry_date) IS NOT NULL
+'''
+
+def refresh_expiry_buckets(conn, today=None, auto_shopping=False):
+    """Recompute expiry_buckets in one pass over the expiry_date index; the caller commits.
+
+    With auto_shopping, products that newly fell into 'expired' are put on the
+    shopping list unless an item of that name is already there. Returns the
+    bucket sizes and the number of shopping items added.
+    """
+    today = today or datetime.now().date()
+    horizon = (today + timedelta(days=EXPIRY_BUCKETS[-1][1])).isoformat()
+    c = conn.cursor()
+
+    previously_expired = {row[0] for row in c.execute(
+        "SELECT product_id FROM expiry_buckets WHERE bucket = 'expired'"
+    )}
+    version = c.execute("SELECT version FROM data_versions WHERE name = 'products'").fetchone()[0]
+
+    c.execute('DELETE FROM expiry_buckets')
+    c.execute(EXPIRY_BUCKETS_REFRESH_SQL, {'today': today.isoformat(), 'horizon': horizon})
+
+    added = 0
+    if auto_shopping:
+        newly_expired = [row for row in c.execute('''
+            SELECT b.product_id, p.name, p.category FROM expiry_buckets b
+            JOIN products p ON p.id = b.product_id
+            WHERE b.bucket = 'expired'
+        ''').fetchall() if row[0] not in previously_expired]
+        for _, name, category in newly_expired:
+            c.execute('''
+                INSERT INTO shopping_list (name, quantity, category, notes)
+                SELECT ?, 1, ?, 'Auto-generiert (abgelaufen)'
+                WHERE NOT EXISTS (SELECT 1 FROM shopping_list WHERE name = ?)
+            ''', (name, category, name))
+            added += c.rowcount
+
+    c.execute("UPDATE sync_state SET value = ? WHERE key = 'expiry_buckets_date'", (int(today.strftime('%Y%m%d')),))
+    c.execute("UPDATE sync_state SET value = ? WHERE key = 'expiry_buckets_version'", (version,))
+    counts = dict(c.execute('SELECT bucket, COUNT(*) FROM expiry_buckets GROUP BY bucket').fetchall())
+    return {name: counts.get(name, 0) for name, _ in EXPIRY_BUCKETS}, added
+
+def refresh_stale_expiry_buckets(conn, auto_shopping=False):
+    """run_write() function: refresh_expiry_buckets() unless another writer already did; None then."""
+    if expiry_buckets_stale(conn):
+        return refresh_expiry_buckets(conn, auto_shopping=auto_shopping)
+    return None
+
+def ensure_expiry_buckets(conn):
+    """Refresh expiry_buckets if stale, so readers never see yesterday's buckets.
+
+    conn only checks; the refresh is a run_write() write.
+    """
+    if expiry_buckets_stale(conn):
+        run_write(refresh_stale_expiry_buckets, current_app.config['AUTO_SHOPPING_LIST'])
+
+
+def claim_daily_maintenance(conn, today=None):
+    """Claim today's maintenance run; True only for the first caller of the day (the caller commits)."""
+    today = today or datetime.now().date()
+    return conn.execute('''
+        INSERT INTO sync_state (key, value) VALUES ('maintenance_date', ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value WHERE value < excluded.value
+    ''', (int(today.strftime('%Y%m%d')),)).rowcount > 0
+
+def maintenance_due(conn, today=None):
+    """Tell whether today's maintenance is still unclaimed, without opening a write transaction."""
+    today = today or datetime.now().date()
+    row = conn.execute("SELECT value FROM sync_state WHERE key = 'maintenance_date'").fetchone()
+    return row is None or row[0] < int(today.strftime('%Y%m%d'))
+
+def run_daily_maintenance(conn, retention_days):
+    """run_write() function: claim and compact; returns (entries removed, referenced images) or None."""
+    if not claim_daily_maintenance(conn):
+        return None
+    removed, _ = compact_change_log(conn, retention_days)
+    return removed, image_references(conn)
+
+
+class ExpiryScheduler:
+    """Daemon thread refreshing expiry_buckets after midnight and after product writes.
+
+    With DAILY_MAINTENANCE the first worker to check each day also compacts the
+    change log and deletes orphaned uploads (compact-changes and gc-images).
+    It reads on a pooled connection and writes through run_write(), so with
+    WRITE_QUEUE its writes go through the writer thread like any request's.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['EXPIRY_CHECK_INTERVAL']
+        self.auto_shopping = app.config['AUTO_SHOPPING_LIST']
+        self.maintenance = app.config['DAILY_MAINTENANCE']
+        self.pid = os.getpid()
+        self.refreshes = 0
+        self.last_refresh = None
+        self.last_maintenance = None
+        self._thread = threading.Thread(target=self._run, name='expiry-scheduler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def run_once(self, conn):
+        """Refresh the buckets if stale; returns (counts, added) or None. Needs an app context."""
+        if not expiry_buckets_stale(conn):
+            return None
+        result = run_write(refresh_stale_expiry_buckets, self.auto_shopping)
+        if result is None:
+            return None
+        counts, added = result
+        self.refreshes += 1
+        self.last_refresh = datetime.now().isoformat(timespec='seconds')
+        return counts, added
+
+    def maintain(self, conn):
+        """Run the daily maintenance unless a worker did today; returns (change log entries, images) removed.
+
+        Needs an app context. The files are deleted after the write has committed.
+        """
+        if not maintenance_due(conn):
+            return None
+        result = run_write(run_daily_maintenance, self.app.config['CHANGE_LOG_RETENTION_DAYS'])
+        if result is None:
+            return None
+        removed, referenced = result
+        images = sweep_orphan_images(referenced)
+        self.last_maintenance = datetime.now().isoformat(timespec='seconds')
+        return removed, images
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    conn = get_db_connection()
+                    if conn is not None:
+                        self.run_once(conn)
+                        if self.maintenance:
+                            self.maintain(conn)
+            except Exception:
+                # Any error ends only this round; the thread is never restarted
+                self.app.logger.exception("Expiry scheduler error")
+            time.sleep(self.interval)
+
+
+def get_expiry_scheduler():
+    """Start this worker's expiry scheduler on first use."""
+    state = app_state()
+    scheduler = state.expiry_scheduler
+    if scheduler is None or scheduler.pid != os.getpid():
+        with state.lock:
+            if state.expiry_scheduler is None or state.expiry_scheduler.pid != os.getpid():
+                state.expiry_scheduler = ExpiryScheduler(current_app._get_current_object()).start()
+            scheduler = state.expiry_scheduler
+    return scheduler
+
+@bp.before_app_request
+def start_expiry_scheduler():
+    """Make sure the expiry scheduler runs in this worker (not per household: readers refresh stale buckets)."""
+    if current_app.config['EXPIRY_SCHEDULER'] and not current_app.config['TENANCY']:
+        get_expiry_scheduler()
 
 # --- Error Handling ---
 
-@app.errorhandler(400)
+@bp.app_errorhandler(400)
 def bad_request(error):
     return jsonify({'error': 'Bad Request', 'message': str(error.description)}), 400
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Not Found', 'message': str(error.description)}), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     return jsonify({'error': 'Internal Server Error', 'message': 'An unexpected error occurred.'}), 500
 
+@bp.app_errorhandler(503)
+def service_unavailable(error):
+    return jsonify({'error': 'Service Unavailable', 'message': str(error.description)}), 503
+
+# --- Conditional GET ---
+
+def versioned(*tables, daily=False):
+    """Answer If-None-Match with 304 when none of the given tables changed.
+
+    The ETag covers the tables' data versions, the full request path, the
+    household and, for date-dependent results, today's date. The view is
+    only called when the client's copy is stale.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            conn = get_db_connection()
+            if not conn:
+                return view(*args, **kwargs)
+            try:
+                rows = conn.execute(
+                    f"SELECT name, version FROM data_versions WHERE name IN ('_epoch', {','.join('?' * len(tables))})",
+                    tables
+                ).fetchall()
+            except sqlite3.Error as e:
+                print(f"Data version lookup error: {e}")
+                return view(*args, **kwargs)
+
+            key = '|'.join(f"{row['name']}={row['version']}" for row in sorted(rows, key=lambda r: r['name']))
+            key += f"|{request.full_path}|{current_tenant() or ''}"
+            if daily:
+                key += f"|{datetime.now().strftime('%Y-%m-%d')}"
+            etag = g.etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            if current_app.config['TENANCY']:
+                response.vary.update((current_app.config['TENANT_HEADER'], 'Cookie'))
+            return response
+        return wrapper
+    return decorator
+
+class PayloadCache:
+    """Thread-safe LRU of serialized response bodies, bounded by their total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._too_large = 0
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return payload
+
+    def put(self, key, payload):
+        with self._lock:
+            if len(payload) > self.max_bytes:
+                self._too_large += 1
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = payload
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hits': self._hits, 'misses': self._misses, 'too_large': self._too_large}
+
+
+def get_payload_cache():
+    """Return this app's payload cache, or None when PAYLOAD_CACHE_BYTES is 0."""
+    state = app_state()
+    if state.payload_cache is None and current_app.config['PAYLOAD_CACHE_BYTES'] > 0:
+        with state.lock:
+            if state.payload_cache is None:
+                state.payload_cache = PayloadCache(current_app.config['PAYLOAD_CACHE_BYTES'])
+    return state.payload_cache
+
+def cached_payload(view):
+    """Serve the view's 200 body from the payload cache while its ETag is unchanged.
+
+    Goes below @versioned, whose ETag already changes with every write to
+    the tables, the request path and the household, so entries never need
+    explicit invalidation.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = g.get('etag')
+        cache = get_payload_cache()
+        if key is None or cache is None:
+            return view(*args, **kwargs)
+        payload = cache.get(key)
+        if payload is not None:
+            return Response(payload, mimetype='application/json')
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            cache.put(key, response.get_data())
+        return response
+    return wrapper
+
+@bp.after_app_request
+def cache_uploaded_images(response):
+    """Uploaded files never change under their name, so let clients cache them for good."""
+    if request.path.startswith('/static/uploads/') and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 # --- Routes ---
 
-@app.route('/')
+@bp.route('/')
 def index():
-    return render_template('index.html')
+    response = make_response(render_template('index.html'))
+    # Browsers cannot send the household header, so /?household=<id> stores it in a cookie
+    tenant = parse_tenant(request.args.get('household'))
+    if tenant and current_app.config['TENANCY']:
+        response.set_cookie(TENANT_COOKIE, tenant, max_age=365 * 24 * 3600, samesite='Lax')
+    return response
+
+@bp.route('/static/uploads/<path:filename>')
+def uploaded_file(filename):
+    """Serve uploads from UPLOADS_DIR, which need not lie inside the static folder."""
+    return send_from_directory(uploads_dir(), filename)
+
+# Sort keys for the paginated product listing: (column, descending, may be empty).
+# Products without a value for a nullable column are always listed last.
+PRODUCT_SORTS = {
+    'expiry': ('expiry_date', False, True),
+    'expiry_desc': ('expiry_date', True, True),
+    'name': ('name', False, False),
+    'name_desc': ('name', True, False),
+    'location': ('location', False, True),
+    'created': ('id', True, False)
+}
+PRODUCT_PAGE_ARGS = ('search', 'location', 'category', 'expiry_from', 'expiry_to', 'sort', 'cursor', 'limit')
 
-@app.route('/api/products', methods=['GET'])
+def encode_cursor(sort, value, row_id):
+    """Encode a keyset position as an opaque URL-safe token."""
+    raw = json.dumps({'s': sort, 'v': value, 'id': row_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, sort):
+    """Decode a cursor token, rejecting tokens issued for another sort order."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if cursor['s'] != sort or not isinstance(cursor['id'], int):
+            raise ValueError('sort mismatch')
+        return cursor
+    except (ValueError, KeyError, TypeError):
+        abort(400, description="Invalid cursor")
+
+PRODUCTS_FTS_FILTER = 'id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)'
+
+def build_product_filters(args):
+    """Translate listing query parameters into SQL conditions and parameters."""
+    conditions = []
+    params = []
+
+    search = build_fts_query(sanitize_input(args.get('search'), 200))
+    if search:
+        conditions.append(PRODUCTS_FTS_FILTER)
+        params.append(search)
+
+    for column, key in (('location', 'location'), ('category', 'category')):
+        values = [sanitize_input(v, 100) for v in args.getlist(key) if v]
+        if values:
+            conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+
+    try:
+        expiry_from = normalize_date(args.get('expiry_from'))
+        expiry_to = normalize_date(args.get('expiry_to'))
+    except ValueError as e:
+        abort(400, description=str(e))
+    if expiry_from or expiry_to:
+        conditions.append("expiry_date > ''")
+    if expiry_from:
+        conditions.append('expiry_date >= ?')
+        params.append(expiry_from)
+    if expiry_to:
+        conditions.append('expiry_date <= ?')
+        params.append(expiry_to)
+
+    return conditions, params
+
+def product_page_queries(conditions, params, sort, cursor):
+    """SQL and parameters (all but the LIMIT) of a keyset page: rows with a sort value, then rows without.
+
+    Either query is None when the page cannot contain such rows.
+    """
+    column, descending, nullable = PRODUCT_SORTS[sort]
+    direction = 'DESC' if descending else 'ASC'
+    op = '<' if descending else '>'
+    in_empty_tail = nullable and cursor is not None and cursor['v'] is None
+    valued = empty = None
+
+    if not in_empty_tail:
+        where = list(conditions)
+        values = list(params)
+        if nullable:
+            where.append(f"{column} > ''")
+        if cursor is not None:
+            if column == 'id':
+                where.append(f'id {op} ?')
+                values.append(cursor['id'])
+            else:
+                where.append(f'({column}, id) {op} (?, ?)')
+                values.extend([cursor['v'], cursor['id']])
+        valued = (f'SELECT * FROM products WHERE {" AND ".join(where) or "1"} '
+                  f'ORDER BY {column} {direction}, id {direction} LIMIT ?', values)
+
+    if nullable:
+        # Rows without a sort value come after all others, ordered by id
+        where = list(conditions) + [f"({column} IS NULL OR {column} = '')"]
+        values = list(params)
+        if in_empty_tail:
+            where.append(f'id {op} ?')
+            values.append(cursor['id'])
+        empty = (f'SELECT * FROM products WHERE {" AND ".join(where)} ORDER BY id {direction} LIMIT ?', values)
+    return valued, empty
+
+def product_count_query(conditions, params):
+    """SQL and parameters counting all products matching the listing filters."""
+    return f'SELECT COUNT(*) FROM products WHERE {" AND ".join(conditions) or "1"}', list(params)
+
+def fetch_product_page(conn, conditions, params, sort, cursor, limit):
+    """Fetch one keyset page; returns the rows and the cursor of the next page."""
+    valued, empty = product_page_queries(conditions, params, sort, cursor)
+    rows = []
+    if valued is not None:
+        rows = conn.execute(valued[0], valued[1] + [limit + 1]).fetchall()
+    if empty is not None and len(rows) <= limit:
+        rows += conn.execute(empty[0], empty[1] + [limit + 1 - len(rows)]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        column = PRODUCT_SORTS[sort][0]
+        value = last[column] if column != 'id' else last['id']
+        next_cursor = encode_cursor(sort, value if value not in (None, '') else None, last['id'])
+    return rows, next_cursor
+
+def product_json_sql(conn):
+    """json_object() over every products column, keys sorted like jsonify() sorts them."""
+    columns = sorted(row['name'] for row in conn.execute('PRAGMA table_info(products)'))
+    pairs = ', '.join(f"'{column}', {column}" for column in columns)
+    return f'json_object({pairs})'
+
+@bp.route('/api/products', methods=['GET'])
+@versioned('products')
+@cached_payload
 def get_products():
-    """Retrieve all products."""
+    """Retrieve products; filtered, sorted and paginated when query parameters are given."""
     conn = get_db_connection()
     if not conn:
         abort(500, description="Database connection failed")
-    
+
+    paginated = any(key in request.args for key in PRODUCT_PAGE_ARGS)
+
     try:
-        products = conn.execute('SELECT * FROM products').fetchall()
-        return jsonify([dict(ix) for ix in products]), 200
+        if not paginated:
+            # SQLite builds the whole array; no Row or dict per product on the Python side
+            payload = conn.execute(
+                f'SELECT CAST(json_group_array({product_json_sql(conn)}) AS BLOB) FROM products'
+            ).fetchone()[0]
+            return Response(payload, mimetype='application/json')
+
+        sort = request.args.get('sort', 'expiry')
+        if sort not in PRODUCT_SORTS:
+            abort(400, description=f"Invalid sort key. Allowed: {', '.join(PRODUCT_SORTS)}")
+        limit = request.args.get('limit', 50, type=int)
+        if limit is None or limit < 1 or limit > 500:
+            abort(400, description="Limit must be between 1 and 500")
+        cursor = request.args.get('cursor')
+        cursor = decode_cursor(cursor, sort) if cursor else None
+
+        conditions, params = build_product_filters(request.args)
+        rows, next_cursor = fetch_product_page(conn, conditions, params, sort, cursor, limit)
+        total = conn.execute(*product_count_query(conditions, params)).fetchone()[0]
+
+        return jsonify({
+            'items': [dict(row) for row in rows],
+            'next_cursor': next_cursor,
+            'total': total
+        }), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/products', methods=['POST'])
+@bp.route('/api/products', methods=['POST'])
 def add_product():
     """Create a new product."""
     if not request.json:
@@ -298,68 +2745,31 @@ def add_product():
     data = request.json
     
     # Validation
-    name = sanitize_input(data.get('name'), 200)
-    if not name:
-        abort(400, description="Product name is required")
-    
-    # Validate quantity
     try:
-        quantity = int(data.get('quantity', 1))
-        if quantity < 1 or quantity > 9999:
-            abort(400, description="Quantity must be between 1 and 9999")
-    except (ValueError, TypeError):
-        abort(400, description="Invalid quantity")
+        values = validate_product(data, 'create')
+    except ValueError as e:
+        abort(400, description=str(e))
 
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
+    # Handle image storage (base64 images are saved to the uploads folder)
+    values['image_url'] = prepare_image(data.get('image_url') or '') or ''
 
-    try:
+    def insert(conn):
         c = conn.cursor()
-        
-        # Handle image storage
-        image_url = data.get('image_url', '')
-        image_filename = ''
-        if image_url and image_url.startswith('data:image'):
-            # Save base64 image to file
-            image_filename = save_base64_image(image_url)
-            image_url = f'/static/uploads/{image_filename}' if image_filename else ''
-        
-        c.execute('''
-            INSERT INTO products (ean, name, expiry_date, purchase_date, location, quantity, weight_volume, notes, is_vegetarian, is_vegan, price, image_url, category, tags)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            sanitize_input(data.get('ean'), 50),
-            name,
-            sanitize_input(data.get('expiry_date'), 20),
-            sanitize_input(data.get('purchase_date', datetime.now().strftime('%Y-%m-%d')), 20),
-            sanitize_input(data.get('location'), 100),
-            quantity,
-            sanitize_input(data.get('weight_volume'), 50),
-            sanitize_input(data.get('notes'), 1000),
-            1 if data.get('is_vegetarian') else 0,
-            1 if data.get('is_vegan') else 0,
-            float(data.get('price', 0.0)),
-            image_url,
-            sanitize_input(data.get('category'), 50),
-            sanitize_input(data.get('tags'), 200)
-        ))
-        
+        c.execute(PRODUCT_INSERT_SQL, tuple(values[col] for col in PRODUCT_COLUMNS))
+
         # Update barcode history with full product metadata
-        ean = data.get('ean')
-        if ean:
-            update_barcode_history(conn, ean, name, data.get('category'), data.get('weight_volume'), 
-                                 data.get('tags'), data.get('is_vegetarian'), data.get('is_vegan'))
-        conn.commit()
-        new_id = c.lastrowid
+        if values['ean']:
+            update_barcode_history(conn, values['ean'], values['name'], values['category'], values['weight_volume'],
+                                   values['tags'], values['is_vegetarian'], values['is_vegan'])
+        return c.lastrowid
+
+    try:
+        new_id = run_write(insert)
         return jsonify({'id': new_id, 'message': 'Produkt erfolgreich erstellt'}), 201
     except sqlite3.Error as e:
-        conn.rollback()
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/products/<int:id>', methods=['PUT'])
+@bp.route('/api/products/<int:id>', methods=['PUT'])
 def update_product(id):
     """Update an existing product."""
     if not request.json:
@@ -368,86 +2778,36 @@ def update_product(id):
     data = request.json
     
     # Validation
-    name = sanitize_input(data.get('name'), 200)
-    if not name:
-        abort(400, description="Product name is required")
-    
     try:
-        quantity = int(data.get('quantity', 1))
-        if quantity < 1 or quantity > 9999:
-            abort(400, description="Quantity must be between 1 and 9999")
-    except (ValueError, TypeError):
-        abort(400, description="Invalid quantity")
+        values = validate_product(data, 'update')
+    except ValueError as e:
+        abort(400, description=str(e))
     
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
+    # Handle image storage; if a base64 image cannot be saved the current one stays
+    image_url = prepare_image(data.get('image_url') or '')
+    if image_url is not None:
+        values['image_url'] = image_url
 
-    try:
-        # Check if product exists and get current image
-        product = conn.execute('SELECT id, image_url FROM products WHERE id = ?', (id,)).fetchone()
-        if not product:
+    def update(conn):
+        # Check if product exists
+        if not conn.execute('SELECT 1 FROM products WHERE id = ?', (id,)).fetchone():
             abort(404, description=f"Product with ID {id} not found")
 
-        # Handle image storage
-        image_url = data.get('image_url', '')
-        old_image = product['image_url']
-        
-        if image_url and image_url.startswith('data:image'):
-            # New base64 image - save it
-            image_filename = save_base64_image(image_url)
-            image_url = f'/static/uploads/{image_filename}' if image_filename else old_image
-            # Delete old image if exists
-            if old_image and old_image.startswith('/static/uploads/'):
-                delete_image(old_image)
-        elif not image_url and old_image:
-            # Image was removed
-            if old_image.startswith('/static/uploads/'):
-                delete_image(old_image)
-            image_url = ''
-        elif not image_url:
-            # Keep old image
-            image_url = old_image or ''
+        assignments = ', '.join(f'{col} = ?' for col in values)
+        conn.execute(f'UPDATE products SET {assignments} WHERE id = ?', (*values.values(), id))
 
-        conn.execute('''
-            UPDATE products SET 
-                name = ?, expiry_date = ?, purchase_date = ?, location = ?, 
-                quantity = ?, weight_volume = ?, notes = ?, is_vegetarian = ?, is_vegan = ?, price = ?, image_url = ?, category = ?, tags = ?
-            WHERE id = ?
-        ''', (
-            name,
-            sanitize_input(data.get('expiry_date'), 20),
-            sanitize_input(data.get('purchase_date'), 20),
-            sanitize_input(data.get('location'), 100),
-            quantity,
-            sanitize_input(data.get('weight_volume'), 50),
-            sanitize_input(data.get('notes'), 1000),
-            1 if data.get('is_vegetarian') else 0,
-            1 if data.get('is_vegan') else 0,
-            float(data.get('price', 0.0)),
-            image_url,
-            sanitize_input(data.get('category'), 50),
-            sanitize_input(data.get('tags'), 200),
-            id
-        ))
-        conn.commit()
+    try:
+        run_write(update)
         return jsonify({'message': 'Produkt erfolgreich aktualisiert'}), 200
     except sqlite3.Error as e:
-        conn.rollback()
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/products/<int:id>', methods=['DELETE'])
+@bp.route('/api/products/<int:id>', methods=['DELETE'])
 def delete_product(id):
     """Delete a product but preserve barcode history."""
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
-
-    try:
-        # Check if product exists and get image
-        product = conn.execute('SELECT image_url, ean, name, category, weight_volume, tags, is_vegetarian, is_vegan FROM products WHERE id = ?', (id,)).fetchone()
+    def delete(conn):
+        # Check if product exists
+        product = conn.execute('SELECT ean, name, category, weight_volume, tags, is_vegetarian, is_vegan FROM products WHERE id = ?', (id,)).fetchone()
         if not product:
             abort(404, description=f"Product with ID {id} not found")
 
@@ -457,55 +2817,211 @@ def delete_product(id):
                                  product['weight_volume'], product['tags'], 
                                  product['is_vegetarian'], product['is_vegan'])
         
-        # Delete image file if exists
-        if product['image_url'] and product['image_url'].startswith('/static/uploads/'):
-            delete_image(product['image_url'])
-        
         conn.execute('DELETE FROM products WHERE id = ?', (id,))
-        conn.commit()
+
+    try:
+        # The image file stays until gc-images finds it unreferenced
+        run_write(delete)
         return jsonify({'message': 'Produkt erfolgreich gelöscht'}), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/products/batch', methods=['POST'])
+BATCH_ITEM_OPERATIONS = ('create', 'update', 'patch', 'quantity_delta')
+
+def batch_create(conn, items, images, results, history_rows):
+    """Validate and insert new products with a single executemany (images from prepare_batch_images())."""
+    rows = []
+    indexes = []
+    for index, item in enumerate(items):
+        try:
+            values = validate_product(item, 'create')
+        except ValueError as e:
+            results.append({'index': index, 'status': 'error', 'error': str(e)})
+            continue
+        values['image_url'] = images[index] or ''
+        rows.append(tuple(values[col] for col in PRODUCT_COLUMNS))
+        indexes.append(index)
+        if values['ean']:
+            history_rows.append((values['ean'], values['name'], values['category'], values['weight_volume'],
+                                 values['tags'], values['is_vegetarian'], values['is_vegan']))
+    if not rows:
+        return
+
+    conn.executemany(PRODUCT_INSERT_SQL, rows)
+    # The transaction holds the write lock, so AUTOINCREMENT ids are consecutive
+    last_id = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'products'").fetchone()[0]
+    first_id = last_id - len(rows) + 1
+    for offset, index in enumerate(indexes):
+        results.append({'index': index, 'status': 'ok', 'id': first_id + offset})
+
+def batch_modify(conn, items, images, mode, results):
+    """Validate and apply full updates or partial patches, grouped by the columns they set."""
+    ids = [item.get('id') for item in items if isinstance(item, dict) and isinstance(item.get('id'), int)]
+    current = set()
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        current.update(row['id'] for row in conn.execute(
+            f"SELECT id FROM products WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+
+    statements = {}
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+                raise ValueError("Integer product id is required")
+            if item['id'] not in current:
+                raise ValueError(f"Product with ID {item['id']} not found")
+            values = validate_product(item, mode)
+        except ValueError as e:
+            results.append({'index': index, 'status': 'error', 'error': str(e)})
+            continue
+        if (mode == 'update' or 'image_url' in item) and images[index] is not None:
+            values['image_url'] = images[index]
+        if values:
+            statements.setdefault(tuple(values), []).append((*values.values(), item['id']))
+        results.append({'index': index, 'status': 'ok', 'id': item['id']})
+
+    for columns, rows in statements.items():
+        assignments = ', '.join(f'{col} = ?' for col in columns)
+        conn.executemany(f'UPDATE products SET {assignments} WHERE id = ?', rows)
+
+def batch_quantity_delta(conn, items, results):
+    """Apply relative quantity changes, keeping every quantity within 1-9999."""
+    ids = [item.get('id') for item in items if isinstance(item, dict) and isinstance(item.get('id'), int)]
+    quantities = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        for row in conn.execute(
+                f"SELECT id, quantity FROM products WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+            quantities[row['id']] = row['quantity'] or 0
+
+    rows = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+                raise ValueError("Integer product id is required")
+            if item['id'] not in quantities:
+                raise ValueError(f"Product with ID {item['id']} not found")
+            try:
+                delta = int(item.get('delta'))
+            except (ValueError, TypeError):
+                raise ValueError("Invalid quantity delta")
+            quantity = quantities[item['id']] + delta
+            if quantity < 1 or quantity > 9999:
+                raise ValueError("Quantity must be between 1 and 9999")
+        except ValueError as e:
+            results.append({'index': index, 'status': 'error', 'error': str(e)})
+            continue
+        quantities[item['id']] = quantity
+        rows.append((delta, item['id']))
+        results.append({'index': index, 'status': 'ok', 'id': item['id'], 'quantity': quantity})
+
+    conn.executemany('UPDATE products SET quantity = quantity + ? WHERE id = ?', rows)
+
+@bp.route('/api/products/batch', methods=['POST'])
 def batch_operations():
-    """Perform batch operations on multiple products."""
+    """Perform batch operations on multiple products.
+
+    Either a legacy {operation, product_ids} request ('delete' or
+    'update_location'), or any of the lists 'create', 'update', 'patch' and
+    'quantity_delta', which are applied in that order in one transaction.
+    """
     if not request.json:
         abort(400, description="Request body must be JSON")
     
     data = request.json
+    if any(key in data for key in BATCH_ITEM_OPERATIONS):
+        return batch_item_operations(data)
+
     operation = data.get('operation')
     product_ids = data.get('product_ids', [])
     
     if not operation or not product_ids:
         abort(400, description="Operation and product_ids are required")
-    
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
-    
-    try:
+    if operation not in ('delete', 'update_location'):
+        abort(400, description="Invalid operation")
+    location = sanitize_input(data.get('location'), 100)
+
+    def apply(conn):
+        placeholders = ','.join('?' * len(product_ids))
         if operation == 'delete':
-            placeholders = ','.join('?' * len(product_ids))
             conn.execute(f'DELETE FROM products WHERE id IN ({placeholders})', product_ids)
-        elif operation == 'update_location':
-            location = sanitize_input(data.get('location'), 100)
-            placeholders = ','.join('?' * len(product_ids))
-            conn.execute(f'UPDATE products SET location = ? WHERE id IN ({placeholders})', [location] + product_ids)
         else:
-            abort(400, description="Invalid operation")
-        
-        conn.commit()
+            conn.execute(f'UPDATE products SET location = ? WHERE id IN ({placeholders})', [location] + product_ids)
+
+    try:
+        run_write(apply)
         return jsonify({'message': f'{len(product_ids)} Produkte aktualisiert'}), 200
     except sqlite3.Error as e:
-        conn.rollback()
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/statistics', methods=['GET'])
+def batch_item_operations(data):
+    """Apply create/update/patch/quantity_delta lists with per-item results."""
+    for key in BATCH_ITEM_OPERATIONS:
+        if not isinstance(data.get(key, []), list):
+            abort(400, description=f"'{key}' must be a list")
+
+    started = time.perf_counter()
+    # Base64 images are written to disk before the write transaction
+    images = {key: prepare_batch_images(data[key]) for key in ('create', 'update', 'patch') if key in data}
+
+    def apply(conn):
+        # Fresh lists per attempt, so a rolled back write leaves no partial results behind
+        results = {key: [] for key in BATCH_ITEM_OPERATIONS if key in data}
+        history_rows = []
+        if 'create' in data:
+            batch_create(conn, data['create'], images['create'], results['create'], history_rows)
+        for mode in ('update', 'patch'):
+            if mode in data:
+                batch_modify(conn, data[mode], images[mode], mode, results[mode])
+        if 'quantity_delta' in data:
+            batch_quantity_delta(conn, data['quantity_delta'], results['quantity_delta'])
+        update_barcode_history_many(conn, history_rows)
+        return results
+
+    try:
+        results = run_write(apply)
+    except sqlite3.Error as e:
+        abort(500, description=f"Database error: {e}")
+
+    for items in results.values():
+        items.sort(key=lambda result: result['index'])
+    applied = sum(1 for items in results.values() for result in items if result['status'] == 'ok')
+    failed = sum(1 for items in results.values() for result in items if result['status'] == 'error')
+    elapsed = time.perf_counter() - started
+    return jsonify({
+        'results': results,
+        'applied': applied,
+        'failed': failed,
+        'duration_ms': round(elapsed * 1000, 2),
+        'message': f'{applied} Produkte verarbeitet, {failed} fehlerhaft'
+    }), 200
+
+@bp.route('/api/images', methods=['POST'])
+def upload_image():
+    """Upload an image as multipart form field 'image' or as a raw image/* body."""
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        if not upload:
+            abort(400, description="Form field 'image' is required")
+        stream = upload.stream
+    elif request.mimetype.startswith('image/'):
+        stream = request.stream
+    else:
+        abort(400, description="Expected multipart/form-data or an image/* body")
+
+    filename = store_image(stream)
+    if not filename:
+        abort(400, description="Unsupported or invalid image (JPEG, PNG, GIF or WebP)")
+
+    return jsonify({
+        'image_url': f'/static/uploads/{filename}',
+        'thumbnail_url': f'/static/uploads/thumbs/{os.path.splitext(filename)[0]}.jpg'
+    }), 201
+
+STATS_RECENT_ADDITIONS_SQL = 'SELECT COUNT(*), SUM(price * quantity) FROM products WHERE created_at >= ?'
+
+@bp.route('/api/statistics', methods=['GET'])
+@versioned('products', daily=True)
 def get_statistics():
     """Get inventory statistics."""
     conn = get_db_connection()
@@ -513,43 +3029,37 @@ def get_statistics():
         abort(500, description="Database connection failed")
     
     try:
-        # Total products and value
-        total = conn.execute('SELECT COUNT(*), SUM(quantity), SUM(price * quantity) FROM products').fetchone()
-        
-        # Expiring soon (within 7 days)
-        from datetime import datetime, timedelta
-        week_from_now = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
-        expiring = conn.execute('SELECT COUNT(*) FROM products WHERE expiry_date <= ? AND expiry_date >= date("now")', (week_from_now,)).fetchone()
-        
-        # Expired
-        expired = conn.execute('SELECT COUNT(*) FROM products WHERE expiry_date < date("now")').fetchone()
+        # Totals and per-location figures come from the summary table
+        by_location = conn.execute(
+            'SELECT location, products, items, value FROM stats_location ORDER BY location'
+        ).fetchall()
         
-        # By location
-        by_location = conn.execute('SELECT location, COUNT(*), SUM(quantity) FROM products GROUP BY location').fetchall()
+        # Date-dependent figures come from the precomputed expiry buckets
+        ensure_expiry_buckets(conn)
+        buckets = dict(conn.execute('SELECT bucket, COUNT(*) FROM expiry_buckets GROUP BY bucket').fetchall())
         
         # Price trends (last 30 days)
         thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-        recent_additions = conn.execute(
-            'SELECT COUNT(*), SUM(price * quantity) FROM products WHERE created_at >= ?', 
-            (thirty_days_ago,)
-        ).fetchone()
+        recent_additions = conn.execute(STATS_RECENT_ADDITIONS_SQL, (thirty_days_ago,)).fetchone()
         
         return jsonify({
-            'total_products': total[0] or 0,
-            'total_items': total[1] or 0,
-            'total_value': round(total[2] or 0, 2),
-            'expiring_soon': expiring[0] or 0,
-            'expired': expired[0] or 0,
-            'by_location': [{'location': row[0], 'products': row[1], 'items': row[2]} for row in by_location],
+            'total_products': sum(row['products'] for row in by_location),
+            'total_items': sum(row['items'] for row in by_location),
+            'total_value': round(sum(row['value'] for row in by_location), 2),
+            'expiring_soon': buckets.get('days_3', 0) + buckets.get('days_7', 0),
+            'expired': buckets.get('expired', 0),
+            'by_location': [{'location': row['location'], 'products': row['products'], 'items': row['items']}
+                            for row in by_location],
             'recent_additions_count': recent_additions[0] or 0,
             'recent_additions_value': round(recent_additions[1] or 0, 2)
         }), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/products/check-duplicate', methods=['POST'])
+DUPLICATE_BY_EAN_SQL = "SELECT * FROM products WHERE ean = ? AND ean != ''"
+DUPLICATE_BY_NAME_SQL = 'SELECT * FROM products WHERE name = ? COLLATE NOCASE LIMIT 5'
+
+@bp.route('/api/products/check-duplicate', methods=['POST'])
 def check_duplicate():
     """Check if a product with same EAN or name exists."""
     if not request.json:
@@ -567,14 +3077,11 @@ def check_duplicate():
         duplicates = []
         
         if ean:
-            ean_matches = conn.execute('SELECT * FROM products WHERE ean = ? AND ean != ""', (ean,)).fetchall()
+            ean_matches = conn.execute(DUPLICATE_BY_EAN_SQL, (ean,)).fetchall()
             duplicates.extend([dict(row) for row in ean_matches])
         
         if name and not duplicates:
-            name_matches = conn.execute(
-                'SELECT * FROM products WHERE LOWER(name) = LOWER(?) LIMIT 5', 
-                (name,)
-            ).fetchall()
+            name_matches = conn.execute(DUPLICATE_BY_NAME_SQL, (name,)).fetchall()
             duplicates.extend([dict(row) for row in name_matches])
         
         return jsonify({
@@ -583,65 +3090,230 @@ def check_duplicate():
         }), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/scan/<ean>', methods=['GET'])
+# Snippet markers are control characters so user text can be HTML-escaped safely
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+def highlight_snippet(snippet):
+    """HTML-escape an FTS snippet and turn the match markers into <mark> tags."""
+    escaped = html.escape(snippet or '')
+    return escaped.replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+# Ranked FTS matches with snippet; parameters are the two snippet markers, the query and the limit.
+# Weights per column: name, notes, tags, ean (products) and name, category, tags, ean (history)
+SEARCH_PRODUCTS_SQL = '''
+    SELECT p.*, snippet(products_fts, -1, ?, ?, '…', 12) AS snippet,
+           bm25(products_fts, 10.0, 2.0, 4.0, 8.0) AS rank
+    FROM products_fts JOIN products p ON p.id = products_fts.rowid
+    WHERE products_fts MATCH ?
+    ORDER BY rank LIMIT ?
+'''
+SEARCH_HISTORY_SQL = '''
+    SELECT h.*, snippet(barcode_history_fts, -1, ?, ?, '…', 12) AS snippet,
+           bm25(barcode_history_fts, 10.0, 4.0, 4.0, 8.0) AS rank
+    FROM barcode_history_fts JOIN barcode_history h ON h.id = barcode_history_fts.rowid
+    WHERE barcode_history_fts MATCH ?
+    ORDER BY rank LIMIT ?
+'''
+
+@bp.route('/api/search', methods=['GET'])
+def search():
+    """Ranked prefix search over products and barcode history."""
+    query = build_fts_query(sanitize_input(request.args.get('q'), 200))
+    if not query:
+        abort(400, description="Search query 'q' is required")
+
+    scope = request.args.get('scope', 'all')
+    if scope not in ('all', 'products', 'history'):
+        abort(400, description="Scope must be 'all', 'products' or 'history'")
+    limit = min(max(request.args.get('limit', 20, type=int) or 20, 1), 100)
+
+    conn = get_db_connection()
+    if not conn:
+        abort(500, description="Database connection failed")
+
+    try:
+        result = {'query': request.args.get('q'), 'products': [], 'history': []}
+
+        if scope in ('all', 'products'):
+            rows = conn.execute(SEARCH_PRODUCTS_SQL, (SNIPPET_START, SNIPPET_END, query, limit)).fetchall()
+            for row in rows:
+                item = dict(row)
+                item['snippet'] = highlight_snippet(item['snippet'])
+                item['rank'] = round(item['rank'], 4)
+                result['products'].append(item)
+
+        if scope in ('all', 'history'):
+            rows = conn.execute(SEARCH_HISTORY_SQL, (SNIPPET_START, SNIPPET_END, query, limit)).fetchall()
+            for row in rows:
+                item = dict(row)
+                item['snippet'] = highlight_snippet(item['snippet'])
+                item['rank'] = round(item['rank'], 4)
+                result['history'].append(item)
+
+        return jsonify(result), 200
+    except sqlite3.Error as e:
+        abort(500, description=f"Database error: {e}")
+
+SCAN_RESULT_FIELDS = ('name', 'image_url', 'quantity', 'brands', 'category')
+
+def save_off_entry(ean, entry):
+    """Persist an upstream OFF result to off_cache (in the shared database); errors are only logged."""
+    try:
+        run_write(get_off_cache().save, ean, entry, shared=True)
+    except (sqlite3.Error, HTTPException) as e:
+        print(f"OFF cache write error: {e}")
+
+def record_scan(ean, info):
+    """Add a resolved scan (summarize_off_product() fields) to the barcode history."""
+    try:
+        run_write(update_barcode_history, ean, info['name'], info['category'],
+                  info['quantity'], '', info['is_vegetarian'], info['is_vegan'])
+    except Exception as e:
+        print(f"History update error: {e}")
+
+@bp.route('/api/scan/<ean>', methods=['GET'])
 def scan_product(ean):
     """Proxy to Open Food Facts API and track scan history."""
     # Validate EAN format (digits only, typical length 8, 12, or 13)
     if not ean or not re.match(r'^\d{8,13}$', ean):
         abort(400, description="Invalid EAN format")
 
-    url = f"https://world.openfoodfacts.org/api/v0/product/{ean}.json"
     try:
-        response = requests.get(url, timeout=5, headers={'User-Agent': 'SmartKitchenInventory/1.0'})
-        response.raise_for_status()
-        data = response.json()
-        
-        if data.get('status') == 1:
-            product = data['product']
-            product_name = product.get('product_name', 'Unbekanntes Produkt')[:200]
-            
-            # Extract category from API
-            categories = product.get('categories', '')
-            category = categories.split(',')[0].strip() if categories else ''
-            
-            # Check if vegetarian/vegan
-            is_vegetarian = 'vegetarian' in categories.lower() if categories else False
-            is_vegan = 'vegan' in categories.lower() if categories else False
-            
-            # Update barcode history with full metadata
-            conn = get_db_connection()
-            if conn:
+        entry = get_off_cache().lookup(ean, fetch_off_product, get_shared_db_connection(), save_off_entry)
+    except Exception as e:
+        status, message = describe_off_error(e)
+        return jsonify({'found': False, 'error': message}), status
+
+    if not entry['found']:
+        return jsonify({'found': False, 'message': 'Produkt nicht in der Datenbank gefunden'}), 404
+
+    info = summarize_off_product(entry['product'])
+
+    # Update barcode history with full metadata
+    record_scan(ean, info)
+
+    return jsonify({'found': True, **{k: info[k] for k in SCAN_RESULT_FIELDS}})
+
+BARCODE_HISTORY_BY_EAN_SQL = 'SELECT * FROM barcode_history WHERE ean = ?'
+
+def local_scan_results(conn, cache_conn, cache, eans, history_rows, misses):
+    """Yield batch scan results answerable from the cache and the barcode history.
+
+    cache_conn holds off_cache (see get_shared_db_connection()). EANs that
+    need the upstream are appended to misses; found products add their
+    update_barcode_history() arguments to history_rows.
+    """
+    for ean in eans:
+        if not re.match(r'^\d{8,13}$', ean):
+            yield {'ean': ean, 'status': 400, 'found': False, 'error': 'Invalid EAN format'}
+            continue
+        entry = cache.peek(ean, cache_conn)
+        if entry is not None:
+            if entry['found']:
+                info = summarize_off_product(entry['product'])
+                history_rows.append((ean, info['name'], info['category'], info['quantity'], '',
+                                     info['is_vegetarian'], info['is_vegan']))
+                yield {'ean': ean, 'status': 200, 'found': True, 'source': 'cache',
+                       **{k: info[k] for k in SCAN_RESULT_FIELDS}}
+            else:
+                yield {'ean': ean, 'status': 404, 'found': False, 'source': 'cache',
+                       'message': 'Produkt nicht in der Datenbank gefunden'}
+            continue
+        known = conn.execute(BARCODE_HISTORY_BY_EAN_SQL, (ean,)).fetchone()
+        if known:
+            history_rows.append((ean, known['name'], known['category'], known['weight_volume'],
+                                 known['tags'], known['is_vegetarian'], known['is_vegan']))
+            yield {'ean': ean, 'status': 200, 'found': True, 'source': 'history',
+                   'name': known['name'], 'image_url': '', 'quantity': known['weight_volume'] or '',
+                   'brands': '', 'category': known['category'] or ''}
+            continue
+        misses.append(ean)
+
+def upstream_scan_result(ean, entry, history_rows, fetched):
+    """Batch scan result for an entry returned by an upstream lookup."""
+    source = 'stale' if entry.get('stale') else 'upstream'
+    if source == 'upstream':
+        fetched[ean] = entry
+    if not entry['found']:
+        return {'ean': ean, 'status': 404, 'found': False, 'source': source,
+                'message': 'Produkt nicht in der Datenbank gefunden'}
+    info = summarize_off_product(entry['product'])
+    history_rows.append((ean, info['name'], info['category'], info['quantity'], '',
+                         info['is_vegetarian'], info['is_vegan']))
+    return {'ean': ean, 'status': 200, 'found': True, 'source': source,
+            **{k: info[k] for k in SCAN_RESULT_FIELDS}}
+
+def persist_scan_batch(cache, fetched, history_rows):
+    """Write upstream cache entries and then the scan history of a batch, one transaction each."""
+    try:
+        if fetched:
+            run_write(cache.save_many, fetched, shared=True)
+        run_write(update_barcode_history_many, history_rows)
+    except (sqlite3.Error, HTTPException) as e:
+        print(f"Batch scan history error: {e}")
+
+@bp.route('/api/scan/batch', methods=['POST'])
+def scan_batch():
+    """Resolve many EANs at once, streaming one NDJSON result line per EAN."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('eans'), list):
+        abort(400, description="Request body must be JSON with an 'eans' list")
+
+    eans = list(dict.fromkeys(str(ean).strip() for ean in data['eans']))
+    if not eans:
+        abort(400, description="At least one EAN is required")
+    if len(eans) > current_app.config['SCAN_BATCH_MAX']:
+        abort(400, description=f"At most {current_app.config['SCAN_BATCH_MAX']} EANs per batch")
+
+    conn = get_db_connection()
+    cache_conn = get_shared_db_connection()
+    if not conn or not cache_conn:
+        abort(500, description="Database connection failed")
+
+    def line(result):
+        return json.dumps(result, ensure_ascii=False) + '\n'
+
+    def generate():
+        cache = get_off_cache()
+        history_rows = []  # update_barcode_history() arguments, written in one transaction
+        fetched = {}  # Entries from the upstream, persisted to off_cache at the end
+        misses = []
+        found_count = 0
+
+        # 1. Answer from the local cache and the barcode history
+        for result in local_scan_results(conn, cache_conn, cache, eans, history_rows, misses):
+            found_count += result['found']
+            yield line(result)
+
+        # 2. Resolve the rest concurrently; results stream back in completion order
+        if misses:
+            # The lookup threads have no app context, so they get the client's bound method
+            executor = get_scan_executor()
+            fetch = get_off_client().get_product
+            futures = {executor.submit(cache.lookup, ean, fetch): ean for ean in misses}
+            for future in as_completed(futures):
+                ean = futures[future]
                 try:
-                    update_barcode_history(conn, ean, product_name, category, 
-                                         product.get('quantity', ''), '', is_vegetarian, is_vegan)
-                    conn.commit()
+                    entry = future.result()
                 except Exception as e:
-                    print(f"History update error: {e}")
-                finally:
-                    conn.close()
-            
-            return jsonify({
-                'found': True,
-                'name': product_name,
-                'image_url': product.get('image_url', '')[:500],
-                'quantity': product.get('quantity', '')[:50],
-                'brands': product.get('brands', '')[:200],
-                'category': category
-            })
-        else:
-            return jsonify({'found': False, 'message': 'Produkt nicht in der Datenbank gefunden'}), 404
-    except requests.Timeout:
-        return jsonify({'found': False, 'error': 'API-Anfrage hat zu lange gedauert'}), 504
-    except requests.RequestException as e:
-        return jsonify({'found': False, 'error': 'Fehler bei der Verbindung zur externen API'}), 502
-    except Exception as e:
-        print(f"Unexpected error in scan_product: {e}")
-        return jsonify({'found': False, 'error': 'Ein unerwarteter Fehler ist aufgetreten'}), 500
+                    status, message = describe_off_error(e)
+                    yield line({'ean': ean, 'status': status, 'found': False, 'error': message})
+                    continue
+                result = upstream_scan_result(ean, entry, history_rows, fetched)
+                found_count += result['found']
+                yield line(result)
+
+        # 3. Persist cache entries and scan history
+        persist_scan_batch(cache, fetched, history_rows)
+
+        yield line({'summary': {'requested': len(eans), 'found': found_count,
+                                'upstream_lookups': len(misses)}})
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-@app.route('/api/shopping-list', methods=['GET'])
+@bp.route('/api/shopping-list', methods=['GET'])
+@versioned('shopping_list')
 def get_shopping_list():
     """Get all shopping list items."""
     conn = get_db_connection()
@@ -653,10 +3325,8 @@ def get_shopping_list():
         return jsonify([dict(row) for row in items]), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/shopping-list', methods=['POST'])
+@bp.route('/api/shopping-list', methods=['POST'])
 def add_to_shopping_list():
     """Add item to shopping list."""
     if not request.json:
@@ -667,111 +3337,112 @@ def add_to_shopping_list():
     if not name:
         abort(400, description="Name is required")
     
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
-    
     try:
-        conn.execute(
-            'INSERT INTO shopping_list (name, quantity, category, notes) VALUES (?, ?, ?, ?)',
-            (name, int(data.get('quantity', 1)), sanitize_input(data.get('category'), 50), sanitize_input(data.get('notes'), 500))
-        )
-        conn.commit()
+        run_write(lambda conn, row: conn.execute(
+            'INSERT INTO shopping_list (name, quantity, category, notes) VALUES (?, ?, ?, ?)', row
+        ), (name, int(data.get('quantity', 1)), sanitize_input(data.get('category'), 50), sanitize_input(data.get('notes'), 500)))
         return jsonify({'message': 'Item added to shopping list'}), 201
     except sqlite3.Error as e:
-        conn.rollback()
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/shopping-list/<int:id>', methods=['PUT'])
+@bp.route('/api/shopping-list/<int:id>', methods=['PUT'])
 def update_shopping_item(id):
     """Update shopping list item (mainly for checking/unchecking)."""
     if not request.json:
         abort(400, description="Request body must be JSON")
     
     data = request.json
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
-    
     try:
-        conn.execute(
-            'UPDATE shopping_list SET checked = ?, name = ?, quantity = ? WHERE id = ?',
-            (1 if data.get('checked') else 0, sanitize_input(data.get('name'), 200), int(data.get('quantity', 1)), id)
-        )
-        conn.commit()
+        run_write(lambda conn, row: conn.execute(
+            'UPDATE shopping_list SET checked = ?, name = ?, quantity = ? WHERE id = ?', row
+        ), (1 if data.get('checked') else 0, sanitize_input(data.get('name'), 200), int(data.get('quantity', 1)), id))
         return jsonify({'message': 'Item updated'}), 200
     except sqlite3.Error as e:
-        conn.rollback()
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/shopping-list/<int:id>', methods=['DELETE'])
+@bp.route('/api/shopping-list/<int:id>', methods=['DELETE'])
 def delete_shopping_item(id):
     """Delete shopping list item."""
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
-    
     try:
-        conn.execute('DELETE FROM shopping_list WHERE id = ?', (id,))
-        conn.commit()
+        run_write(lambda conn: conn.execute('DELETE FROM shopping_list WHERE id = ?', (id,)))
         return jsonify({'message': 'Item deleted'}), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/shopping-list/clear-checked', methods=['DELETE'])
+@bp.route('/api/shopping-list/clear-checked', methods=['DELETE'])
 def clear_checked_items():
     """Delete all checked items from shopping list."""
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
-    
     try:
-        conn.execute('DELETE FROM shopping_list WHERE checked = 1')
-        conn.commit()
+        run_write(lambda conn: conn.execute('DELETE FROM shopping_list WHERE checked = 1'))
         return jsonify({'message': 'Checked items cleared'}), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/shopping-list/generate', methods=['POST'])
+# One row per product name: expired anywhere or total stock at/below the category threshold.
+# NOT EXISTS is answered by idx_shopping_list_name.
+SHOPPING_LIST_GENERATE_SQL = '''
+    INSERT INTO shopping_list (name, quantity, category, notes)
+    SELECT p.name, 1, MAX(p.category), 'Auto-generiert'
+    FROM products p
+    LEFT JOIN json_each(:thresholds) t ON t.key = p.category
+    LEFT JOIN expiry_buckets b ON b.product_id = p.id AND b.bucket = 'expired'
+    WHERE NOT EXISTS (SELECT 1 FROM shopping_list s WHERE s.name = p.name)
+    GROUP BY p.name
+    HAVING MAX(b.product_id IS NOT NULL)
+        OR SUM(COALESCE(p.quantity, 0)) <= COALESCE(MAX(t.value), :default_threshold)
+    ORDER BY p.name
+'''
+
+def parse_threshold(value):
+    """Return a low-stock threshold as float, raising ValueError unless it is a finite number."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError("Threshold must be a number")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("Threshold must be finite")
+    return number
+
+@bp.route('/api/shopping-list/generate', methods=['POST'])
 def generate_shopping_list():
-    """Generate shopping list from expired and low stock items."""
-    conn = get_db_connection()
-    if not conn:
-        abort(500, description="Database connection failed")
-    
+    """Generate shopping list from expired and low stock items in a single INSERT ... SELECT."""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or not isinstance(data.get('thresholds') or {}, dict):
+        abort(400, description="Expected {'thresholds': {category: number}, 'default_threshold': number}")
+    thresholds = {**current_app.config['LOW_STOCK_THRESHOLDS'], **(data.get('thresholds') or {})}
+    default_threshold = data.get('default_threshold', current_app.config['LOW_STOCK_THRESHOLD'])
     try:
-        # Get expired or low stock items
-        items = conn.execute('''
-            SELECT name, category, quantity FROM products 
-            WHERE (expiry_date < date('now') OR quantity <= 1)
-            AND name NOT IN (SELECT name FROM shopping_list)
-        ''').fetchall()
-        
-        added = 0
-        for item in items:
-            conn.execute(
-                'INSERT INTO shopping_list (name, quantity, category, notes) VALUES (?, ?, ?, ?)',
-                (item['name'], 1, item['category'], 'Auto-generiert')
-            )
-            added += 1
-        
-        conn.commit()
-        return jsonify({'message': f'{added} items added to shopping list', 'count': added}), 200
+        thresholds = {str(category): parse_threshold(value) for category, value in thresholds.items()}
+        default_threshold = parse_threshold(default_threshold)
+    except ValueError:
+        abort(400, description="Thresholds must be numbers")
+
+    auto_shopping = current_app.config['AUTO_SHOPPING_LIST']
+
+    def generate(conn):
+        # Rows added in this transaction get ids above the current maximum under the write lock
+        last_id = conn.execute('SELECT IFNULL(MAX(id), 0) FROM shopping_list').fetchone()[0]
+        # The expired products come from the buckets, refreshed in the same transaction; with
+        # AUTO_SHOPPING_LIST the refresh adds newly expired products itself, they are reported too
+        refresh_stale_expiry_buckets(conn, auto_shopping)
+        conn.execute(SHOPPING_LIST_GENERATE_SQL,
+                     {'thresholds': json.dumps(thresholds), 'default_threshold': default_threshold})
+        items = conn.execute('SELECT * FROM shopping_list WHERE id > ? ORDER BY id', (last_id,)).fetchall()
+        return len(items), [dict(row) for row in items]
+
+    try:
+        added, items = run_write(generate)
+        return jsonify({
+            'message': f'{added} items added to shopping list',
+            'count': added,
+            'items': items
+        }), 200
     except sqlite3.Error as e:
-        conn.rollback()
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/barcode-history', methods=['GET'])
+BARCODE_HISTORY_RECENT_SQL = 'SELECT * FROM barcode_history ORDER BY last_scanned DESC LIMIT ?'
+
+@bp.route('/api/barcode-history', methods=['GET'])
+@versioned('barcode_history')
 def get_barcode_history():
     """Get barcode scan history."""
     conn = get_db_connection()
@@ -780,17 +3451,21 @@ def get_barcode_history():
     
     try:
         limit = request.args.get('limit', 10, type=int)
-        history = conn.execute(
-            'SELECT * FROM barcode_history ORDER BY last_scanned DESC LIMIT ?',
-            (limit,)
-        ).fetchall()
+        history = conn.execute(BARCODE_HISTORY_RECENT_SQL, (limit,)).fetchall()
         return jsonify([dict(row) for row in history]), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
-    finally:
-        conn.close()
 
-@app.route('/api/statistics/advanced', methods=['GET'])
+# CROSS JOIN pins the join order: the few bucket rows drive the product lookups
+WASTE_SQL = '''
+    SELECT COUNT(*) as count, SUM(p.price * p.quantity) as value
+    FROM expiry_buckets b CROSS JOIN products p ON p.id = b.product_id
+    WHERE b.bucket = 'expired'
+'''
+TOP_SCANNED_SQL = 'SELECT name, scan_count, last_scanned FROM barcode_history ORDER BY scan_count DESC LIMIT 5'
+
+@bp.route('/api/statistics/advanced', methods=['GET'])
+@versioned('products', 'barcode_history', daily=True)
 def get_advanced_statistics():
     """Get advanced statistics including waste tracking and consumption patterns."""
     conn = get_db_connection()
@@ -798,56 +3473,730 @@ def get_advanced_statistics():
         abort(500, description="Database connection failed")
     
     try:
-        from datetime import datetime, timedelta
-        
-        # Total waste value (expired items)
-        waste = conn.execute(
-            'SELECT COUNT(*) as count, SUM(price * quantity) as value FROM products WHERE expiry_date < date("now")'
-        ).fetchone()
+        # Total waste value (expired items) from the precomputed expiry buckets
+        ensure_expiry_buckets(conn)
+        waste = conn.execute(WASTE_SQL).fetchone()
         
-        # Category breakdown
-        by_category = conn.execute(
-            'SELECT category, COUNT(*) as count, SUM(quantity) as items FROM products WHERE category IS NOT NULL AND category != "" GROUP BY category'
+        # Category breakdown and average prices from the summary table
+        categories = conn.execute(
+            "SELECT category, products, items, priced_products, priced_total FROM stats_category WHERE category != '' ORDER BY category"
         ).fetchall()
         
         # Most scanned items
-        top_scanned = conn.execute(
-            'SELECT name, scan_count, last_scanned FROM barcode_history ORDER BY scan_count DESC LIMIT 5'
-        ).fetchall()
+        top_scanned = conn.execute(TOP_SCANNED_SQL).fetchall()
         
         # Weekly additions
         week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        weekly_additions = conn.execute(
-            'SELECT COUNT(*) as count FROM products WHERE created_at >= ?',
-            (week_ago,)
-        ).fetchone()
-        
-        # Average price per category
-        avg_by_category = conn.execute(
-            'SELECT category, AVG(price) as avg_price FROM products WHERE category IS NOT NULL AND category != "" AND price > 0 GROUP BY category'
-        ).fetchall()
+        weekly_additions = conn.execute(STATS_RECENT_ADDITIONS_SQL, (week_ago,)).fetchone()
         
         return jsonify({
             'waste': {
                 'count': waste['count'] or 0,
                 'value': round(waste['value'] or 0, 2)
             },
-            'by_category': [{'category': row['category'], 'count': row['count'], 'items': row['items']} for row in by_category],
+            'by_category': [{'category': row['category'], 'count': row['products'], 'items': row['items']} for row in categories],
             'top_scanned': [{'name': row['name'], 'count': row['scan_count'], 'last_scanned': row['last_scanned']} for row in top_scanned],
-            'weekly_additions': weekly_additions['count'] or 0,
-            'avg_by_category': [{'category': row['category'], 'avg_price': round(row['avg_price'], 2)} for row in avg_by_category]
+            'weekly_additions': weekly_additions[0] or 0,
+            'avg_by_category': [{'category': row['category'], 'avg_price': round(row['priced_total'] / row['priced_products'], 2)}
+                                for row in categories if row['priced_products'] > 0]
+        }), 200
+    except sqlite3.Error as e:
+        abort(500, description=f"Database error: {e}")
+
+# CROSS JOIN pins the join order, otherwise SQLite may walk all products by name for the ORDER BY
+EXPIRY_LIST_SQL = '''
+    SELECT b.bucket, b.days_left, p.id, p.name, p.expiry_date, p.location, p.quantity
+    FROM expiry_buckets b CROSS JOIN products p ON p.id = b.product_id
+    ORDER BY b.days_left, p.name
+'''
+
+@bp.route('/api/expiry', methods=['GET'])
+@versioned('products', daily=True)
+def get_expiry():
+    """List expired products and those expiring within 3 and 7 days."""
+    conn = get_db_connection()
+    if not conn:
+        abort(500, description="Database connection failed")
+
+    try:
+        ensure_expiry_buckets(conn)
+        rows = conn.execute(EXPIRY_LIST_SQL).fetchall()
+        result = {name: [] for name, _ in EXPIRY_BUCKETS}
+        for row in rows:
+            item = dict(row)
+            result[item.pop('bucket')].append(item)
+        return jsonify(result), 200
+    except sqlite3.Error as e:
+        abort(500, description=f"Database error: {e}")
+
+# --- Export & Import ---
+
+EXPORT_COLUMNS = ('id',) + PRODUCT_COLUMNS + ('created_at',)
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_IMAGE_MODES = ('url', 'inline', 'none')
+IMPORT_MIMETYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/json': 'ndjson'
+}
+IMPORT_EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+IMPORT_INSERT_SQL = (
+    f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}, created_at) "
+    f"VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))}, COALESCE(?, CURRENT_TIMESTAMP))"
+)
+# CSV spellings of a false flag; anything else counts as true
+FALSE_VALUES = ('', '0', 'false', 'no', 'nein', 'off')
+
+def inline_image(image_url):
+    """Return an uploaded image as a data: URL, '' if the file is gone; other URLs pass through."""
+    if not image_url or not image_url.startswith('/static/uploads/'):
+        return image_url or ''
+    try:
+        with open(os.path.join(uploads_dir(), os.path.basename(image_url)), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return ''
+    extension = detect_image_type(data[:12]) or 'jpg'
+    subtype = 'jpeg' if extension == 'jpg' else extension
+    return f'data:image/{subtype};base64,{base64.b64encode(data).decode("ascii")}'
+
+def normalize_timestamp(value):
+    """Return a timestamp as 'YYYY-MM-DD HH:MM:SS' (None if empty), raising ValueError if unreadable."""
+    text = str(value or '').strip()
+    if not text:
+        return None
+    try:
+        return datetime.fromisoformat(text.replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise ValueError(f"Invalid created_at '{text[:25]}'")
+
+def read_import_records(stream, fmt):
+    """Yield (line number, record) from an uploaded file while it is being read.
+
+    A record is a dict, or an error message for a line that cannot be parsed.
+    CSV values arrive as strings and are coerced to what validate_product()
+    expects; the delimiter (comma, semicolon or tab) is taken from the header.
+    """
+    if not isinstance(stream, io.BufferedIOBase):
+        # Request streams read line by line in Python; buffer them in C
+        stream = io.BufferedReader(stream, 256 * 1024)
+    if fmt == 'ndjson':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {e}"
+                continue
+            yield number, record if isinstance(record, dict) else "Line must be a JSON object"
+        return
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    header = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(header, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    fieldnames = [name.strip() for name in next(csv.reader([header], dialect), [])]
+    reader = csv.DictReader(text, fieldnames=fieldnames, dialect=dialect)
+    for record in reader:
+        record.pop(None, None)
+        if record.get('quantity') == '':
+            del record['quantity']
+        for flag in ('is_vegetarian', 'is_vegan'):
+            if flag in record:
+                record[flag] = (record[flag] or '').strip().lower() not in FALSE_VALUES
+        yield reader.line_num + 1, record
+
+@bp.route('/api/export', methods=['GET'])
+def export_products():
+    """Stream products as CSV or JSON lines without loading them into memory.
+
+    Accepts the filters of GET /api/products. ?images=inline embeds uploaded
+    images as data: URLs (so the file can be imported elsewhere), ?images=none
+    drops them; the default keeps the image paths.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400, description=f"Invalid format. Allowed: {', '.join(EXPORT_FORMATS)}")
+    images = request.args.get('images', 'url')
+    if images not in EXPORT_IMAGE_MODES:
+        abort(400, description=f"Invalid images mode. Allowed: {', '.join(EXPORT_IMAGE_MODES)}")
+    conditions, params = build_product_filters(request.args)
+
+    conn = get_db_connection()
+    if not conn:
+        abort(500, description="Database connection failed")
+
+    fetch_size = current_app.config['EXPORT_FETCH_SIZE']
+    image_index = EXPORT_COLUMNS.index('image_url')
+
+    def rows():
+        # One statement stepped in batches reads a consistent snapshot
+        cursor = conn.execute(
+            f'SELECT {", ".join(EXPORT_COLUMNS)} FROM products '
+            f'WHERE {" AND ".join(conditions) or "1"} ORDER BY id', params
+        )
+        while True:
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                return
+            for row in batch:
+                row = list(row)
+                if images == 'inline':
+                    row[image_index] = inline_image(row[image_index])
+                elif images == 'none':
+                    row[image_index] = ''
+                yield row
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for count, row in enumerate(rows(), 1):
+            writer.writerow(row)
+            if count % fetch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_ndjson():
+        lines = []
+        for row in rows():
+            lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+            if len(lines) >= fetch_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    def generate():
+        try:
+            yield from (generate_csv() if fmt == 'csv' else generate_ndjson())
+        except sqlite3.Error as e:
+            # Headers are already sent; the truncated file is all we can signal
+            print(f"Export error: {e}")
+
+    filename = f"inventar-{datetime.now().strftime('%Y-%m-%d')}.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@bp.route('/api/import', methods=['POST'])
+def import_products():
+    """Import products from CSV or JSON lines, validated like POST /api/products.
+
+    The body is the file itself (or the multipart field 'file'). Rows are
+    parsed as they arrive and written in chunks of IMPORT_CHUNK_SIZE, one
+    run_write() each, so an aborted import keeps the chunks committed so far.
+    Invalid rows are skipped and reported; ?images=skip ignores image references.
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if not upload:
+            abort(400, description="Form field 'file' is required")
+        stream = upload.stream
+        fmt = IMPORT_EXTENSIONS.get(os.path.splitext(upload.filename or '')[1].lower())
+    else:
+        stream = request.stream
+        fmt = IMPORT_MIMETYPES.get(request.mimetype)
+    fmt = request.args.get('format') or fmt
+    if fmt not in EXPORT_FORMATS:
+        abort(400, description=f"Unknown file format. Use ?format={' or ?format='.join(EXPORT_FORMATS)}")
+    skip_images = request.args.get('images') == 'skip'
+
+    chunk_size = current_app.config['IMPORT_CHUNK_SIZE']
+    max_errors = current_app.config['IMPORT_MAX_ERRORS']
+    started = time.perf_counter()
+    rows = []
+    history_rows = []
+    errors = []
+    imported = failed = chunks = 0
+
+    def insert_chunk(conn):
+        conn.executemany(IMPORT_INSERT_SQL, rows)
+        update_barcode_history_many(conn, history_rows)
+
+    def flush():
+        nonlocal imported, chunks
+        run_write(insert_chunk)
+        imported += len(rows)
+        chunks += 1
+        rows.clear()
+        history_rows.clear()
+
+    try:
+        try:
+            for line, record in read_import_records(stream, fmt):
+                try:
+                    if isinstance(record, str):
+                        raise ValueError(record)
+                    values = validate_product(record, 'create')
+                    created_at = normalize_timestamp(record.get('created_at'))
+                except ValueError as e:
+                    failed += 1
+                    if len(errors) < max_errors:
+                        errors.append({'line': line, 'error': str(e)})
+                    continue
+                values['image_url'] = '' if skip_images else prepare_image(record.get('image_url') or '') or ''
+                rows.append(tuple(values[col] for col in PRODUCT_COLUMNS) + (created_at,))
+                if values['ean']:
+                    history_rows.append((values['ean'], values['name'], values['category'], values['weight_volume'],
+                                         values['tags'], values['is_vegetarian'], values['is_vegan']))
+                if len(rows) >= chunk_size:
+                    flush()
+        except (UnicodeDecodeError, csv.Error) as e:
+            if rows:
+                flush()
+            abort(400, description=f"Unreadable {fmt} file after {imported} imported products: {e}")
+        if rows:
+            flush()
+    except sqlite3.Error as e:
+        abort(500, description=f"Database error after {imported} imported products: {e}")
+
+    elapsed = time.perf_counter() - started
+    return jsonify({
+        'imported': imported,
+        'failed': failed,
+        'errors': errors,
+        'chunks': chunks,
+        'duration_ms': round(elapsed * 1000, 2),
+        'rows_per_second': round(imported / elapsed) if elapsed > 0 else None,
+        'message': f'{imported} Produkte importiert, {failed} fehlerhaft'
+    }), 200
+
+# --- Delta Sync ---
+
+CHANGES_SINCE_SQL = 'SELECT seq, table_name, row_id FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?'
+
+@bp.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Return rows changed since a change log sequence number, plus tombstones for deleted rows."""
+    conn = get_db_connection()
+    if not conn:
+        abort(500, description="Database connection failed")
+
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', 1000, type=int)
+    if limit is None or limit < 1 or limit > current_app.config['CHANGES_MAX_LIMIT']:
+        abort(400, description=f"Limit must be between 1 and {current_app.config['CHANGES_MAX_LIMIT']}")
+
+    try:
+        horizon = conn.execute("SELECT value FROM sync_state WHERE key = 'compacted_seq'").fetchone()[0]
+        # Compaction may remove the newest tombstone, the horizon still counts as seen
+        latest = conn.execute('SELECT MAX(COALESCE(MAX(seq), 0), ?) FROM change_log', (horizon,)).fetchone()[0]
+        if since is None or since < horizon or since > latest:
+            # Log cannot bring this client up to date: reload everything, then sync from `next`
+            return jsonify({'reset': True, 'next': latest, 'has_more': False, 'changes': {}}), 200
+
+        entries = conn.execute(CHANGES_SINCE_SQL, (since, limit + 1)).fetchall()
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        touched = {table: set() for table in SYNC_TABLES}
+        for entry in entries:
+            touched[entry['table_name']].add(entry['row_id'])
+
+        # The current row is the truth; a log entry without a row is a deletion
+        changes = {}
+        for table, ids in touched.items():
+            if not ids:
+                continue
+            ids = sorted(ids)
+            rows = []
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows.extend(conn.execute(
+                    f'SELECT * FROM {table} WHERE id IN ({",".join("?" * len(chunk))})', chunk
+                ).fetchall())
+            upserted = [dict(row) for row in rows]
+            present = {row['id'] for row in upserted}
+            changes[table] = {
+                'upserted': upserted,
+                'deleted': [row_id for row_id in ids if row_id not in present]
+            }
+
+        return jsonify({
+            'reset': False,
+            'next': entries[-1]['seq'] if entries else since,
+            'has_more': has_more,
+            'changes': changes
         }), 200
     except sqlite3.Error as e:
         abort(500, description=f"Database error: {e}")
+
+@bp.route('/api/events', methods=['GET'])
+def change_events():
+    """Server-Sent Events stream announcing committed changes, resumable via Last-Event-ID.
+
+    An open stream holds a worker thread until it ends. Sync workers (one
+    request at a time) and clients beyond EVENTS_MAX_CLIENTS therefore get a
+    short poll instead: the pending changes and a retry interval. asgi.py
+    serves this route as a coroutine.
+    """
+    last_id = parse_event_id(request.headers.get('Last-Event-ID', request.args.get('since')))
+    conn = get_db_connection()
+    if not conn:
+        abort(500, description="Database connection failed")
+    broadcaster = get_broadcaster()
+    streaming = (request.environ.get('wsgi.multithread')
+                 and event_stats()['clients'] < current_app.config['EVENTS_MAX_CLIENTS'])
+
+    if not streaming:
+        try:
+            return Response(short_poll_events(conn, last_id), mimetype='text/event-stream',
+                            headers=EVENT_STREAM_HEADERS)
+        except sqlite3.Error as e:
+            abort(500, description=f"Database error: {e}")
+
+    subscriber = broadcaster.subscribe()
+    try:
+        backlog = change_backlog(conn, last_id) if last_id is not None else None
+    except sqlite3.Error as e:
+        broadcaster.unsubscribe(subscriber)
+        abort(500, description=f"Database error: {e}")
+
+    heartbeat = current_app.config['EVENTS_HEARTBEAT']
+    max_duration = current_app.config['EVENTS_MAX_DURATION']
+
+    # Runs after the app context (and its pooled connection) is released
+    def generate():
+        try:
+            yield f"retry: {heartbeat * 1000}\n\n"
+            if backlog:
+                yield format_change_event(backlog)
+            deadline = time.monotonic() + max_duration
+            while time.monotonic() < deadline:
+                try:
+                    event = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                if last_id is None or event['seq'] > last_id:
+                    yield format_change_event(event)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers=EVENT_STREAM_HEADERS)
+
+@bp.route('/api/system/db-pool', methods=['GET'])
+def get_pool_stats():
+    """Expose connection pool metrics of this worker for sizing (the shared pool with tenancy)."""
+    pool = get_shared_pool()
+    writer = pool.writer.stats() if pool.writer is not None else None
+    return jsonify({'pid': os.getpid(), **pool.stats(), 'tenants_open': tenant_pools_open(), 'writer': writer}), 200
+
+@bp.route('/api/system/off-cache', methods=['GET'])
+def get_off_cache_stats():
+    """Expose Open Food Facts cache counters and upstream client state of this worker."""
+    return jsonify({'pid': os.getpid(), **get_off_cache().stats(), 'upstream': get_off_client().stats()}), 200
+
+@bp.route('/api/system/events', methods=['GET'])
+def get_event_stats():
+    """Expose event stream fan-out counters of this worker."""
+    return jsonify({'pid': os.getpid(), **event_stats()}), 200
+
+# Listings of GET /api/products checked by explain-queries: (label, query parameters, cursor)
+HOT_PRODUCT_PAGES = (
+    ('products: page by expiry', {'sort': 'expiry'}, {'v': '2025-01-01', 'id': 0}),
+    ('products: location filter by expiry', {'location': 'Kühlschrank'}, None),
+    ('products: expiry range with location',
+     {'expiry_from': '2025-01-01', 'expiry_to': '2025-12-31', 'location': 'Kühlschrank'}, None),
+    ('products: page by name', {'sort': 'name'}, {'v': 'M', 'id': 0}),
+    ('products: newest first', {'sort': 'created'}, {'v': 100, 'id': 100}),
+    ('products: full-text search', {'search': 'milch', 'sort': 'created'}, None),
+)
+# The other hot queries of the routes, with sample parameters
+HOT_QUERIES = (
+    ('expiry buckets: refresh', EXPIRY_BUCKETS_REFRESH_SQL, {'today': '2025-01-01', 'horizon': '2025-01-08'}),
+    ('expiry buckets: list', EXPIRY_LIST_SQL, ()),
+    ('statistics: recent additions', STATS_RECENT_ADDITIONS_SQL, ('2025-01-01',)),
+    ('statistics: waste', WASTE_SQL, ()),
+    ('statistics: top scanned', TOP_SCANNED_SQL, ()),
+    ('check-duplicate: ean', DUPLICATE_BY_EAN_SQL, ('4025127020997',)),
+    ('check-duplicate: name', DUPLICATE_BY_NAME_SQL, ('Milch',)),
+    ('search: products', SEARCH_PRODUCTS_SQL, (SNIPPET_START, SNIPPET_END, '"milch"*', 20)),
+    ('search: barcode history', SEARCH_HISTORY_SQL, (SNIPPET_START, SNIPPET_END, '"milch"*', 20)),
+    ('shopping list: generate', SHOPPING_LIST_GENERATE_SQL, {'thresholds': '{}', 'default_threshold': 1}),
+    ('barcode history: recent', BARCODE_HISTORY_RECENT_SQL, (20,)),
+    ('barcode history: scan', BARCODE_HISTORY_BY_EAN_SQL, ('4025127020997',)),
+    ('changes: since', CHANGES_SINCE_SQL, (0, 1001)),
+    ('events: backlog', CHANGE_BACKLOG_SQL, (0,)),
+)
+# Tables that grow with use; reading one of them without an index counts as a full scan
+INDEXED_TABLES = ('products', 'barcode_history', 'change_log', 'shopping_list')
+TABLE_REFERENCE = re.compile(
+    r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|LEFT|INNER|CROSS|ON|USING|GROUP|ORDER|LIMIT)\b)(\w+))?',
+    re.IGNORECASE
+)
+
+def hot_queries():
+    """(label, sql, params) of every hot query, product pages built the way get_products() builds them."""
+    queries = []
+    for label, args, cursor in HOT_PRODUCT_PAGES:
+        conditions, params = build_product_filters(MultiDict(args))
+        valued, empty = product_page_queries(conditions, params, args.get('sort', 'expiry'), cursor)
+        if valued is not None:
+            queries.append((label, valued[0], valued[1] + [51]))
+        if empty is not None:
+            queries.append((f'{label}, rows without value', empty[0], empty[1] + [51]))
+        queries.append((f'{label}, total', *product_count_query(conditions, params)))
+    return queries + list(HOT_QUERIES)
+
+def full_scans(sql, plan):
+    """Plan lines of sql that read a whole INDEXED_TABLES table without an index."""
+    if re.search(r'\bLIMIT\b', sql, re.IGNORECASE) and not any('TEMP B-TREE' in line for line in plan):
+        # Rows come out in the requested order, so the scan stops after LIMIT rows
+        return []
+    tables = {}
+    for table, alias in TABLE_REFERENCE.findall(sql):
+        tables[table.lower()] = tables[(alias or table).lower()] = table.lower()
+    scans = []
+    for line in plan:
+        words = line.split()
+        if len(words) < 2 or words[0] != 'SCAN' or 'INDEX' in words or 'VIRTUAL' in words:
+            continue
+        if tables.get(words[1].lower(), words[1].lower()) in INDEXED_TABLES:
+            scans.append(line)
+    return scans
+
+def explain_hot_queries(conn):
+    """Return (label, plan lines, full scan?) for every hot query."""
+    report = []
+    for label, sql, params in hot_queries():
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        report.append((label, plan, bool(full_scans(sql, plan))))
+    return report
+
+@bp.cli.command('explain-queries')
+def explain_queries_command():
+    """Print EXPLAIN QUERY PLAN for the hot queries; exit 1 on full table scans."""
+    # Every household has the same schema, so the first one stands for all
+    databases = each_database()
+    try:
+        _, conn = next(databases, (None, None))
+        if conn is None:
+            raise click.ClickException("No household database yet")
+        report = explain_hot_queries(conn)
     finally:
-        conn.close()
+        databases.close()
+    for label, plan, full_scan in report:
+        print(f"{'FULL SCAN' if full_scan else 'ok':9}  {label}")
+        for line in plan:
+            print(f"           {line}")
+    scans = [label for label, _, full_scan in report if full_scan]
+    if scans:
+        print(f"{len(scans)} queries scan a whole table: {', '.join(scans)}")
+        raise SystemExit(1)
+
+def render_gauges(prefix, stats):
+    """Render the numeric entries of a stats dict as Prometheus gauges."""
+    lines = []
+    for key, value in sorted(stats.items()):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            lines.append(f'# TYPE {prefix}_{key} gauge')
+            lines.append(f'{prefix}_{key} {value}')
+    return lines
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of this worker process."""
+    lines = REQUEST_LATENCY.render() + QUERY_LATENCY.render() + UPSTREAM_LATENCY.render()
+    lines += ['# TYPE inventory_slow_queries_recent gauge', f'inventory_slow_queries_recent {len(_slow_queries)}']
+    pool = get_shared_pool()
+    lines += render_gauges('inventory_db_pool', pool.stats())
+    if pool.writer is not None:
+        lines += render_gauges('inventory_write_queue', pool.writer.stats())
+    lines += ['# TYPE inventory_tenant_pools_open gauge', f'inventory_tenant_pools_open {tenant_pools_open()}']
+    lines += render_gauges('inventory_off_cache', get_off_cache().stats())
+    if get_payload_cache() is not None:
+        lines += render_gauges('inventory_payload_cache', get_payload_cache().stats())
+    upstream = get_off_client().stats()
+    breaker = upstream.pop('breaker')
+    lines += render_gauges('inventory_off_upstream', upstream)
+    lines += render_gauges('inventory_off_breaker', breaker)
+    lines += ['# TYPE inventory_off_breaker_state gauge'] + [
+        f'inventory_off_breaker_state{{state="{state}"}} {int(breaker["state"] == state)}'
+        for state in ('closed', 'open', 'half_open')
+    ]
+    lines += render_gauges('inventory_events', event_stats())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/system/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """List the most recent slow queries of this worker."""
+    return jsonify({'pid': os.getpid(), 'threshold_ms': current_app.config['SLOW_QUERY_MS'],
+                    'queries': list(reversed(_slow_queries))}), 200
+
+def each_database():
+    """Yield (household, connection) for every database the CLI commands manage.
+
+    Without tenancy that is the one database (household None). Household
+    databases are opened without get_tenant_pool(), so they are not migrated
+    behind the command's back.
+    """
+    if not current_app.config['TENANCY']:
+        yield None, get_db_connection()
+        return
+    for tenant in list_tenants():
+        pool = open_pool(tenant_database(tenant), 1)
+        conn = pool.acquire()
+        try:
+            yield tenant, conn
+        finally:
+            pool.release(conn)
+            pool.close()
+
+def database_prefix(label):
+    return f"[{label}] " if label else ''
+
+db_cli = AppGroup('db', help='Manage the database schema.')
+bp.cli.add_command(db_cli)
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target', type=int, default=SCHEMA_VERSION, help='Stop after this schema version.')
+def db_upgrade_command(target):
+    """Apply pending schema migrations (to the shared and every household database with tenancy)."""
+    databases = each_database()
+    if current_app.config['TENANCY']:
+        databases = itertools.chain([('shared', get_shared_db_connection())], databases)
+    for label, conn in databases:
+        started = time.perf_counter()
+        applied = upgrade_db(conn, target)
+        elapsed = (time.perf_counter() - started) * 1000
+        if applied:
+            print(f"{database_prefix(label)}Applied migrations {', '.join(map(str, applied))} in {elapsed:.0f}ms, "
+                  f"schema at version {get_schema_version(conn)}")
+        else:
+            print(f"{database_prefix(label)}Schema is up to date (version {get_schema_version(conn)})")
+
+@db_cli.command('version')
+def db_version_command():
+    """Show the current and the expected schema version."""
+    for label, conn in each_database():
+        version = get_schema_version(conn)
+        print(f"{database_prefix(label)}Schema version {version}, application expects {SCHEMA_VERSION}")
+        for number, description, _ in MIGRATIONS:
+            if number > version:
+                print(f"  pending {number}: {description}")
+
+@bp.cli.command('gc-images')
+def gc_images_command():
+    """Delete uploaded images no product (of any household) references anymore.
+
+    This is the only place image files are deleted; uploads stored or referenced
+    again within the last day are kept, so a concurrent save cannot lose its file.
+    """
+    referenced = set()
+    for _, conn in each_database():
+        referenced |= image_references(conn)
+        conn.commit()
+    removed = sweep_orphan_images(referenced)
+    print(f"{removed} unreferenced images deleted")
+
+@bp.cli.command('compact-changes')
+@click.option('--days', type=int, default=None, help='Keep tombstones this many days (default: CHANGE_LOG_RETENTION_DAYS).')
+def compact_changes_command(days):
+    """Compact the delta sync change log."""
+    if days is None:
+        days = current_app.config['CHANGE_LOG_RETENTION_DAYS']
+    for label, conn in each_database():
+        removed, horizon = compact_change_log(conn, days)
+        conn.commit()
+        print(f"{database_prefix(label)}{removed} change log entries removed, sync horizon at seq {horizon}")
+
+@bp.cli.command('refresh-expiry')
+@click.option('--watch', is_flag=True, help='Keep running and refresh whenever the buckets go stale.')
+def refresh_expiry_command(watch):
+    """Recompute the expiry buckets (once, or continuously as a separate worker)."""
+    if watch and current_app.config['TENANCY']:
+        raise click.UsageError("--watch needs a single database; with tenancy readers refresh stale buckets")
+    for label, conn in each_database():
+        counts, added = refresh_expiry_buckets(conn, auto_shopping=current_app.config['AUTO_SHOPPING_LIST'])
+        conn.commit()
+        print(f"{database_prefix(label)}Expiry buckets: {counts}, {added} shopping items added")
+    if watch:
+        conn = get_db_connection()
+        scheduler = ExpiryScheduler(current_app._get_current_object())
+        while True:
+            result = scheduler.run_once(conn)
+            if result:
+                print(f"Expiry buckets: {result[0]}, {result[1]} shopping items added")
+            result = scheduler.maintain(conn) if scheduler.maintenance else None
+            if result:
+                print(f"Maintenance: {result[0]} change log entries, {result[1]} unreferenced images removed")
+            time.sleep(scheduler.interval)
+
+# --- Application Factory ---
+
+def create_app(config=None):
+    """Create the app from DefaultConfig, INVENTORY_* environment variables and config, in that order.
+
+    Nothing touches the disk or the network here; see startup().
+    """
+    app = Flask(__name__)
+    app.request_class = InventoryRequest
+    app.config.from_object(DefaultConfig)
+    app.config.from_prefixed_env('INVENTORY')
+    if config:
+        app.config.update(config)
+    # Background threads and a later chdir must see the same files
+    for key in ('DATABASE', 'UPLOADS_DIR', 'TENANT_DIR', 'SHARED_DATABASE'):
+        app.config[key] = os.path.abspath(app.config[key])
+    app.extensions['inventory'] = InventoryState()
+    app.register_blueprint(bp)
+    app.teardown_appcontext(release_db_connection)
+    return app
+
+def startup(app, migrate=True):
+    """One-time initialisation before serving: upload folders, schema and the page template.
+
+    Run it once per deployment. Under gunicorn --preload it runs in the master,
+    so the workers inherit the migrated schema and the compiled template
+    copy-on-write; pools, clients and threads are still created per worker.
+    With migrate=False the schema is only checked (the first request then
+    answers 503 or auto-migrates if it is outdated). With tenancy this is the
+    shared database; households are migrated when first opened.
+    """
+    os.makedirs(os.path.join(app.config['UPLOADS_DIR'], 'thumbs'), exist_ok=True)
+    if app.config['TENANCY']:
+        os.makedirs(app.config['TENANT_DIR'], exist_ok=True)
+    with app.app_context():
+        pool = get_shared_pool()
+        conn = pool.acquire()
+        try:
+            if migrate:
+                upgrade_db(conn)
+            app_state().schema_ready = get_schema_version(conn) >= SCHEMA_VERSION
+        finally:
+            pool.release(conn)
+            # Connections must not be shared with forked workers
+            pool.close_all()
+    app.jinja_env.get_template('index.html')
+    return app
+
+_default_app = None
+
+def __getattr__(name):
+    """Create `app` on first access, for 'flask --app app', 'gunicorn app:app' and 'from app import app'.
+
+    It does not migrate, so 'flask db upgrade' keeps control over the schema;
+    deployments that should migrate on start use wsgi.py.
+    """
+    global _default_app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _default_app is None:
+        _default_app = startup(create_app(), migrate=False)
+    return _default_app
 
 if __name__ == '__main__':
-    if not os.path.exists(DB_NAME):
-        init_db()
-    else:
-        # Run init anyway to check for migrations
-        init_db()
-    
     # Use 0.0.0.0 to make it accessible in the local network
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    startup(create_app()).run(debug=True, host='0.0.0.0', port=5000)
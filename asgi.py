@@ -0,0 +1,432 @@
+"""ASGI entry point that serves Open Food Facts lookups without blocking workers.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+GET /api/scan/<ean> and POST /api/scan/batch run as coroutines on an async
+HTTP client, so a slow upstream parks a coroutine instead of a worker thread;
+so does every open GET /api/events stream (up to ASGI_EVENTS_MAX_CLIENTS).
+Their SQLite work runs in a bounded thread pool (ASGI_DB_THREADS); every other
+route is the regular Flask app, served through a2wsgi from a second pool
+(ASGI_WSGI_THREADS). Responses are the same as with the WSGI deployment.
+
+Like wsgi.py it runs startup() (migrations included) when imported, and reads
+its configuration from INVENTORY_* environment variables. With tenancy the
+scan routes write to the household's database and share the OFF cache.
+
+Needs the optional packages: pip install starlette httpx a2wsgi uvicorn
+"""
+import asyncio
+import contextlib
+import json
+import queue
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import httpx
+import requests
+from a2wsgi import WSGIMiddleware
+from flask import g
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import BadRequest, HTTPException
+
+import app as inventory
+
+flask_app = inventory.startup(inventory.create_app())
+EAN_PATTERN = re.compile(r'^\d{8,13}$')
+
+
+class AsyncOpenFoodFactsClient:
+    """Async counterpart of OpenFoodFactsClient.
+
+    Shares the worker's circuit breaker and raises the same requests
+    exceptions, so OffProductCache and describe_off_error() apply unchanged.
+    """
+
+    RETRY_STATUS = inventory.OpenFoodFactsClient.RETRY_STATUS
+
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=5, retries=2,
+                 backoff=0.25, max_connections=100, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or inventory.CircuitBreaker()
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={'User-Agent': 'SmartKitchenInventory/1.0'}
+        )
+        self._requests = 0
+        self._retried = 0
+
+    async def _get(self, url):
+        for attempt in range(self.retries + 1):
+            self._requests += 1
+            try:
+                response = await self.client.get(url)
+            except httpx.ConnectTimeout as e:
+                if attempt == self.retries:
+                    raise requests.ConnectTimeout(str(e))
+            except httpx.TimeoutException as e:
+                # Read timeouts are not retried: the request already waited the full read timeout
+                raise requests.Timeout(str(e))
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise requests.ConnectionError(str(e))
+            else:
+                if response.status_code not in self.RETRY_STATUS or attempt == self.retries:
+                    if response.is_error:
+                        raise requests.HTTPError(f"{response.status_code} Error for url: {url}")
+                    return response
+            self._retried += 1
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def get_product(self, ean):
+        """Fetch a product; returns the product dict or None if OFF does not know the EAN."""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            self.breaker.before_call()
+            success = False
+            try:
+                response = await self._get(f"{self.base_url}/api/v0/product/{ean}.json")
+                try:
+                    product = inventory.parse_off_response(response.json())
+                except ValueError as e:
+                    raise requests.exceptions.InvalidJSONError(str(e))
+                success = True
+            finally:
+                # Every outcome is recorded, so a half-open trial can never stay running
+                self.breaker.record(success)
+            outcome = 'found' if product else 'not_found'
+            return product
+        except inventory.CircuitOpenError:
+            outcome = 'circuit_open'
+            raise
+        finally:
+            inventory.UPSTREAM_LATENCY.observe(time.perf_counter() - started, outcome)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self):
+        return {'base_url': self.base_url, 'requests': self._requests, 'retries': self._retried,
+                'breaker': self.breaker.stats()}
+
+
+class ScanService:
+    """Per-process state of the async scan routes, created when the server starts."""
+
+    def __init__(self):
+        config = flask_app.config
+        self.executor = ThreadPoolExecutor(max_workers=config['ASGI_DB_THREADS'], thread_name_prefix='asgi-db')
+        with flask_app.app_context():
+            breaker = inventory.get_off_client().breaker
+            self.cache = inventory.get_off_cache()
+        self.off = AsyncOpenFoodFactsClient(
+            config['OFF_BASE_URL'],
+            connect_timeout=config['OFF_CONNECT_TIMEOUT'],
+            read_timeout=config['OFF_READ_TIMEOUT'],
+            retries=config['OFF_RETRIES'],
+            backoff=config['OFF_RETRY_BACKOFF'],
+            max_connections=config['ASGI_OFF_MAX_CONNECTIONS'],
+            breaker=breaker
+        )
+        self.schema_ready = False
+        self._inflight = {}
+
+    @staticmethod
+    def _call_in_app(func, args, tenant):
+        with flask_app.app_context():
+            if tenant is not None:
+                g.tenant = tenant
+            return func(*args)
+
+    @staticmethod
+    def _call_db(func, args, tenant, shared):
+        def call():
+            conn = inventory.get_shared_db_connection() if shared else inventory.get_db_connection()
+            if conn is None:
+                raise inventory.PoolTimeout("Database connection failed")
+            return func(conn, *args)
+        return ScanService._call_in_app(call, (), tenant)
+
+    async def run_in_app(self, func, *args, tenant=None):
+        """Run func(*args) in an app context (for the household) in the database thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call_in_app, func, args, tenant)
+
+    async def run_db(self, func, *args, tenant=None):
+        """Run func(conn, *args) on a pooled connection of the household's database in the database thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._call_db, func, args, tenant, False)
+
+    async def run_shared_db(self, func, *args):
+        """Like run_db() on the database all households share (the only one without tenancy)."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._call_db, func, args, None, True)
+
+    async def ensure_schema(self):
+        """Apply the Flask schema gate (503 or AUTO_MIGRATE) until it passes once."""
+        if not self.schema_ready:
+            await self.run_shared_db(lambda conn: inventory.check_schema_version())
+            self.schema_ready = True
+
+    async def lookup(self, ean, persist=True):
+        """Async OffProductCache.lookup(): concurrent misses for one EAN share a single upstream call.
+
+        With persist=False the entry is only kept in memory and the caller
+        writes it to off_cache (as the batch route does, in one transaction).
+        """
+        entry = self.cache.peek(ean)
+        if entry is None:
+            entry = await self.run_shared_db(lambda conn: self.cache.peek(ean, conn))
+        if entry is not None:
+            return entry
+
+        flight = self._inflight.get(ean)
+        if flight is not None:
+            self.cache.count('coalesced')
+            return await asyncio.shield(flight)
+        flight = self._inflight[ean] = asyncio.get_running_loop().create_future()
+        self.cache.count('misses')
+        try:
+            try:
+                product = await self.off.get_product(ean)
+            except (requests.RequestException, inventory.CircuitOpenError):
+                if persist:
+                    entry = await self.run_shared_db(lambda conn: self.cache.fallback(ean, conn))
+                else:
+                    entry = self.cache.fallback(ean)
+                if entry is None:
+                    raise
+            else:
+                entry = self.cache.record(ean, product)
+                if persist:
+                    await self.run_in_app(inventory.save_off_entry, ean, entry)
+            flight.set_result(entry)
+            return entry
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # Callers without waiters must not log "never retrieved"
+            raise
+        finally:
+            self._inflight.pop(ean, None)
+
+    async def close(self):
+        await self.off.aclose()
+        self.executor.shutdown(wait=False)
+
+
+class AsyncSubscriber(queue.Queue):
+    """ChangeBroadcaster subscriber queue that wakes a coroutine on the event loop for every put."""
+
+    def __init__(self, loop, maxsize):
+        super().__init__(maxsize)
+        self.loop = loop
+        self.ready = asyncio.Event()
+
+    def _put(self, item):
+        # Runs on the broadcaster thread
+        super()._put(item)
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            pass  # The loop is closed, the stream with it
+
+    async def next_event(self, timeout):
+        """Return the next event (None when dropped as too slow); raises TimeoutError after timeout seconds."""
+        while True:
+            self.ready.clear()
+            try:
+                return self.get_nowait()
+            except queue.Empty:
+                pass
+            await asyncio.wait_for(self.ready.wait(), timeout)
+
+
+def request_tenant(request):
+    """Household of the request as in inventory.current_tenant(): None without tenancy, 400 if missing or invalid."""
+    if not flask_app.config['TENANCY']:
+        return None
+    header = flask_app.config['TENANT_HEADER']
+    tenant = inventory.parse_tenant(request.headers.get(header) or request.cookies.get(inventory.TENANT_COOKIE))
+    if tenant is None:
+        raise BadRequest(f"Missing or invalid household: send the {header} header or open /?household=<id> once")
+    return tenant
+
+
+def timed(rule):
+    """Observe route latency like the Flask request hooks and turn HTTP errors into JSON."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            try:
+                response = await handler(request)
+            except HTTPException as e:
+                response = JSONResponse({'error': e.name, 'message': str(e.description)}, e.code)
+            if flask_app.config['METRICS_ENABLED']:
+                duration = time.perf_counter() - started
+                inventory.REQUEST_LATENCY.observe(duration, rule, request.method, response.status_code)
+                response.headers['Server-Timing'] = f'app;dur={duration * 1000:.2f}'
+            return response
+        return wrapper
+    return decorator
+
+
+@timed('/api/scan/<ean>')
+async def scan_product(request):
+    """Async GET /api/scan/<ean>."""
+    ean = request.path_params['ean']
+    if not EAN_PATTERN.match(ean):
+        raise BadRequest("Invalid EAN format")
+    tenant = request_tenant(request)
+    service = request.app.state.scans
+    await service.ensure_schema()
+
+    try:
+        entry = await service.lookup(ean)
+    except Exception as e:
+        status, message = inventory.describe_off_error(e)
+        return JSONResponse({'found': False, 'error': message}, status)
+
+    if not entry['found']:
+        return JSONResponse({'found': False, 'message': 'Produkt nicht in der Datenbank gefunden'}, 404)
+
+    info = inventory.summarize_off_product(entry['product'])
+    await service.run_in_app(inventory.record_scan, ean, info, tenant=tenant)
+    return JSONResponse({'found': True, **{k: info[k] for k in inventory.SCAN_RESULT_FIELDS}})
+
+
+@timed('/api/scan/batch')
+async def scan_batch(request):
+    """Async POST /api/scan/batch, streaming one NDJSON result line per EAN."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not isinstance(data.get('eans'), list):
+        raise BadRequest("Request body must be JSON with an 'eans' list")
+
+    eans = list(dict.fromkeys(str(ean).strip() for ean in data['eans']))
+    if not eans:
+        raise BadRequest("At least one EAN is required")
+    if len(eans) > flask_app.config['SCAN_BATCH_MAX']:
+        raise BadRequest(f"At most {flask_app.config['SCAN_BATCH_MAX']} EANs per batch")
+
+    tenant = request_tenant(request)
+    service = request.app.state.scans
+    await service.ensure_schema()
+    history_rows = []
+    fetched = {}
+    misses = []
+    local_results = await service.run_db(
+        lambda conn: list(inventory.local_scan_results(conn, inventory.get_shared_db_connection(), service.cache,
+                                                       eans, history_rows, misses)),
+        tenant=tenant)
+
+    def line(result):
+        return json.dumps(result, ensure_ascii=False) + '\n'
+
+    async def resolve(ean):
+        try:
+            return ean, await service.lookup(ean, persist=False), None
+        except Exception as e:
+            return ean, None, e
+
+    async def generate():
+        found_count = 0
+        for result in local_results:
+            found_count += result['found']
+            yield line(result)
+
+        # Every miss is in flight at once; ASGI_OFF_MAX_CONNECTIONS bounds the upstream
+        for next_done in asyncio.as_completed([resolve(ean) for ean in misses]):
+            ean, entry, error = await next_done
+            if error is not None:
+                status, message = inventory.describe_off_error(error)
+                yield line({'ean': ean, 'status': status, 'found': False, 'error': message})
+                continue
+            result = inventory.upstream_scan_result(ean, entry, history_rows, fetched)
+            found_count += result['found']
+            yield line(result)
+
+        await service.run_in_app(
+            inventory.persist_scan_batch, service.cache, fetched, history_rows, tenant=tenant)
+        yield line({'summary': {'requested': len(eans), 'found': found_count,
+                                'upstream_lookups': len(misses)}})
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+@timed('/api/events')
+async def change_events(request):
+    """Async GET /api/events; beyond ASGI_EVENTS_MAX_CLIENTS streams clients get a short poll."""
+    last_id = inventory.parse_event_id(request.headers.get('Last-Event-ID', request.query_params.get('since')))
+    tenant = request_tenant(request)
+    service = request.app.state.scans
+    await service.ensure_schema()
+    broadcaster, clients = await service.run_in_app(
+        lambda: (inventory.get_broadcaster(), inventory.event_stats()['clients']), tenant=tenant)
+
+    if clients >= flask_app.config['ASGI_EVENTS_MAX_CLIENTS']:
+        body = await service.run_db(inventory.short_poll_events, last_id, tenant=tenant)
+        return Response(body, media_type='text/event-stream', headers=inventory.EVENT_STREAM_HEADERS)
+
+    subscriber = broadcaster.subscribe(AsyncSubscriber(asyncio.get_running_loop(), broadcaster.queue_size))
+    try:
+        backlog = None
+        if last_id is not None:
+            backlog = await service.run_db(inventory.change_backlog, last_id, tenant=tenant)
+    except BaseException:
+        broadcaster.unsubscribe(subscriber)
+        raise
+
+    heartbeat = flask_app.config['EVENTS_HEARTBEAT']
+    max_duration = flask_app.config['EVENTS_MAX_DURATION']
+
+    async def generate():
+        try:
+            yield f"retry: {heartbeat * 1000}\n\n"
+            if backlog:
+                yield inventory.format_change_event(backlog)
+            deadline = time.monotonic() + max_duration
+            while time.monotonic() < deadline:
+                try:
+                    event = await subscriber.next_event(heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                if last_id is None or event['seq'] > last_id:
+                    yield inventory.format_change_event(event)
+        finally:
+            # Also runs when the client disconnects and the stream is cancelled
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=inventory.EVENT_STREAM_HEADERS)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(asgi_app):
+    service = asgi_app.state.scans = ScanService()
+    try:
+        yield
+    finally:
+        await service.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/scan/batch', scan_batch, methods=['POST']),
+        Route('/api/scan/{ean}', scan_product, methods=['GET']),
+        Route('/api/events', change_events, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_THREADS']))
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1 @@
+"""Benchmark harness for the inventory API (not a test suite)."""
@@ -0,0 +1,9 @@
+"""ASGI entry point for benchmarking under uvicorn (the async twin of bench/wsgi.py)."""
+import os
+
+from asgi import app, flask_app
+
+__all__ = ['app']  # Served by uvicorn bench.asgi:app
+
+if os.environ.get('OFF_BASE_URL'):
+    flask_app.config['OFF_BASE_URL'] = os.environ['OFF_BASE_URL']
@@ -0,0 +1,119 @@
+"""Latency and memory of the full product listing (GET /api/products) by serializer.
+
+    python -m bench.listing --size 100k --runs 15 --out listing.json
+
+Compares the former path (sqlite3.Row -> dict -> jsonify), orjson over
+tuples with the column names hoisted (if installed), the SQLite
+json_group_array path of the route without and with the payload cache. Each
+path runs in a fresh interpreter on a copy of the seeded database; latency is
+the median over --runs requests, memory the growth of the process's peak RSS
+while serving them (Linux kB) and, for the cache, the bytes it holds.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from bench.run import REPO, git_commit, prepare_workdir
+from bench.seed import parse_size
+
+PATHS = ('jsonify', 'orjson', 'sqlite', 'sqlite_cached')
+# Runs in a fresh interpreter inside the work directory; argv: path, runs
+LISTING_PROBE = '''
+import json, resource, statistics, sys, time
+import app as inventory
+from flask import Response, jsonify
+
+path, runs = sys.argv[1], int(sys.argv[2])
+config = {'EXPIRY_SCHEDULER': False, 'PAYLOAD_CACHE_BYTES': 512 * 1024 * 1024 if path == 'sqlite_cached' else 0}
+app = inventory.startup(inventory.create_app(config))
+
+def legacy():
+    conn = inventory.get_db_connection()
+    return jsonify([dict(row) for row in conn.execute('SELECT * FROM products').fetchall()])
+
+def with_orjson():
+    import orjson
+    cursor = inventory.get_db_connection().execute('SELECT * FROM products')
+    columns = [column[0] for column in cursor.description]
+    body = orjson.dumps([dict(zip(columns, row)) for row in cursor.fetchall()], option=orjson.OPT_SORT_KEYS)
+    return Response(body, mimetype='application/json')
+
+app.add_url_rule('/bench/jsonify', view_func=legacy)
+app.add_url_rule('/bench/orjson', view_func=with_orjson)
+url = {'jsonify': '/bench/jsonify', 'orjson': '/bench/orjson'}.get(path, '/api/products')
+client = app.test_client()
+client.get('/api/statistics')
+baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+timings = []
+for _ in range(runs):
+    started = time.perf_counter()
+    response = client.get(url)
+    body = response.get_data()
+    timings.append(time.perf_counter() - started)
+    assert response.status_code == 200, response.status_code
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+with app.app_context():
+    cache = inventory.get_payload_cache()
+    cache_bytes = cache.stats()['bytes'] if cache else 0
+print(json.dumps({
+    'first_ms': round(timings[0] * 1000, 1),
+    'median_ms': round(statistics.median(timings[1:] or timings) * 1000, 1),
+    'payload_bytes': len(body),
+    'products': len(json.loads(body)),
+    'peak_rss_growth_kb': peak_kb - baseline_kb,
+    'cache_bytes': cache_bytes
+}))
+'''
+
+
+def measure(workdir, path, runs):
+    output = subprocess.run(
+        [sys.executable, '-c', LISTING_PROBE, path, str(runs)], cwd=workdir, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONPATH': REPO}
+    )
+    if output.returncode != 0:
+        return {'error': output.stderr.strip().splitlines()[-1]}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='100k', help='Household size of the seeded database')
+    parser.add_argument('--runs', type=int, default=15, help='Requests per path (the first one is reported apart)')
+    parser.add_argument('--paths', default=','.join(PATHS))
+    parser.add_argument('--reseed', action='store_true', help='Seed the database again')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    label = args.size.strip().lower()
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'size': label,
+            'runs': args.runs
+        },
+        'paths': {}
+    }
+    for path in args.paths.split(','):
+        workdir = prepare_workdir(label, parse_size(label), f'listing-{path}', args.reseed)
+        args.reseed = False
+        print(f"Measuring {path}...", file=sys.stderr)
+        report['paths'][path] = measure(workdir, path, args.runs)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+        print(f"Report written to {args.out}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
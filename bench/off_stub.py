@@ -0,0 +1,75 @@
+"""Local stand-in for the Open Food Facts product API.
+
+    python -m bench.off_stub --port 8099 --delay 0.08
+
+Answers /api/v0/product/<ean>.json after a fixed delay. EANs ending in 0 are
+unknown (status 0), everything else is found, so benchmarks exercise both
+cache paths without touching the real service.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+
+    def do_GET(self):
+        parts = self.path.rstrip('/').split('/')
+        if len(parts) < 5 or parts[1:4] != ['api', 'v0', 'product'] or not parts[4].endswith('.json'):
+            self._send(404, {'status': 0})
+            return
+        time.sleep(self.delay)
+        ean = parts[4][:-5]
+        if ean.endswith('0'):
+            self._send(200, {'code': ean, 'status': 0, 'status_verbose': 'product not found'})
+            return
+        self._send(200, {'code': ean, 'status': 1, 'product': {
+            'product_name': f'Testprodukt {ean[-4:]}',
+            'brands': 'Bench',
+            'quantity': '500g',
+            'categories': 'Lebensmittel, Snacks',
+            'image_url': '',
+            'ingredients_analysis_tags': ['en:vegetarian']
+        }})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(port=0, delay=0.0):
+    """Serve in a daemon thread; returns the server (its port is server.server_address[1])."""
+    handler = type('Handler', (StubHandler,), {'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='off-stub', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--delay', type=float, default=0.08, help='Seconds per lookup')
+    args = parser.parse_args()
+    server = start(args.port, args.delay)
+    print(f"OFF stub on http://127.0.0.1:{server.server_address[1]} ({args.delay * 1000:.0f}ms per lookup)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
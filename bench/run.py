@@ -0,0 +1,426 @@
+"""Drive every API route and report latency percentiles and throughput as JSON.
+
+    python -m bench.run --sizes 1k,10k --mode both --requests 200 --out bench/results.json
+
+For each household size a seeded database is copied into a fresh work
+directory, Open Food Facts is replaced by bench.off_stub, and the routes are
+exercised through the Flask test client (in a child process, sequential) and
+a real gunicorn instance (concurrent HTTP clients). The SSE stream
+/api/events is not request/response shaped and is left out. Export and
+import move the whole inventory per request, so they run once per format
+after the other routes and report rows/s (see run_bulk()).
+"""
+import argparse
+import base64
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench import off_stub
+from bench.seed import parse_size, seed
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO, 'bench', 'data')
+
+# 1x1 PNG for the upload route
+PIXEL_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+SEARCH_TERMS = ('milch', 'joghurt bio', 'spag', 'tomaten', 'käse', 'schoko', 'wasser', 'reis')
+LOCATIONS = ('Kühlschrank', 'Vorratsschrank', 'Gefrierschrank', 'Keller')
+# The legacy unpaginated listing returns every row; above this size it is skipped
+FULL_LIST_MAX = 100_000
+
+
+# --- Drivers ---
+
+class ClientDriver:
+    """Requests through the Flask test client inside this process."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, url, json=None, data=None, headers=None, timeout=None):
+        response = self.client.open(url, method=method, json=json, data=data, headers=headers)
+        body = response.get_data()
+        return response.status_code, body, response.headers
+
+
+class HttpDriver:
+    """Requests against a running server, one keep-alive session per thread."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._local = threading.local()
+
+    def request(self, method, url, json=None, data=None, headers=None, timeout=120):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.request(method, self.base_url + url, json=json, data=data, headers=headers,
+                                   timeout=timeout)
+        return response.status_code, response.content, response.headers
+
+
+# --- Scenarios ---
+
+class Context:
+    """Ids and keys the scenarios draw from, collected through the API itself."""
+
+    def __init__(self, driver, products, pool_size):
+        self.rng = random.Random(7)
+        self.products = products
+        _, body, _ = driver.request('GET', '/api/products?sort=created&limit=500')
+        self.product_ids = [p['id'] for p in json.loads(body)['items']]
+        _, body, _ = driver.request('GET', '/api/barcode-history?limit=200')
+        self.eans = [h['ean'] for h in json.loads(body)] or ['4000000000017']
+        _, body, _ = driver.request('GET', '/api/products?sort=expiry&limit=50')
+        self.cursor = json.loads(body)['next_cursor']
+        _, _, headers = driver.request('GET', '/api/products?limit=50')
+        self.etag = headers.get('ETag')
+        _, body, _ = driver.request('GET', '/api/changes')
+        self.seq = json.loads(body)['next']
+
+        # Rows the delete scenarios consume
+        _, body, _ = driver.request('POST', '/api/products/batch', json={
+            'create': [{'name': f'Löschkandidat {i}', 'quantity': 1} for i in range(pool_size)]})
+        self.deletable = [r['id'] for r in json.loads(body)['results']['create'] if r['status'] == 'ok']
+        for i in range(pool_size):
+            driver.request('POST', '/api/shopping-list', json={'name': f'Bench {i}', 'quantity': 1})
+        _, body, _ = driver.request('GET', '/api/shopping-list')
+        self.shopping_ids = [item['id'] for item in json.loads(body)]
+        self._fresh_ean = 0
+
+    def product_id(self):
+        return self.rng.choice(self.product_ids)
+
+    def fresh_ean(self):
+        """An EAN not seen before, so the lookup reaches the upstream stub."""
+        self._fresh_ean += 1
+        return f'49{self.rng.randint(0, 99999):05d}{self._fresh_ean:06d}'
+
+
+def scenarios(ctx):
+    """(name, method, request factory, repeat factor); factories return (url, kwargs)."""
+    r = ctx.rng
+    return [
+        ('GET /', 'GET', lambda: ('/', {}), 1),
+        ('GET /api/products (full list)', 'GET', lambda: ('/api/products', {}),
+         0.1 if ctx.products <= FULL_LIST_MAX else 0),
+        ('GET /api/products (304)', 'GET',
+         lambda: ('/api/products?limit=50', {'headers': {'If-None-Match': ctx.etag}}), 1),
+        ('GET /api/products?sort=expiry', 'GET', lambda: ('/api/products?sort=expiry&limit=50', {}), 1),
+        ('GET /api/products?cursor', 'GET',
+         lambda: (f'/api/products?sort=expiry&limit=50&cursor={ctx.cursor}', {}), 1),
+        ('GET /api/products?location&sort=name', 'GET',
+         lambda: (f'/api/products?location={r.choice(LOCATIONS)}&sort=name&limit=50', {}), 1),
+        ('GET /api/products?search', 'GET',
+         lambda: (f'/api/products?search={r.choice(SEARCH_TERMS)}&limit=50', {}), 1),
+        ('POST /api/products', 'POST', lambda: ('/api/products', {'json': {
+            'name': f'Bench {r.randint(0, 10**6)}', 'ean': r.choice(ctx.eans), 'quantity': r.randint(1, 5),
+            'location': r.choice(LOCATIONS), 'category': 'Snacks', 'price': 1.49, 'expiry_date': '2027-03-01'}}), 1),
+        ('PUT /api/products/<id>', 'PUT', lambda: (f'/api/products/{ctx.product_id()}', {'json': {
+            'name': f'Umbenannt {r.randint(0, 10**6)}', 'quantity': r.randint(1, 9), 'location': r.choice(LOCATIONS),
+            'expiry_date': '2027-01-15', 'price': 2.29}}), 1),
+        ('DELETE /api/products/<id>', 'DELETE',
+         lambda: (f'/api/products/{ctx.deletable.pop() if ctx.deletable else 0}', {}), 1),
+        ('POST /api/products/batch', 'POST', lambda: ('/api/products/batch', {'json': {
+            'create': [{'name': f'Batch {i}', 'quantity': 2, 'location': 'Keller'} for i in range(50)],
+            'quantity_delta': [{'id': ctx.product_id(), 'delta': 1} for _ in range(50)]}}), 0.25),
+        ('POST /api/products/check-duplicate', 'POST', lambda: ('/api/products/check-duplicate', {'json': {
+            'ean': r.choice(ctx.eans), 'name': 'Vollmilch'}}), 1),
+        ('POST /api/images', 'POST', lambda: ('/api/images', {
+            'data': PIXEL_PNG, 'headers': {'Content-Type': 'image/png'}}), 1),
+        ('GET /api/statistics', 'GET', lambda: ('/api/statistics', {}), 1),
+        ('GET /api/statistics/advanced', 'GET', lambda: ('/api/statistics/advanced', {}), 1),
+        ('GET /api/expiry', 'GET', lambda: ('/api/expiry', {}), 1),
+        ('GET /api/search', 'GET', lambda: (f'/api/search?q={r.choice(SEARCH_TERMS)}&limit=20', {}), 1),
+        ('GET /api/scan/<ean> (catalog)', 'GET', lambda: (f'/api/scan/{r.choice(ctx.eans)}', {}), 1),
+        ('GET /api/scan/<ean> (upstream)', 'GET', lambda: (f'/api/scan/{ctx.fresh_ean()}', {}), 0.5),
+        ('POST /api/scan/batch', 'POST', lambda: ('/api/scan/batch', {'json': {
+            'eans': [ctx.fresh_ean() for _ in range(10)] + r.sample(ctx.eans, min(10, len(ctx.eans)))}}), 0.25),
+        ('GET /api/shopping-list', 'GET', lambda: ('/api/shopping-list', {}), 1),
+        ('POST /api/shopping-list', 'POST', lambda: ('/api/shopping-list', {'json': {
+            'name': f'Artikel {r.randint(0, 10**6)}', 'quantity': 1, 'category': 'Snacks'}}), 1),
+        ('PUT /api/shopping-list/<id>', 'PUT', lambda: (f'/api/shopping-list/{r.choice(ctx.shopping_ids)}', {
+            'json': {'name': 'Bench', 'quantity': 2, 'checked': r.random() < 0.5}}), 1),
+        ('DELETE /api/shopping-list/<id>', 'DELETE',
+         lambda: (f'/api/shopping-list/{ctx.shopping_ids.pop() if ctx.shopping_ids else 0}', {}), 0.5),
+        ('POST /api/shopping-list/generate', 'POST', lambda: ('/api/shopping-list/generate', {'json': {}}), 0.25),
+        ('DELETE /api/shopping-list/clear-checked', 'DELETE', lambda: ('/api/shopping-list/clear-checked', {}), 0.25),
+        ('GET /api/barcode-history', 'GET', lambda: ('/api/barcode-history?limit=20', {}), 1),
+        ('GET /api/changes', 'GET', lambda: (f'/api/changes?since={ctx.seq}&limit=500', {}), 1),
+        ('GET /metrics', 'GET', lambda: ('/metrics', {}), 1),
+        ('GET /api/system/db-pool', 'GET', lambda: ('/api/system/db-pool', {}), 1),
+        ('GET /api/system/off-cache', 'GET', lambda: ('/api/system/off-cache', {}), 1),
+        ('GET /api/system/events', 'GET', lambda: ('/api/system/events', {}), 1),
+        ('GET /api/system/slow-queries', 'GET', lambda: ('/api/system/slow-queries', {}), 1),
+    ]
+
+
+# --- Measurement ---
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def summarize(latencies, errors, wall):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'rps': round(len(latencies) / wall, 1) if wall > 0 else None
+    }
+
+def run_scenarios(driver, products, requests_per_route, concurrency=1, warmup=3):
+    """Time every scenario; returns {name: summary}."""
+    ctx = Context(driver, products, pool_size=requests_per_route + warmup)
+    results = {}
+    for name, method, factory, repeat in scenarios(ctx):
+        count = int(requests_per_route * repeat)
+        if count == 0:
+            results[name] = {'skipped': f'more than {FULL_LIST_MAX} products'}
+            continue
+        count = max(count, 5)
+        errors = 0
+
+        def call():
+            url, kwargs = factory()
+            started = time.perf_counter()
+            status, _, _ = driver.request(method, url, **kwargs)
+            return time.perf_counter() - started, status
+
+        for _ in range(warmup):
+            call()
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes = list(executor.map(lambda _: call(), range(count)))
+        else:
+            outcomes = [call() for _ in range(count)]
+        wall = time.perf_counter() - started
+        errors = sum(1 for _, status in outcomes if status >= 400)
+        results[name] = summarize([duration for duration, _ in outcomes], errors, wall)
+    return results
+
+
+# Export formats and the Content-Type their file is imported with
+BULK_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+# Seconds one export or import may take over HTTP (1m products import in minutes)
+BULK_TIMEOUT = 3600
+
+def bulk_summary(status, seconds, rows, size):
+    return {
+        'requests': 1,
+        'errors': int(status >= 400),
+        'seconds': round(seconds, 2),
+        'rows': rows,
+        'rows_per_s': round(rows / seconds) if seconds > 0 else None,
+        'file_mb': round(size / 2**20, 1)
+    }
+
+def run_bulk(driver):
+    """Export all products once per format, then import each file again; returns {name: summary}.
+
+    Both exports see the same inventory; the imports add copies of it, so
+    this runs after the other scenarios.
+    """
+    # The scenarios have added rows since seeding
+    _, body, _ = driver.request('GET', '/api/statistics')
+    rows = json.loads(body)['total_products']
+    results = {}
+    files = {}
+    for fmt in BULK_FORMATS:
+        started = time.perf_counter()
+        status, files[fmt], _ = driver.request('GET', f'/api/export?format={fmt}', timeout=BULK_TIMEOUT)
+        results[f'GET /api/export?format={fmt}'] = bulk_summary(
+            status, time.perf_counter() - started, rows if status < 400 else 0, len(files[fmt]))
+    for fmt, content_type in BULK_FORMATS.items():
+        data = files.pop(fmt)
+        started = time.perf_counter()
+        status, response, _ = driver.request('POST', f'/api/import?format={fmt}', data=data,
+                                             headers={'Content-Type': content_type}, timeout=BULK_TIMEOUT)
+        imported = json.loads(response)['imported'] if status < 400 else 0
+        results[f'POST /api/import?format={fmt}'] = bulk_summary(
+            status, time.perf_counter() - started, imported, len(data))
+    return results
+
+
+# --- Orchestration ---
+
+def prepare_workdir(size_label, products, mode, reseed):
+    """Seed (once per size) and copy the pristine database into a fresh work directory."""
+    size_dir = os.path.join(DATA_DIR, size_label)
+    seed_db = os.path.join(size_dir, 'seed.db')
+    if reseed or not os.path.exists(seed_db):
+        print(f"Seeding {products} products...", file=sys.stderr)
+        with contextlib.redirect_stdout(sys.stderr):
+            print(seed(seed_db, products))
+    workdir = os.path.join(size_dir, f'run-{mode}')
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    shutil.copy(seed_db, os.path.join(workdir, 'inventory.db'))
+    return workdir
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def run_client(workdir, products, off_url, requests_per_route):
+    """Benchmark through the test client in a child process (clean module state, own cwd)."""
+    result_file = os.path.join(workdir, 'result.json')
+    subprocess.run(
+        [sys.executable, '-m', 'bench.run', '--child', workdir, '--products', str(products),
+         '--requests', str(requests_per_route), '--result-file', result_file],
+        cwd=REPO, env={**os.environ, 'OFF_BASE_URL': off_url}, check=True, stdout=sys.stderr
+    )
+    with open(result_file) as f:
+        return json.load(f)
+
+def child_main(workdir, products, requests_per_route, result_file):
+    os.chdir(workdir)
+    sys.path.insert(0, REPO)
+    from app import create_app, startup
+    app = startup(create_app({'OFF_BASE_URL': os.environ['OFF_BASE_URL']}))
+    driver = ClientDriver(app)
+    results = run_scenarios(driver, products, requests_per_route)
+    results.update(run_bulk(driver))
+    with open(result_file, 'w') as f:
+        json.dump(results, f)
+
+@contextlib.contextmanager
+def serve(command, workdir, off_url, name='server', env=None):
+    """Run a server command (with {port} filled in) in workdir; yields (base URL, process) once it answers.
+
+    env adds variables (e.g. INVENTORY_* settings) to the server's environment.
+    """
+    port = free_port()
+    log = open(os.path.join(workdir, f'{name}.log'), 'w')
+    server = subprocess.Popen(
+        [part.format(port=port) for part in command], cwd=workdir,
+        env={**os.environ, 'OFF_BASE_URL': off_url, **(env or {})}, stdout=log, stderr=log
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(base_url + '/api/system/db-pool', timeout=1).ok:
+                    break
+            except requests.ConnectionError:
+                pass
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"{name} did not start, see {log.name}")
+            time.sleep(0.2)
+        yield base_url, server
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        log.close()
+
+def gunicorn_command(workers, threads=None):
+    """gunicorn serving bench.wsgi:app; gthread workers when threads is given, sync workers otherwise."""
+    worker_class = ['-k', 'gthread', '--threads', str(threads)] if threads else []
+    return [sys.executable, '-m', 'gunicorn', '-w', str(workers), *worker_class, '-b', '127.0.0.1:{port}',
+            '--pythonpath', REPO, 'bench.wsgi:app']
+
+def run_gunicorn(workdir, products, off_url, requests_per_route, workers, threads, concurrency):
+    """Benchmark a real gunicorn instance over HTTP."""
+    with serve(gunicorn_command(workers, threads), workdir, off_url, 'gunicorn') as (base_url, _):
+        driver = HttpDriver(base_url)
+        results = run_scenarios(driver, products, requests_per_route, concurrency=concurrency)
+        results.update(run_bulk(driver))
+        return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1k,10k', help='Comma separated: 1k, 10k, 100k, 1m or numbers')
+    parser.add_argument('--mode', choices=('client', 'gunicorn', 'both'), default='both')
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per route')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent HTTP clients against gunicorn')
+    parser.add_argument('--off-delay', type=float, default=0.08, help='Seconds the OFF stub takes per lookup')
+    parser.add_argument('--reseed', action='store_true', help='Rebuild cached seed databases')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--products', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args.child, args.products, args.requests, args.result_file)
+        return
+
+    stub = off_stub.start(delay=args.off_delay)
+    off_url = f'http://127.0.0.1:{stub.server_address[1]}'
+    modes = ('client', 'gunicorn') if args.mode == 'both' else (args.mode,)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'requests_per_route': args.requests,
+            'gunicorn': {'workers': args.workers, 'threads': args.threads, 'concurrency': args.concurrency},
+            'off_stub_delay_ms': args.off_delay * 1000
+        },
+        'runs': []
+    }
+    for label in args.sizes.split(','):
+        label = label.strip().lower()
+        products = parse_size(label)
+        for mode in modes:
+            workdir = prepare_workdir(label, products, mode, args.reseed)
+            print(f"Benchmarking {label} products via {mode}...", file=sys.stderr)
+            started = time.perf_counter()
+            if mode == 'client':
+                endpoints = run_client(workdir, products, off_url, args.requests)
+            else:
+                endpoints = run_gunicorn(workdir, products, off_url, args.requests,
+                                         args.workers, args.threads, args.concurrency)
+            report['runs'].append({'size': label, 'products': products, 'mode': mode,
+                                   'seconds': round(time.perf_counter() - started, 1), 'endpoints': endpoints})
+    stub.shutdown()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+        print(f"Report written to {args.out}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Concurrent barcode scans against a slow upstream: sync vs. gthread vs. ASGI.
+
+    python -m bench.scan_storm --clients 50 --scans 200 --off-delay 1.0
+
+Every scan uses a new EAN, so each one waits for the OFF stub. While the scans
+run, a probe requests GET /api/statistics in a loop to show whether the other
+routes stay responsive. Reports scans/s and latency percentiles as JSON.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import off_stub
+from bench.run import HttpDriver, REPO, git_commit, gunicorn_command, prepare_workdir, serve, summarize
+from bench.seed import parse_size
+
+
+def uvicorn_command(workers):
+    return [sys.executable, '-m', 'uvicorn', 'bench.asgi:app', '--app-dir', REPO, '--host', '127.0.0.1',
+            '--port', '{port}', '--workers', str(workers), '--no-access-log']
+
+def storm(base_url, clients, scans):
+    """Fire scans from concurrent clients while probing a cheap route; returns both summaries."""
+    driver = HttpDriver(base_url)
+    counter = itertools.count(1)
+    done = threading.Event()
+    probes = []
+
+    def scan(_):
+        # 49xxxxxxxxxxx: never in the seeded catalog; the stub knows EANs not ending in 0
+        ean = f'49{next(counter):010d}1'
+        started = time.perf_counter()
+        status, _, _ = driver.request('GET', f'/api/scan/{ean}')
+        return time.perf_counter() - started, status
+
+    def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            status, _, _ = driver.request('GET', '/api/statistics')
+            probes.append((time.perf_counter() - started, status))
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe, daemon=True)
+    prober.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        outcomes = list(executor.map(scan, range(scans)))
+    wall = time.perf_counter() - started
+    done.set()
+    prober.join()
+    return {
+        'scans': summarize([d for d, _ in outcomes], sum(1 for _, s in outcomes if s >= 400), wall),
+        'probe_statistics': summarize([d for d, _ in probes], sum(1 for _, s in probes if s >= 400), wall)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50, help='Concurrent scanning clients')
+    parser.add_argument('--scans', type=int, default=200, help='Scans in total')
+    parser.add_argument('--off-delay', type=float, default=1.0, help='Seconds the OFF stub takes per lookup')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes per server')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gthread worker')
+    parser.add_argument('--modes', default='sync,gthread,asgi')
+    parser.add_argument('--size', default='10k', help='Household size of the seeded database')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    stub = off_stub.start(delay=args.off_delay)
+    off_url = f'http://127.0.0.1:{stub.server_address[1]}'
+    commands = {
+        'sync': gunicorn_command(args.workers),
+        'gthread': gunicorn_command(args.workers, args.threads),
+        'asgi': uvicorn_command(args.workers)
+    }
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'clients': args.clients,
+            'scans': args.scans,
+            'off_stub_delay_ms': args.off_delay * 1000,
+            'workers': args.workers,
+            'threads': args.threads
+        },
+        'runs': {}
+    }
+    for mode in args.modes.split(','):
+        workdir = prepare_workdir(args.size, parse_size(args.size), f'storm-{mode}', reseed=False)
+        print(f"Scan storm against {mode}...", file=sys.stderr)
+        with serve(commands[mode], workdir, off_url, mode) as (base_url, _):
+            report['runs'][mode] = storm(base_url, args.clients, args.scans)
+    stub.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
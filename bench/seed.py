@@ -0,0 +1,172 @@
+"""Seed a benchmark database with one synthetic household.
+
+    python -m bench.seed --products 10k --db bench/data/10k/seed.db
+
+Products come from a catalog of EAN-13 articles with German GS1 prefixes that
+are picked with a Zipf-like skew (households buy the same things again).
+Locations follow the category, expiry dates the category's shelf life.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Category: (article names, shelf life in days (min, max), location weights)
+CATEGORIES = {
+    'Milchprodukte': (('Vollmilch', 'Joghurt', 'Butter', 'Gouda', 'Quark', 'Sahne', 'Frischkäse'),
+                      (5, 30), {'Kühlschrank': 95, 'Keller': 5}),
+    'Obst & Gemüse': (('Äpfel', 'Bananen', 'Karotten', 'Tomaten', 'Paprika', 'Zwiebeln', 'Kartoffeln'),
+                      (3, 21), {'Kühlschrank': 50, 'Vorratsschrank': 30, 'Keller': 20}),
+    'Fleisch & Fisch': (('Hähnchenbrust', 'Hackfleisch', 'Lachs', 'Salami', 'Schinken'),
+                        (2, 10), {'Kühlschrank': 70, 'Gefrierschrank': 30}),
+    'Tiefkühl': (('Erbsen', 'Pizza', 'Spinat', 'Fischstäbchen', 'Beeren'),
+                 (90, 540), {'Gefrierschrank': 100}),
+    'Konserven': (('Tomaten gehackt', 'Kichererbsen', 'Mais', 'Thunfisch', 'Bohnen'),
+                  (365, 1100), {'Vorratsschrank': 70, 'Keller': 30}),
+    'Trockenware': (('Spaghetti', 'Reis', 'Mehl', 'Haferflocken', 'Linsen', 'Zucker'),
+                    (180, 730), {'Vorratsschrank': 85, 'Keller': 15}),
+    'Getränke': (('Mineralwasser', 'Apfelsaft', 'Orangensaft', 'Cola', 'Bier'),
+                 (90, 365), {'Keller': 60, 'Kühlschrank': 25, 'Vorratsschrank': 15}),
+    'Snacks': (('Schokolade', 'Chips', 'Kekse', 'Nüsse', 'Gummibärchen'),
+               (60, 300), {'Vorratsschrank': 90, '': 10}),
+    'Gewürze': (('Salz', 'Pfeffer', 'Paprikapulver', 'Oregano', 'Zimt'),
+                (365, 1500), {'Vorratsschrank': 100}),
+    'Drogerie': (('Zahnpasta', 'Duschgel', 'Shampoo', 'Spülmittel'),
+                 (0, 0), {'Bad': 80, '': 20}),
+}
+CATEGORY_WEIGHTS = {
+    'Milchprodukte': 16, 'Obst & Gemüse': 14, 'Fleisch & Fisch': 7, 'Tiefkühl': 9, 'Konserven': 10,
+    'Trockenware': 13, 'Getränke': 12, 'Snacks': 9, 'Gewürze': 5, 'Drogerie': 5
+}
+BRANDS = ('Ja!', 'Gut & Günstig', 'K-Classic', 'Alnatura', 'Milsani', 'Rewe Bio', 'Dr. Oetker', 'Barilla')
+SIZES = {'products': {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1m': 1_000_000}}
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1m' -> 1000000, '2500' -> 2500."""
+    text = str(text).strip().lower()
+    return SIZES['products'].get(text) or int(text.replace('_', ''))
+
+
+def ean13(rng):
+    """Random EAN-13 with a German GS1 prefix (400-440) and a valid check digit."""
+    digits = str(rng.randint(400, 440)) + ''.join(str(rng.randint(0, 9)) for _ in range(9))
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+def build_catalog(rng, size):
+    """Distinct articles: (ean, name, category, weight_volume, vegetarian, vegan)."""
+    catalog = []
+    seen = set()
+    categories = list(CATEGORY_WEIGHTS)
+    weights = list(CATEGORY_WEIGHTS.values())
+    while len(catalog) < size:
+        ean = ean13(rng)
+        if ean in seen:
+            continue
+        seen.add(ean)
+        category = rng.choices(categories, weights)[0]
+        article = rng.choice(CATEGORIES[category][0])
+        vegan = category in ('Obst & Gemüse', 'Konserven', 'Trockenware', 'Getränke', 'Gewürze')
+        vegetarian = vegan or category in ('Milchprodukte', 'Snacks', 'Tiefkühl')
+        catalog.append((ean, f'{article} {rng.choice(BRANDS)}', category,
+                        rng.choice(('250g', '500g', '1kg', '1L', '0,5L', '200ml', '6 Stück')),
+                        int(vegetarian), int(vegan)))
+    return catalog
+
+
+def generate_products(rng, count, catalog, today):
+    """Yield product rows in insertion order."""
+    zipf = [1 / (rank + 1) for rank in range(len(catalog))]
+    picks = rng.choices(range(len(catalog)), zipf, k=count)
+    for n, index in enumerate(picks):
+        ean, name, category, weight_volume, vegetarian, vegan = catalog[index]
+        if rng.random() < 0.08:
+            # Loose goods and leftovers carry no barcode
+            ean = ''
+        shelf_life, locations = CATEGORIES[category][1], CATEGORIES[category][2]
+        purchased = today - timedelta(days=int(rng.expovariate(1 / 45)))
+        if shelf_life[1] and rng.random() > 0.05:
+            expiry = (purchased + timedelta(days=rng.randint(*shelf_life))).isoformat()
+        else:
+            expiry = ''
+        location = rng.choices(list(locations), list(locations.values()))[0]
+        created = datetime.combine(purchased, datetime.min.time()) + timedelta(seconds=rng.randint(28800, 72000))
+        yield (
+            ean, name, expiry, purchased.isoformat(), location,
+            min(int(rng.expovariate(0.6)) + 1, 24), weight_volume,
+            'Angebot' if rng.random() < 0.03 else '',
+            vegetarian, vegan, round(rng.lognormvariate(0.6, 0.7), 2), '', category,
+            'bio' if 'Bio' in name or 'Alnatura' in name else '',
+            created.strftime('%Y-%m-%d %H:%M:%S')
+        )
+
+
+def seed(db_path, products, rng_seed=42):
+    """Create db_path with the current schema and the synthetic household."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as inventory
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+    rng = random.Random(rng_seed)
+    today = datetime.now().date()
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    inventory.upgrade_db(conn)
+
+    started = time.perf_counter()
+    catalog = build_catalog(rng, max(100, products // 5))
+    columns = ('ean', 'name', 'expiry_date', 'purchase_date', 'location', 'quantity', 'weight_volume', 'notes',
+               'is_vegetarian', 'is_vegan', 'price', 'image_url', 'category', 'tags', 'created_at')
+    insert_sql = f"INSERT INTO products ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    rows = generate_products(rng, products, catalog, today)
+    while True:
+        chunk = [row for _, row in zip(range(10_000), rows)]
+        if not chunk:
+            break
+        conn.executemany(insert_sql, chunk)
+        conn.commit()
+
+    # Every catalog article has been scanned at some point
+    conn.executemany('''
+        INSERT INTO barcode_history (ean, name, category, weight_volume, tags, is_vegetarian, is_vegan, scan_count, last_scanned)
+        VALUES (?, ?, ?, ?, NULL, ?, ?, 1, ?)
+    ''', [
+        (ean, name, category, weight_volume, vegetarian, vegan,
+         f'{today - timedelta(days=rng.randint(0, 365))} 12:00:00')
+        for ean, name, category, weight_volume, vegetarian, vegan in catalog
+    ])
+    conn.executemany(
+        'INSERT INTO shopping_list (name, quantity, category, checked) VALUES (?, ?, ?, ?)',
+        [(rng.choice(CATEGORIES[c][0]), rng.randint(1, 4), c, int(rng.random() < 0.3))
+         for c in rng.choices(list(CATEGORY_WEIGHTS), k=40)]
+    )
+    conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('ANALYZE')
+    conn.close()
+    return {'db': db_path, 'products': products, 'catalog': len(catalog),
+            'seconds': round(time.perf_counter() - started, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', default='10k', help='1k, 10k, 100k, 1m or a number')
+    parser.add_argument('--db', required=True, help='Database file to create (overwritten)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    print(seed(args.db, parse_size(args.products), args.seed))
+
+
+if __name__ == '__main__':
+    main()
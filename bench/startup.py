@@ -0,0 +1,149 @@
+"""Cold start and per-worker memory of the app, with and without gunicorn --preload.
+
+    python -m bench.startup --runs 15 --workers 4 --out startup.json
+
+Cold start runs `import app`, builds the application and serves a first
+request in fresh interpreters (median of --runs). The gunicorn part boots the
+app with --workers, times boot-to-ready, warms every worker with requests and
+then reads Rss/Pss/Private memory of each worker from /proc/<pid>/smaps_rollup.
+Memory figures are Linux only.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import off_stub
+from bench.run import HttpDriver, REPO, git_commit, gunicorn_command, prepare_workdir, serve
+from bench.seed import parse_size
+
+# Runs in a fresh interpreter inside the work directory
+COLD_START_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app as inventory
+imported = time.perf_counter()
+application = inventory.app
+created = time.perf_counter()
+response = application.test_client().get('/api/statistics')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'modules': len(sys.modules)
+}))
+'''
+# The scan goes to the OFF stub once per worker, then hits the cache
+WARM_ROUTES = ('/', '/api/products?limit=50', '/api/statistics', '/api/shopping-list', '/api/expiry',
+               '/api/search?q=milch', '/api/scan/4012345678901', '/api/system/db-pool')
+
+
+def cold_start(workdir, runs):
+    """Median timings of COLD_START_PROBE over runs fresh interpreters (process_ms includes interpreter start)."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_PROBE], cwd=workdir, capture_output=True, text=True, check=True,
+            env={**os.environ, 'PYTHONPATH': REPO, 'PYTHONDONTWRITEBYTECODE': '1'}
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    return {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+
+def child_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+def memory_kb(pid):
+    """Rss, Pss and private (clean + dirty) memory of a process in kB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'private': fields['Private_Clean'] + fields['Private_Dirty']}
+
+def gunicorn_memory(workdir, off_url, workers, threads, preload, warm_requests):
+    """Boot gunicorn, warm all workers and report boot time and per-worker memory."""
+    command = gunicorn_command(workers, threads)
+    if preload:
+        command.insert(-1, '--preload')
+    started = time.perf_counter()
+    with serve(command, workdir, off_url, 'gunicorn-preload' if preload else 'gunicorn') as (base_url, server):
+        ready_ms = (time.perf_counter() - started) * 1000
+        driver = HttpDriver(base_url)
+        paths = [WARM_ROUTES[n % len(WARM_ROUTES)] for n in range(warm_requests)]
+        with ThreadPoolExecutor(max_workers=workers * 2) as executor:
+            # A new connection per request, so every worker gets its share
+            statuses = list(executor.map(
+                lambda path: driver.request('GET', path, headers={'Connection': 'close'})[0], paths))
+        per_worker = [memory_kb(pid) for pid in child_pids(server.pid)]
+        master = memory_kb(server.pid)
+    totals = {key: sum(worker[key] for worker in per_worker) for key in ('rss', 'pss', 'private')}
+    return {
+        'preload': preload,
+        'ready_ms': round(ready_ms),
+        'warm_errors': sum(1 for status in statuses if status >= 400),
+        'master_kb': master,
+        'workers_kb': per_worker,
+        'workers_total_mb': {key: round(value / 1024, 1) for key, value in totals.items()},
+        'pss_total_mb': round((totals['pss'] + master['pss']) / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='1k', help='Household size of the work directory')
+    parser.add_argument('--runs', type=int, default=15, help='Fresh interpreters for the cold start median')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--warm-requests', type=int, default=400, help='Requests spread over the workers')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    label = args.size.strip().lower()
+    workdir = prepare_workdir(label, parse_size(label), 'startup', False)
+    stub = off_stub.start()
+    off_url = f'http://127.0.0.1:{stub.server_address[1]}'
+    print("Measuring cold start...", file=sys.stderr)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'size': label,
+            'workers': args.workers,
+            'threads': args.threads
+        },
+        'cold_start_ms': cold_start(workdir, args.runs),
+        'gunicorn': []
+    }
+    for preload in (False, True):
+        print(f"Measuring gunicorn -w {args.workers}{' --preload' if preload else ''}...", file=sys.stderr)
+        report['gunicorn'].append(gunicorn_memory(workdir, off_url, args.workers, args.threads, preload,
+                                                  args.warm_requests))
+    stub.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+        print(f"Report written to {args.out}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
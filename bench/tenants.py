@@ -0,0 +1,98 @@
+"""Write throughput with one database per household, against one shared database.
+
+    python -m bench.tenants --tenants 1,2,4,8,16 --clients 32 --writes 2000
+
+Every run starts gunicorn on empty databases in a fresh work directory. The
+clients POST /api/products; with tenancy client n writes to household
+n % tenants (X-Household header), the baseline writes everything to one
+inventory.db. Reports writes/s and latency percentiles per run as JSON.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import off_stub
+from bench.run import DATA_DIR, LOCATIONS, HttpDriver, git_commit, gunicorn_command, serve, summarize
+
+
+def fresh_workdir(label):
+    workdir = os.path.join(DATA_DIR, 'tenants', f'run-{label}')
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    return workdir
+
+def write_storm(base_url, tenants, clients, writes):
+    """POST writes products from concurrent clients, spread round-robin over the households."""
+    driver = HttpDriver(base_url)
+    counter = itertools.count()
+
+    def write(_):
+        n = next(counter)
+        headers = {'X-Household': f'household-{n % tenants}'} if tenants else None
+        product = {'name': f'Bench {n}', 'quantity': 1 + n % 5, 'location': LOCATIONS[n % len(LOCATIONS)],
+                   'expiry_date': f'2030-{1 + n % 12:02d}-{1 + n % 28:02d}', 'price': 1.99}
+        started = time.perf_counter()
+        status, _, _ = driver.request('POST', '/api/products', json=product, headers=headers)
+        return time.perf_counter() - started, status
+
+    # Open every household once, so first-use migrations are not part of the timing
+    for tenant in range(tenants):
+        driver.request('GET', '/api/statistics', headers={'X-Household': f'household-{tenant}'})
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        outcomes = list(executor.map(write, range(writes)))
+    wall = time.perf_counter() - started
+    return summarize([d for d, _ in outcomes], sum(1 for _, s in outcomes if s >= 400), wall)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', default='1,2,4,8,16', help='Household counts to run with tenancy')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent writing clients')
+    parser.add_argument('--writes', type=int, default=2000, help='Products written per run')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    stub = off_stub.start()
+    off_url = f'http://127.0.0.1:{stub.server_address[1]}'
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'clients': args.clients,
+            'writes': args.writes,
+            'workers': args.workers,
+            'threads': args.threads
+        },
+        'runs': {}
+    }
+    # 0 households: the single shared database without tenancy
+    for tenants in [0] + [int(n) for n in args.tenants.split(',')]:
+        label = f'{tenants}-households' if tenants else 'single-db'
+        env = {'INVENTORY_TENANCY': 'true'} if tenants else None
+        workdir = fresh_workdir(label)
+        print(f"Write storm against {label}...", file=sys.stderr)
+        with serve(gunicorn_command(args.workers, args.threads), workdir, off_url, label, env) as (base_url, _):
+            report['runs'][label] = write_storm(base_url, tenants, args.clients, args.writes)
+    stub.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+        print(f"Report written to {args.out}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
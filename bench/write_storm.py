@@ -0,0 +1,132 @@
+"""Concurrent writes with and without the single-writer queue (WRITE_QUEUE).
+
+    python -m bench.write_storm --clients 200 --writes 4000
+
+Each run starts gunicorn (gthread, one thread per client by default) on an
+empty database. The clients mix product adds, quantity increments through
+POST /api/products/batch and shopping list adds. Reports writes/s, commits/s
+(one per write without the queue, from the writer counters with it) and
+latency percentiles as JSON.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import off_stub
+from bench.run import DATA_DIR, LOCATIONS, HttpDriver, git_commit, gunicorn_command, percentile, serve, summarize
+
+# Products the increments are spread over
+HOT_PRODUCTS = 50
+
+
+def fresh_workdir(label):
+    workdir = os.path.join(DATA_DIR, 'write-storm', f'run-{label}')
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    return workdir
+
+def writer_commits(driver, workers):
+    """Sum the writer commits of all workers (polled on fresh connections until every worker answered)."""
+    seen = {}
+    for _ in range(workers * 20):
+        _, body, _ = driver.request('GET', '/api/system/db-pool', headers={'Connection': 'close'})
+        stats = json.loads(body)
+        seen[stats['pid']] = (stats['writer'] or {}).get('commits', 0)
+        if len(seen) == workers:
+            break
+    return sum(seen.values())
+
+def write_storm(base_url, clients, writes):
+    driver = HttpDriver(base_url)
+    for n in range(HOT_PRODUCTS):
+        driver.request('POST', '/api/products', json={'name': f'Vorrat {n}', 'quantity': 100})
+    counter = itertools.count()
+
+    def write(_):
+        n = next(counter)
+        kind = n % 3
+        if kind == 0:
+            request = ('POST', '/api/products', {'name': f'Bench {n}', 'quantity': 1 + n % 5,
+                                                 'location': LOCATIONS[n % len(LOCATIONS)], 'price': 1.99})
+        elif kind == 1:
+            delta = 1 if n % 2 else -1
+            request = ('POST', '/api/products/batch',
+                       {'quantity_delta': [{'id': 1 + n % HOT_PRODUCTS, 'delta': delta}]})
+        else:
+            request = ('POST', '/api/shopping-list', {'name': f'Einkauf {n}'})
+        started = time.perf_counter()
+        status, _, _ = driver.request(*request[:2], json=request[2])
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        outcomes = list(executor.map(write, range(writes)))
+    wall = time.perf_counter() - started
+    latencies = sorted(d for d, _ in outcomes)
+    summary = summarize(latencies, sum(1 for _, s in outcomes if s >= 400), wall)
+    summary['p999_ms'] = round(percentile(latencies, 99.9) * 1000, 3)
+    summary['max_ms'] = round(latencies[-1] * 1000, 3)
+    summary['wall_s'] = round(wall, 2)
+    return summary, driver
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=200, help='Concurrent writing clients')
+    parser.add_argument('--writes', type=int, default=4000, help='Writes per run')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=None, help='Threads per worker (default: clients / workers)')
+    parser.add_argument('--batch', type=int, default=64, help='WRITE_QUEUE_BATCH')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    threads = args.threads or max(1, args.clients // args.workers)
+
+    stub = off_stub.start()
+    off_url = f'http://127.0.0.1:{stub.server_address[1]}'
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'clients': args.clients,
+            'writes': args.writes,
+            'workers': args.workers,
+            'threads': threads,
+            'write_queue_batch': args.batch
+        },
+        'runs': {}
+    }
+    for label, queued in (('direct', False), ('write-queue', True)):
+        env = {'INVENTORY_WRITE_QUEUE': 'true', 'INVENTORY_WRITE_QUEUE_BATCH': str(args.batch)} if queued else None
+        workdir = fresh_workdir(label)
+        print(f"Write storm with {label} commits...", file=sys.stderr)
+        command = gunicorn_command(args.workers, threads)
+        # Queued clients must not find their keep-alive connection closed (gunicorn's default is 2s)
+        command[-1:-1] = ['--keep-alive', '60']
+        with serve(command, workdir, off_url, label, env) as (base_url, _):
+            summary, driver = write_storm(base_url, args.clients, args.writes)
+            ok = summary['requests'] - summary['errors']
+            commits = writer_commits(driver, args.workers) if queued else ok
+            summary['commits'] = commits
+            summary['commits_per_s'] = round(commits / summary['wall_s'], 1)
+            summary['writes_per_commit'] = round(ok / commits, 2) if commits else None
+            report['runs'][label] = summary
+    stub.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+        print(f"Report written to {args.out}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""WSGI entry point for benchmarking under gunicorn.
+
+Run from the benchmark work directory (it holds inventory.db and the uploads)
+with the repository on the Python path; OFF_BASE_URL points at the stub.
+"""
+import os
+
+from app import create_app, startup
+
+app = startup(create_app({'OFF_BASE_URL': os.environ['OFF_BASE_URL']} if os.environ.get('OFF_BASE_URL') else None))
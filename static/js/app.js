@@ -15,6 +15,8 @@ createApp({
         return {
             products: [],
             loading: true,
+            syncSeq: null, // Change log position of this.products (delta sync)
+            eventSource: null,
 
             // Filters
             searchQuery: '',
@@ -187,9 +189,15 @@ createApp({
         if (this.cameraStream) {
             this.stopCamera();
         }
+        if (this.eventSource) {
+            this.eventSource.close();
+        }
+        document.removeEventListener('visibilitychange', this.onVisibilityChange);
     },
     mounted() {
         this.fetchProducts();
+        this.connectEvents();
+        document.addEventListener('visibilitychange', this.onVisibilityChange);
         this.checkNotificationPermission();
         this.startExpiryAlerts();
     },
@@ -210,9 +218,16 @@ createApp({
         async fetchProducts() {
             this.loading = true;
             try {
-                const response = await fetch('/api/products');
-                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-                this.products = await response.json();
+                if (this.syncSeq === null || !(await this.syncProducts())) {
+                    // Remember the log position first so changes during the full load are replayed
+                    const position = await fetch('/api/changes');
+                    if (!position.ok) throw new Error(`HTTP error! status: ${position.status}`);
+                    const seq = (await position.json()).next;
+                    const response = await fetch('/api/products');
+                    if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+                    this.products = await response.json();
+                    this.syncSeq = seq;
+                }
             } catch (error) {
                 console.error('Fetch error:', error);
                 this.showToast('Fehler beim Laden der Produkte', 'error');
@@ -220,6 +235,66 @@ createApp({
                 this.loading = false;
             }
         },
+        async syncProducts() {
+            // Apply only changed and deleted products; false means a full reload is needed
+            let hasMore = true;
+            while (hasMore) {
+                const response = await fetch(`/api/changes?since=${this.syncSeq}`);
+                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+                const data = await response.json();
+                if (data.reset) return false;
+
+                const changes = data.changes.products;
+                if (changes) {
+                    const gone = new Set(changes.deleted);
+                    const updated = new Map(changes.upserted.map(p => [p.id, p]));
+                    const products = this.products
+                        .filter(p => !gone.has(p.id))
+                        .map(p => {
+                            const fresh = updated.get(p.id);
+                            updated.delete(p.id);
+                            return fresh || p;
+                        });
+                    this.products = products.concat([...updated.values()]);
+                }
+                this.syncSeq = data.next;
+                hasMore = data.has_more;
+            }
+            return true;
+        },
+        connectEvents() {
+            // Server pushes a notice per commit; the browser reconnects with Last-Event-ID
+            if (!window.EventSource || document.hidden) return;
+            // Resume from the synced position, so changes made while hidden arrive as one event
+            this.eventSource = new EventSource(this.syncSeq === null ? '/api/events' : `/api/events?since=${this.syncSeq}`);
+            this.eventSource.addEventListener('change', async (event) => {
+                const tables = JSON.parse(event.data).tables;
+                try {
+                    if (tables.products) {
+                        if (this.syncSeq === null || !(await this.syncProducts())) {
+                            this.syncSeq = null;
+                            await this.fetchProducts();
+                        }
+                        if (this.showStatistics) this.fetchStatistics();
+                    }
+                    if (tables.shopping_list && this.showShoppingList) this.fetchShoppingList();
+                    if (tables.barcode_history && this.showBarcodeHistory) this.fetchBarcodeHistory();
+                } catch (error) {
+                    console.error('Sync error:', error);
+                }
+            });
+        },
+        onVisibilityChange() {
+            // A hidden tab gives its stream (a server thread under WSGI) back
+            if (document.hidden) {
+                if (this.eventSource) {
+                    this.eventSource.close();
+                    this.eventSource = null;
+                }
+            } else if (!this.eventSource) {
+                this.connectEvents();
+            }
+        },
         async saveProduct() {
             // Check for duplicates first
             if (!this.isEditing && (this.form.ean || this.form.name)) {
@@ -446,7 +521,7 @@ createApp({
                     return;
                 }
 
-                this.form.image_url = compressedBase64;
+                this.form.image_url = await this.uploadImage(compressedBase64);
                 this.showToast('Bild hochgeladen', 'success');
             } catch (error) {
                 console.error('Image upload error:', error);
@@ -489,6 +564,32 @@ createApp({
                 reader.onerror = reject;
             });
         },
+        async uploadImage(dataUrl) {
+            // Upload as binary multipart; falls back to the data URL, which the API also accepts
+            try {
+                const blob = await (await fetch(dataUrl)).blob();
+                const formData = new FormData();
+                formData.append('image', blob, 'image.jpg');
+                const response = await fetch('/api/images', { method: 'POST', body: formData });
+                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+                const data = await response.json();
+                return data.image_url;
+            } catch (error) {
+                console.error('Image upload error:', error);
+                return dataUrl;
+            }
+        },
+        thumbnailUrl(product) {
+            // Content-addressed uploads have a downscaled JPEG under thumbs/
+            const match = /^\/static\/uploads\/([0-9a-f]{64})\.\w+$/.exec(product.image_url || '');
+            return match ? `/static/uploads/thumbs/${match[1]}.jpg` : product.image_url;
+        },
+        useFullImage(event, product) {
+            // Thumbnail not rendered (yet) - show the original image
+            if (!event.target.src.endsWith(product.image_url)) {
+                event.target.src = product.image_url;
+            }
+        },
         removeImage() {
             this.form.image_url = '';
         },
@@ -556,7 +657,7 @@ createApp({
                     return;
                 }
                 
-                this.form.image_url = compressedBase64;
+                this.form.image_url = await this.uploadImage(compressedBase64);
                 this.stopCamera();
                 this.showToast('Foto aufgenommen', 'success');
             } catch (error) {
@@ -725,14 +826,20 @@ createApp({
 
         // --- Quick Actions ---
         async quickIncrement(product) {
-            product.quantity += 1;
             try {
-                await fetch(`/api/products/${product.id}`, {
-                    method: 'PUT',
+                const response = await fetch('/api/products/batch', {
+                    method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(product)
+                    body: JSON.stringify({ quantity_delta: [{ id: product.id, delta: 1 }] })
                 });
-                this.fetchProducts();
+                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+                const data = await response.json();
+                const result = data.results.quantity_delta[0];
+                if (result.status === 'ok') {
+                    product.quantity = result.quantity;
+                } else {
+                    this.showToast(result.error, 'error');
+                }
             } catch (error) {
                 console.error('Quick increment error:', error);
             }
@@ -758,13 +865,19 @@ createApp({
         },
         startExpiryAlerts() {
             // Check every hour for expiring products
-            setInterval(() => {
+            setInterval(async () => {
                 if (!this.notificationsEnabled) return;
                 
-                const expiringProducts = this.products.filter(p => {
-                    const days = this.getDaysUntilExpiry(p.expiry_date);
-                    return days >= 0 && days <= 3; // Within 3 days
-                });
+                // Buckets are precomputed on the server (0-3 days left)
+                let expiringProducts;
+                try {
+                    const response = await fetch('/api/expiry');
+                    if (!response.ok) return;
+                    expiringProducts = (await response.json()).days_3;
+                } catch (error) {
+                    console.error('Expiry check error:', error);
+                    return;
+                }
                 
                 if (expiringProducts.length > 0) {
                     new Notification('NexoSync - Produkte laufen ab!', {
@@ -0,0 +1,137 @@
+"""Query plans of the hot routes: none may read a whole growing table without an index.
+
+The routes run against a seeded database with every statement traced, then
+each traced statement is explained on its own. This covers the SQL the
+routes really execute, including the dynamically built listing queries.
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as inventory  # noqa: E402
+from bench.seed import seed  # noqa: E402
+
+PRODUCTS = 3000
+KNOWN_EAN = '4025127020997'
+
+# (method, path, JSON body); full listings and exports read everything by design and are not here
+HOT_REQUESTS = (
+    ('GET', '/api/products?limit=50', None),
+    ('GET', '/api/products?sort=expiry_desc&limit=50', None),
+    ('GET', '/api/products?sort=name&limit=50', None),
+    ('GET', '/api/products?sort=location&limit=50', None),
+    ('GET', '/api/products?sort=created&limit=50', None),
+    ('GET', '/api/products?location=K%C3%BChlschrank&limit=50', None),
+    ('GET', '/api/products?category=Milchprodukte&sort=name&limit=50', None),
+    ('GET', '/api/products?expiry_from=2020-01-01&expiry_to=2030-12-31&location=K%C3%BChlschrank', None),
+    ('GET', '/api/products?search=milch&limit=50', None),
+    ('GET', '/api/statistics', None),
+    ('GET', '/api/statistics/advanced', None),
+    ('GET', '/api/expiry', None),
+    ('GET', '/api/search?q=milch', None),
+    ('GET', '/api/barcode-history?limit=20', None),
+    ('GET', '/api/changes?since=0&limit=100', None),
+    ('POST', '/api/products/check-duplicate', {'ean': KNOWN_EAN}),
+    ('POST', '/api/products/check-duplicate', {'name': 'Milch'}),
+    ('POST', '/api/shopping-list/generate', {}),
+    ('POST', '/api/scan/batch', {'eans': [KNOWN_EAN]}),
+)
+
+
+@pytest.fixture(params=['fresh', 'analyzed'])
+def seeded_app(request, tmp_path, monkeypatch):
+    """App on a seeded database (with or without ANALYZE statistics) and the list its statements go to."""
+    database = str(tmp_path / 'inventory.db')
+    seed(database, PRODUCTS)
+    conn = sqlite3.connect(database)
+    conn.execute("INSERT INTO barcode_history (ean, name, scan_count) VALUES (?, 'Milch', 1)", (KNOWN_EAN,))
+    if request.param == 'fresh':
+        # Databases in the field are never analyzed
+        conn.execute('DELETE FROM sqlite_stat1')
+    conn.commit()
+    conn.close()
+
+    statements = []
+    connect = inventory.ConnectionPool._connect
+
+    def traced_connect(pool):
+        conn = connect(pool)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(inventory.ConnectionPool, '_connect', traced_connect)
+    monkeypatch.chdir(tmp_path)
+    app = inventory.startup(inventory.create_app({
+        'DATABASE': database,
+        'UPLOADS_DIR': str(tmp_path / 'uploads'),
+        'EXPIRY_SCHEDULER': False,
+        'TENANCY': False,
+        'WRITE_QUEUE': False,
+    }))
+    return app, database, statements
+
+
+def explained(database, statements):
+    """(statement, plan lines) for every traced query, trigger bodies and transaction control left out."""
+    conn = sqlite3.connect(database)
+    try:
+        result = []
+        for sql in dict.fromkeys(statements):
+            verb = sql.lstrip().split(None, 1)[0].upper()
+            if verb not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+                continue
+            result.append((sql, [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]))
+        return result
+    finally:
+        conn.close()
+
+
+def test_hot_routes_use_indexes(seeded_app):
+    app, database, statements = seeded_app
+    client = app.test_client()
+    del statements[:]
+    for method, path, body in HOT_REQUESTS:
+        with client.open(path, method=method, json=body) as response:
+            assert response.status_code == 200, (path, response.get_data()[:200])
+
+    plans = explained(database, statements)
+    assert len(plans) >= len(HOT_REQUESTS)
+    offenders = [(sql.strip(), scans) for sql, plan in plans if (scans := inventory.full_scans(sql, plan))]
+    assert not offenders, '\n\n'.join(f'{sql}\n  -> {scans}' for sql, scans in offenders)
+
+
+def test_listing_page_queries_use_indexes(seeded_app):
+    """The second page of every sort, and the rows without a sort value, also stay on an index."""
+    app, database, statements = seeded_app
+    client = app.test_client()
+    del statements[:]
+    for sort in inventory.PRODUCT_SORTS:
+        page = client.get(f'/api/products?sort={sort}&limit=500').json
+        while page['next_cursor']:
+            page = client.get(f"/api/products?sort={sort}&limit=500&cursor={page['next_cursor']}").json
+
+    offenders = [(sql.strip(), scans) for sql, plan in explained(database, statements)
+                 if (scans := inventory.full_scans(sql, plan))]
+    assert not offenders, '\n\n'.join(f'{sql}\n  -> {scans}' for sql, scans in offenders)
+
+
+def test_explain_queries_command_passes(seeded_app):
+    app, database, _ = seeded_app
+    result = app.test_cli_runner().invoke(args=['explain-queries'])
+    assert result.exit_code == 0, result.output
+    assert 'FULL SCAN' not in result.output
+
+
+def test_full_scans_resolves_aliases():
+    sql = 'SELECT * FROM expiry_buckets b JOIN products p ON p.id = b.product_id'
+    assert inventory.full_scans(sql, ['SCAN b', 'SEARCH p USING INTEGER PRIMARY KEY (rowid=?)']) == []
+    assert inventory.full_scans(sql, ['SCAN p', 'SEARCH b USING INTEGER PRIMARY KEY (rowid=?)']) == ['SCAN p']
+    assert inventory.full_scans('SELECT * FROM products', ['SCAN products USING INDEX idx_name']) == []
+    # An ordered scan ends at the LIMIT, unless the rows first go through a temporary B-tree
+    assert inventory.full_scans('SELECT * FROM products ORDER BY id LIMIT 5', ['SCAN products']) == []
+    assert inventory.full_scans('SELECT * FROM products ORDER BY name LIMIT 5',
+                                ['SCAN products', 'USE TEMP B-TREE FOR ORDER BY']) == ['SCAN products']
@@ -0,0 +1,73 @@
+"""The trigger-maintained statistics match the GROUP BY queries they replaced."""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as inventory  # noqa: E402
+
+# GET /api/statistics before the summary tables
+BY_LOCATION_SQL = 'SELECT location, COUNT(*), SUM(quantity) FROM products GROUP BY location'
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = inventory.startup(inventory.create_app({
+        'DATABASE': str(tmp_path / 'inventory.db'),
+        'UPLOADS_DIR': str(tmp_path / 'uploads'),
+        'EXPIRY_SCHEDULER': False,
+        'TENANCY': False,
+        'WRITE_QUEUE': False,
+    }))
+    return app.test_client(), str(tmp_path / 'inventory.db')
+
+
+def grouped(database):
+    conn = sqlite3.connect(database)
+    try:
+        return [{'location': row[0], 'products': row[1], 'items': row[2]} for row in conn.execute(BY_LOCATION_SQL)]
+    finally:
+        conn.close()
+
+
+def test_null_and_empty_locations_stay_apart(client):
+    client, database = client
+    conn = sqlite3.connect(database)
+    conn.executemany('INSERT INTO products (name, location, quantity) VALUES (?, ?, ?)',
+                     [('A', None, 1), ('B', '', 2), ('C', 'Keller', 3), ('D', None, 4), ('E', '', 5)])
+    # Moves between NULL and '' go through the update trigger
+    conn.execute("UPDATE products SET location = '' WHERE name = 'D'")
+    conn.execute("UPDATE products SET location = NULL WHERE name = 'C'")
+    conn.execute("DELETE FROM products WHERE name = 'A'")
+    conn.commit()
+    conn.close()
+
+    stats = client.get('/api/statistics').json
+    assert stats['by_location'] == grouped(database)
+    assert [row['location'] for row in stats['by_location']] == [None, '']
+
+
+def test_migration_splits_merged_groups(client):
+    client, database = client
+    conn = sqlite3.connect(database)
+    conn.executemany('INSERT INTO products (name, location) VALUES (?, ?)', [('A', None), ('B', ''), ('C', 'Keller')])
+    # Rebuild the tables as they were before migration 11, with NULL stored under ''
+    for table, column in inventory.STATS_TABLES.items():
+        for event in ('ai', 'ad', 'au'):
+            conn.execute(f'DROP TRIGGER {table}_{event}')
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'''CREATE TABLE {table} ({column} TEXT PRIMARY KEY NOT NULL, products INTEGER NOT NULL DEFAULT 0,
+                         items INTEGER NOT NULL DEFAULT 0, value REAL NOT NULL DEFAULT 0,
+                         priced_products INTEGER NOT NULL DEFAULT 0, priced_total REAL NOT NULL DEFAULT 0)''')
+        conn.execute(f'''INSERT INTO {table} ({column}, products, items)
+                         SELECT IFNULL({column}, ''), COUNT(*), SUM(quantity) FROM products GROUP BY IFNULL({column}, '')''')
+    conn.execute('PRAGMA user_version = 10')
+    conn.commit()
+    inventory.upgrade_db(conn)
+    conn.close()
+
+    assert client.get('/api/statistics').json['by_location'] == grouped(database)
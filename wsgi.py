@@ -0,0 +1,10 @@
+"""WSGI entry point: creates the app and runs the one-time startup, migrations included.
+
+    gunicorn --preload -w 4 -k gthread --threads 8 -b 0.0.0.0:5000 wsgi:app
+
+Configuration comes from INVENTORY_* environment variables, e.g.
+INVENTORY_DATABASE=/srv/inventar/inventory.db (see DefaultConfig in app.py).
+"""
+from app import create_app, startup
+
+app = startup(create_app())